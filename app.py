@@ -2,30 +2,32 @@ from flask import Flask, request, jsonify, abort
 import requests
 import json
 import os
+import atexit
+import math
+import time
 import pytz
 import logging
 import googlecalendar
 import google
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from collections import deque
 import time_utils
 import re
 from time_utils import normalize_time_format, format_time_for_display
 import weekly_promotions
 import message_templates
-import intent_triggers
-from apscheduler.schedulers.background import BackgroundScheduler
-from appointment_reminders import check_and_send_reminders, cleanup_old_reminders
-
-# Initialize scheduler
-scheduler = BackgroundScheduler()
-scheduler.add_job(check_and_send_reminders, 'interval', minutes=1)
-scheduler.add_job(cleanup_old_reminders, 'interval', hours=24)
-scheduler.start()
-
-# Shut down the scheduler when exiting the app
-import atexit
-atexit.register(lambda: scheduler.shutdown())
+import http_client
+import gemini_context
+import response_cache
+import service_catalogue
+import webhook_events
+import message_dedup
+from message_features import MessageFeatures
+from reply_pipeline import ReplyPipeline, RetryLater
+import state_store
+import rate_limiter
+import scheduler_jobs
 
 
 # Configure logging
@@ -54,19 +56,18 @@ logger.info(f"Verify Token configured: {bool(VERIFY_TOKEN)}")
 
 # --- API URLs ---
 WHATSAPP_API_URL = f"https://graph.facebook.com/v22.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_API_URL = f"{gemini_context.GEMINI_API_BASE}/models/{gemini_context.GEMINI_MODEL}:generateContent"
+GEMINI_STREAM_URL = f"{gemini_context.GEMINI_API_BASE}/models/{gemini_context.GEMINI_MODEL}:streamGenerateContent?alt=sse"
 
 # --- Meow Aesthetic Clinic Bot Context ---
-MEOWKIES_CONTEXT = """
+MEOWKIES_CONTEXT = f"""
 You are Meowkies, the official customer support assistant for Meow Aesthetic Clinic, a medical aesthetic clinic founded by Dr. Meow. You operate as a WhatsApp chatbot, communicating with customers through WhatsApp messages.
 
 Key information about Meow Aesthetic Clinic:
-- Located at Woods Square Tower 1, #05-62 S737715
-- Contact number: 87713358
+- Located at {service_catalogue.CLINIC_ADDRESS}
+- Contact number: {service_catalogue.CLINIC_PHONE}
 - Operating hours:
-  * Monday to Friday: 11am - 8pm
-  * Saturday: 11am - 10pm
-  * Sunday and Public Holidays: Closed
+{service_catalogue.render_business_hours(bullet="  *")}
 - Founded by Dr. Meow, who earned his medical degree from the National University of Singapore
 - Dr. Meow has over a decade of experience specializing in aesthetic medicine
 - The clinic provides individualized and customized medical solutions for aesthetic concerns
@@ -92,49 +93,7 @@ Appointment Booking Information:
 
 When users ask about pricing, services costs, or our price list, respond with the following information in a properly formatted manner, optimised for whatsapp:
 
-*IPL Services*
-- IPL upper/lower lip with whitening mask (Male): $78
-- IPL upper lip with whitening mask (Female): $58
-- IPL for two full hands (Female): $188
-- IPL for two half hands (Female): $128
-- IPL for two full legs (Female): $258
-- IPL for two half legs (Female): $158
-- IPL for two full hands (Male): $288
-- IPL for two half hands (Male): $188
-- IPL for two full legs (Male): $288
-- IPL for two half legs (Male): $158
-- Hand Spa: $38
-- Foot Spa: $58
-- Hand and foot whitening mask: $38
-
-*Facial Treatments*
-- Hydrafacial with Serum: $88
-- Bojin Meridian facial: $78
-- Deep cleansing facial: $78
-- Deep Aqua cleansing treatment: $78
-- Hydration treatment: $68
-- Gua Sha treatment: $78
-- Vitamin C whitening treatment: $78
-- 24k Gold Anti-aging treatment: $108
-- Blackhead facial: $68
-- Acne treatment: $78
-- Eye treatment: $48
-- Eye Gua Sha: $58
-- IPL first trial: $30 to $60
-
-*Lashes & Touchup*
-- Lash lift + Tint/1D Classic: $38-68
-- 2D Souffle/YY Lashes: $48-78
-- 3D Lightweight/Wetlook Lashes: $48-88
-- Foxy/Mermaid/Fairy Lashes: $58-98
-- Sunflower/Thai/Comic Lashes: $58-108
-- Wispy Kim K/Wispy YY Lashes: $58-108
-- 4D-6D Super Volume Lashes: $58-118
-- 8D-Mega Volume Lashes: $68-128
-- Lower Lashes: $28
-- Removal only: $18
-
-*Note: Prices may vary depending on specific requirements. Please visit our clinic for a personalized consultation._
+{service_catalogue.render_price_sections()}
 
 
 
@@ -168,35 +127,57 @@ Since you operate on WhatsApp, use WhatsApp formatting when appropriate:
 
 """
 
-# --- In-memory conversation storage ---
-conversations = {}
+# Sent as systemInstruction, or through a cachedContents handle when caching is available
+gemini_context_cache = gemini_context.GeminiContextCache(
+    MEOWKIES_CONTEXT + "\n\nPlease respond as Meowkies based on the following conversation."
+)
+
+# --- Conversation state storage ---
+# Backend chosen by STATE_STORE_BACKEND (memory, sqlite or redis)
+conversation_store = state_store.create_state_store()
 
-# Define how long conversations should be kept in memory (in hours)
+# Define how long conversations should be kept (in hours)
 CONVERSATION_TIMEOUT = 24  # hours
+conversations = state_store.StoreMapping(conversation_store, "conversations", ttl=CONVERSATION_TIMEOUT * 3600)
 
 # --- Rate limiting settings ---
 RATE_LIMIT_WINDOW = 30  # seconds
 MAX_MESSAGES_PER_WINDOW = 8
-rate_limits = {}  # Structure: { "customer_number": [datetime1, datetime2, ...] }
+customer_rate_limiter = rate_limiter.GCRA(MAX_MESSAGES_PER_WINDOW, burst=MAX_MESSAGES_PER_WINDOW, period=RATE_LIMIT_WINDOW)
+# Keys expire once fully recovered, so quiet numbers do not accumulate
+rate_limits = state_store.StoreMapping(conversation_store, "rate_limits", ttl=RATE_LIMIT_WINDOW)  # Structure: { "customer_number": theoretical arrival time (epoch seconds) }
+
+# Global cap on inbound webhook messages per process
+INBOUND_RATE_LIMIT = float(os.getenv("INBOUND_RATE_LIMIT", "50"))  # messages per second
+INBOUND_RATE_BURST = int(os.getenv("INBOUND_RATE_BURST", "200"))
+inbound_rate_limiter = rate_limiter.GCRA(INBOUND_RATE_LIMIT, burst=INBOUND_RATE_BURST)
 
 def check_rate_limit(customer_number):
-    """Returns True if within allowed rate limit; otherwise, False."""
-    current_time = datetime.now()
-    # Initialize list if not exists
-    if customer_number not in rate_limits:
-        rate_limits[customer_number] = []
-    # Remove timestamps older than the window
-    rate_limits[customer_number] = [
-        timestamp for timestamp in rate_limits[customer_number]
-        if (current_time - timestamp).total_seconds() <= RATE_LIMIT_WINDOW
-    ]
-    if len(rate_limits[customer_number]) >= MAX_MESSAGES_PER_WINDOW:
-        return False
-    # Log this message timestamp
-    rate_limits[customer_number].append(current_time)
-    return True
+    """
+    Check a customer's inbound message rate
+    
+    Returns:
+        tuple: (allowed, retry_after) where retry_after is the seconds until the
+               next message would be accepted
+    """
+    tat = rate_limits.get(customer_number)
+    if not isinstance(tat, (int, float)):
+        tat = None  # No recent messages, or a timestamp list stored by an older release
+    allowed, new_tat, retry_after = customer_rate_limiter.update(tat, time.time())
+    if allowed:
+        rate_limits[customer_number] = new_tat
+    return allowed, retry_after
 
 # --- Conversation management functions ---
+# Each customer's history is a ring buffer, older turns fall off the end
+CONVERSATION_HISTORY_SIZE = int(os.getenv("CONVERSATION_HISTORY_SIZE", "40"))  # messages kept per customer
+# Gemini gets the most recent turns that fit this budget (estimated at ~4 characters per token)
+GEMINI_HISTORY_TOKEN_BUDGET = int(os.getenv("GEMINI_HISTORY_TOKEN_BUDGET", "2000"))
+
+def estimate_tokens(text):
+    """Rough token count for budgeting prompt size"""
+    return len(text) // 4 + 1
+
 def add_message_to_conversation(customer_number, role, content):
     """Add a message to the conversation history for a given customer"""
     current_time = datetime.now()
@@ -204,32 +185,46 @@ def add_message_to_conversation(customer_number, role, content):
     # Create new conversation entry if needed
     if customer_number not in conversations:
         conversations[customer_number] = {
-            "history": [],
+            "history": deque(maxlen=CONVERSATION_HISTORY_SIZE),
             "last_updated": current_time
         }
-    
-    # Update existing conversation
-    conversations[customer_number]["history"].append({
+    conversation = conversations[customer_number]
+    history = conversation["history"]
+    if not isinstance(history, deque) or history.maxlen != CONVERSATION_HISTORY_SIZE:
+        # Stored by an older release or with a different capacity
+        history = conversation["history"] = deque(history, maxlen=CONVERSATION_HISTORY_SIZE)
+    
+    # Redelivered webhooks are already dropped by message id, so a repeat here is a real message
+    history.append({
         "role": role,
         "content": content
     })
-    conversations[customer_number]["last_updated"] = current_time
+    conversation["last_updated"] = current_time
     
-    logger.debug(f"Added {role} message to conversation with {customer_number}. History length: {len(conversations[customer_number]['history'])}")
+    logger.debug(f"Added {role} message to conversation with {customer_number}. History length: {len(history)}")
 
-def get_conversation_history(customer_number, max_messages=10):
-    """Get the recent conversation history for a customer"""
+def get_conversation_history(customer_number, token_budget=GEMINI_HISTORY_TOKEN_BUDGET):
+    """Get the most recent conversation turns that fit within the token budget, oldest first"""
     if customer_number not in conversations:
         return []
     if is_conversation_expired(customer_number):
         logger.info(f"Conversation with {customer_number} has expired. Starting new conversation.")
         conversations[customer_number] = {
-            "history": [],
+            "history": deque(maxlen=CONVERSATION_HISTORY_SIZE),
             "last_updated": datetime.now()
         }
         return []
-    history = conversations[customer_number]["history"]
-    return history[-max_messages:] if len(history) > max_messages else history
+    selected = []
+    used_tokens = 0
+    for entry in reversed(conversations[customer_number]["history"]):
+        tokens = estimate_tokens(entry["content"])
+        # Always keep the latest message, even if it alone exceeds the budget
+        if selected and used_tokens + tokens > token_budget:
+            break
+        selected.append(entry)
+        used_tokens += tokens
+    selected.reverse()
+    return selected
 
 def is_conversation_expired(customer_number):
     """Check if a conversation has expired based on timeout period"""
@@ -239,16 +234,6 @@ def is_conversation_expired(customer_number):
     expiration_time = last_updated + timedelta(hours=CONVERSATION_TIMEOUT)
     return datetime.now() > expiration_time
 
-def cleanup_expired_conversations():
-    """Remove expired conversations to free up memory"""
-    expired_numbers = []
-    for number in conversations:
-        if is_conversation_expired(number):
-            expired_numbers.append(number)
-    for number in expired_numbers:
-        del conversations[number]
-    if expired_numbers:
-        logger.info(f"Cleaned up {len(expired_numbers)} expired conversations")
 
 
 
@@ -273,11 +258,18 @@ if not googlecalendar.test_google_calendar_connection():
 else:
     logger.info("Google Calendar connection successful. Ready to handle appointments.")
 
-user_states = {}  # Dictionary to store user conversation states
+STATE_TIMEOUT = 900  # seconds before an unfinished booking stage times out
+# Keep timed-out stages a while longer so the customer still gets the session timeout notice
+STATE_TIMEOUT_GRACE = int(os.getenv("STATE_TIMEOUT_GRACE", "3600"))  # seconds
+user_states = state_store.StoreMapping(conversation_store, "user_states", ttl=STATE_TIMEOUT + STATE_TIMEOUT_GRACE)  # Booking flow stage per customer
+
+# Evict expired conversations, stages and rate limit windows in the background
+expiry_sweeper = state_store.ExpirySweeper(conversation_store)
+expiry_sweeper.start()
 
 def check_state_timeout(customer_number):
     if customer_number in user_states:
-        if (datetime.now() - user_states[customer_number]["timestamp"]).total_seconds() > 900:
+        if (datetime.now() - user_states[customer_number]["timestamp"]).total_seconds() > STATE_TIMEOUT:
             del user_states[customer_number]
             return True
     return False
@@ -317,31 +309,31 @@ def handle_booking_confirmation(customer_number, confirmation):
     
     return None
 
-def handle_current_state(customer_number, message, current_state):
+def handle_current_state(customer_number, features, current_state):
     stage = current_state.get("stage")
     
     if stage == "awaiting_booking_confirmation":
-        return handle_booking_confirmation(customer_number, message.lower())
+        return handle_booking_confirmation(customer_number, features.lower)
     elif stage == "waiting_for_date":
-        return handle_date_input(customer_number, message.strip())
+        return handle_date_input(customer_number, features)
     elif stage == "waiting_for_time":
-        return handle_time_input(customer_number, message.strip())
+        return handle_time_input(customer_number, features)
     elif stage == "waiting_for_name":
-        return handle_name_input(customer_number, message.strip())
+        return handle_name_input(customer_number, features)
     elif stage == "selecting_appointment_to_reschedule":
-        return handle_reschedule_selection(customer_number, message.strip())
+        return handle_reschedule_selection(customer_number, features)
     elif stage == "waiting_for_reschedule_date":
-        return handle_reschedule_date(customer_number, message.strip())
+        return handle_reschedule_date(customer_number, features)
     elif stage == "waiting_for_reschedule_time":
-        return handle_reschedule_time(customer_number, message.strip())
+        return handle_reschedule_time(customer_number, features)
     
     return None
 
-def handle_date_input(customer_number, date_str):
+def handle_date_input(customer_number, features):
     current_state = user_states[customer_number]
     
     # Try to parse natural language date or formatted date
-    date_obj = time_utils.parse_natural_language_date(date_str)
+    date_obj = features.date
     if date_obj:
         # Format as YYYY-MM-DD for internal use
         formatted_date = date_obj.strftime("%Y-%m-%d")
@@ -380,18 +372,12 @@ def handle_date_input(customer_number, date_str):
     else:
         return message_templates.get_message("date_format_error")
     
-def handle_time_input(customer_number, time_str):
+def handle_time_input(customer_number, features):
     current_state = user_states[customer_number]
-    normalized_time = time_utils.normalize_time_format(time_str)
-    if not normalized_time:
+    time_display = features.time_display
+    if not time_display:
         return message_templates.get_message("time_format_error")
     
-    # Convert to 12-hour format for display
-    hour, minute = map(int, normalized_time.split(':'))
-    am_pm = 'AM' if hour < 12 else 'PM'
-    hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
-    time_display = f"{hour}:{minute:02d} {am_pm}"
-    
     # Check if this time is actually available
     appointment_info = current_state["appointment_info"]
     date_str = appointment_info["date"]
@@ -420,7 +406,8 @@ def handle_time_input(customer_number, time_str):
     # Ask for name
     return message_templates.get_message("ask_name")
 
-def handle_name_input(customer_number, customer_name):
+def handle_name_input(customer_number, features):
+    customer_name = features.stripped
     current_state = user_states[customer_number]
     appointment_info = current_state["appointment_info"]
     
@@ -445,10 +432,10 @@ def handle_name_input(customer_number, customer_name):
                                        time=appointment_info['time'],
                                        number=customer_number)
 
-def handle_reschedule_selection(customer_number, selection):
+def handle_reschedule_selection(customer_number, features):
     current_state = user_states[customer_number]
     try:
-        selected_index = int(selection) - 1
+        selected_index = int(features.stripped) - 1
         appointments = current_state["appointments"]
         
         if selected_index < 0 or selected_index >= len(appointments):
@@ -492,11 +479,11 @@ def handle_reschedule_intent(customer_number):
     appointment_list = format_appointment_list(appointments)
     return message_templates.get_message("which_appointment_to_reschedule", appointment_list=appointment_list)
 
-def handle_reschedule_date(customer_number, date_str):
+def handle_reschedule_date(customer_number, features):
     current_state = user_states[customer_number]
     
     # Try to parse natural language date or formatted date
-    date_obj = time_utils.parse_natural_language_date(date_str)
+    date_obj = features.date
     if date_obj:
         # Format as YYYY-MM-DD for internal use
         formatted_date = date_obj.strftime("%Y-%m-%d")
@@ -556,18 +543,12 @@ def handle_reschedule_date(customer_number, date_str):
     else:
         return message_templates.get_message("date_format_error")
 
-def handle_reschedule_time(customer_number, time_str):
+def handle_reschedule_time(customer_number, features):
     current_state = user_states[customer_number]
-    normalized_time = time_utils.normalize_time_format(time_str)
-    if not normalized_time:
+    time_display = features.time_display
+    if not time_display:
         return message_templates.get_message("time_format_error")
     
-    # Convert to 12-hour format for display
-    hour, minute = map(int, normalized_time.split(':'))
-    am_pm = 'AM' if hour < 12 else 'PM'
-    hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
-    time_display = f"{hour}:{minute:02d} {am_pm}"
-    
     # Get the appointment details from state
     selected_appointment = current_state["selected_appointment"]
     new_date = current_state["new_date"]
@@ -628,10 +609,10 @@ def handle_cancel_intent(customer_number):
     return f"Which appointment would you like to cancel? Please reply with the number:\n\n{appointment_list}"
 
 
-def handle_cancel_selection(customer_number, selection):
+def handle_cancel_selection(customer_number, features):
     current_state = user_states[customer_number]
     try:
-        selected_index = int(selection) - 1
+        selected_index = int(features.stripped) - 1
         appointments = current_state["appointments"]
         if selected_index < 0 or selected_index >= len(appointments):
             return message_templates.get_message("invalid_appointment_number", max_appointments=len(appointments))
@@ -652,7 +633,7 @@ def handle_cancel_selection(customer_number, selection):
         return message_templates.get_message("enter_valid_number")
 
 
-def handle_intent(customer_number, intent_type, treatment_code, message_lower):
+def handle_intent(customer_number, intent_type, treatment_code, features):
     if intent_type == "booking" and treatment_code:
         return handle_booking_intent(customer_number, treatment_code)
     elif intent_type == "reschedule":
@@ -663,9 +644,8 @@ def handle_intent(customer_number, intent_type, treatment_code, message_lower):
         return handle_cancel_intent(customer_number)
     elif intent_type == "info" and treatment_code:
         # Treatment with time but no booking intent
-        time_match = re.search(r"(\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm)|at\s+\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm))", message_lower)
-        if time_match:
-            return handle_time_only_booking(customer_number, treatment_code, time_match)
+        if features.time_match:
+            return handle_time_only_booking(customer_number, treatment_code, features.time_match)
     
     return None
 
@@ -721,81 +701,9 @@ def format_appointment_list(appointments):
     return appointment_list
 
 
-def parse_multiline_appointment(message):
-    """Parse appointment details from a multi-line message format"""
-    lines = message.strip().split('\n')
-    if len(lines) < 3: # Need at least time, date, and treatment
-        return None
-
-    appointment_info = {}
-
-    # Try to parse time from first line
-    time_str = lines[0].strip()
-    normalized_time = time_utils.normalize_time_format(time_str)
-    if normalized_time:
-        hour, minute = map(int, normalized_time.split(':'))
-        am_pm = 'AM' if hour < 12 else 'PM'
-        hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
-        appointment_info["time"] = f"{hour}:{minute:02d} {am_pm}"
-
-    # Try to parse date from second line using enhanced function
-    date_str = lines[1].strip()
-    date_obj = time_utils.parse_natural_language_date(date_str)
-    if date_obj:
-        # CHECK FOR PUBLIC HOLIDAY IMMEDIATELY
-        if googlecalendar.is_public_holiday(date_obj):
-            return {"error": "public_holiday"}
-            
-        appointment_info["date"] = date_obj.strftime("%Y-%m-%d") # Convert to YYYY-MM-DD format
-
-    # Get treatment from third line
-    treatment = lines[2].strip().lower()
-    if treatment in googlecalendar.TREATMENT_DURATIONS:
-        appointment_info["treatment_type"] = treatment
-
-    # Get name if available (fourth line)
-    if len(lines) >= 4:
-        appointment_info["customer_name"] = lines[3].strip()
-
-    # Return the parsed info if we have the minimum required fields
-    if "time" in appointment_info and "date" in appointment_info and "treatment_type" in appointment_info:
-        return appointment_info
-
-    return None
-
-
 def parse_initial_appointment_info(message):
     """Extract all possible appointment information from initial message"""
-    appointment_info = {}
-    
-    # Extract treatment type
-    intent_type, treatment_code = intent_triggers.extract_intent(message)
-    if treatment_code:
-        appointment_info["treatment_type"] = treatment_code
-    
-    # Extract time
-    time_match = re.search(r"(\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm)|at\s+\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm))", 
-                           message.lower())
-    if time_match:
-        time_str = time_match.group(1).replace("at ", "").strip()
-        normalized_time = time_utils.normalize_time_format(time_str)
-        if normalized_time:
-            hour, minute = map(int, normalized_time.split(':'))
-            am_pm = 'AM' if hour < 12 else 'PM'
-            hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
-            appointment_info["time"] = f"{hour}:{minute:02d} {am_pm}"
-    
-    # Extract date
-    date_obj = time_utils.parse_natural_language_date(message)
-    if date_obj:
-        appointment_info["date"] = date_obj.strftime("%Y-%m-%d")
-    
-    # Extract potential name (simplified approach)
-    name_match = re.search(r"(?:my name is|for|name[: ]+)([A-Za-z\s]+)(?:\.|,|\s|$)", message)
-    if name_match:
-        appointment_info["customer_name"] = name_match.group(1).strip()
-    
-    return appointment_info
+    return dict(MessageFeatures(message).appointment_info)
 
 
 def handle_treatment_only(customer_number, treatment_code):
@@ -831,10 +739,10 @@ def handle_name_only(customer_number, name_value):
     }
     return "Thank you, {name}. What type of treatment would you like to book? (consultation, medical_facial, laser_treatment, botox, filler, or follow_up)".format(name=name_value)
 
-def handle_treatment_input_for_time(customer_number, message):
+def handle_treatment_input_for_time(customer_number, features):
     """Handle treatment input when we already have time"""
     # Extract treatment type from message
-    _, treatment_code = intent_triggers.extract_intent(message)
+    treatment_code = features.treatment_code
     
     if not treatment_code:
         return "I didn't recognize that treatment type. Please choose from: consultation, medical_facial, laser_treatment, botox, filler, or follow_up."
@@ -848,10 +756,10 @@ def handle_treatment_input_for_time(customer_number, message):
 
 
 
-def handle_treatment_input_after_date(customer_number, message):
+def handle_treatment_input_after_date(customer_number, features):
     """Handler for when user has provided date first, then treatment"""
     # Extract treatment type from message
-    _, treatment_code = intent_triggers.extract_intent(message)
+    treatment_code = features.treatment_code
     if not treatment_code:
         return "I didn't recognize that treatment type. Please choose from: consultation, medical_facial, laser_treatment, botox, filler, or follow_up."
     
@@ -877,19 +785,13 @@ def handle_treatment_input_after_date(customer_number, message):
                                      date=display_date,
                                      times=", ".join(available_times))
 
-def handle_time_input_after_date(customer_number, time_str):
+def handle_time_input_after_date(customer_number, features):
     """Handler for when user has provided date and treatment, now adding time"""
     current_state = user_states[customer_number]
-    normalized_time = time_utils.normalize_time_format(time_str)
-    if not normalized_time:
+    time_display = features.time_display
+    if not time_display:
         return message_templates.get_message("time_format_error")
     
-    # Convert to 12-hour format for display
-    hour, minute = map(int, normalized_time.split(':'))
-    am_pm = 'AM' if hour < 12 else 'PM'
-    hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
-    time_display = f"{hour}:{minute:02d} {am_pm}"
-    
     # Add validation and availability check here
     # ...
     
@@ -979,8 +881,11 @@ def update_appointment_handler():
 
 
 
-def handle_message(customer_number, message):
-    message_lower = message.lower().strip()
+def handle_message(customer_number, message, features=None):
+    # Parse the message once; every handler below reads from the same features
+    if features is None:
+        features = MessageFeatures(message)
+    message_lower = features.lower
     logger.debug(f"Handling message for {customer_number}: '{message}'")
 
     # Check for session timeout
@@ -988,42 +893,14 @@ def handle_message(customer_number, message):
         return message_templates.get_message("session_timeout")
 
     # Parse all possible appointment information from the message
-    appointment_info = {}
-
-    # 1. Check for treatment type
-    intent_type, treatment_code = intent_triggers.extract_intent(message)
-    if treatment_code:
-        appointment_info["treatment_type"] = treatment_code
-
-    # 2. Check for time
-    time_match = re.search(r"(\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm)|at\s+\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm))", message_lower)
-    if time_match:
-        time_str = time_match.group(1).replace("at ", "").strip()
-        normalized_time = time_utils.normalize_time_format(time_str)
-        if normalized_time:
-            hour, minute = map(int, normalized_time.split(':'))
-            am_pm = 'AM' if hour < 12 else 'PM'
-            hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
-            appointment_info["time"] = f"{hour}:{minute:02d} {am_pm}"
-
-    # 3. Check for date
-    date_obj = time_utils.parse_natural_language_date(message)
-    if date_obj:
-        appointment_info["date"] = date_obj.strftime("%Y-%m-%d")
-
-    # 4. Check for name
-    name_match = re.search(r"(?:my name is|for|name[: ]+)([A-Za-z\s]+)(?:\.|,|\s|$)", message_lower)
-    if name_match:
-        appointment_info["customer_name"] = name_match.group(1).strip()
-
-    # Handle multiline appointment format
-    multiline_info = parse_multiline_appointment(message)
-    if multiline_info:
-        # Handle public holiday error case
-        if "error" in multiline_info and multiline_info["error"] == "public_holiday":
-            return message_templates.get_message("public_holiday_closed")
-        # Merge with existing info, prioritizing multiline format
-        appointment_info.update(multiline_info)
+    intent_type, treatment_code = features.intent
+
+    # Handle public holiday error case in the multiline appointment format
+    multiline_info = features.multiline_appointment
+    if multiline_info and multiline_info.get("error") == "public_holiday":
+        return message_templates.get_message("public_holiday_closed")
+
+    appointment_info = features.appointment_info
 
     # If we have complete booking info, set up confirmation
     if all(k in appointment_info for k in ["date", "time", "treatment_type"]):
@@ -1056,10 +933,9 @@ def handle_message(customer_number, message):
         return handle_view_intent(customer_number)
 
     # Check for combined "cancel X" pattern
-    cancel_number_match = re.search(r"cancel\s+(\d+)", message_lower)
-    if cancel_number_match or (intent_type == "cancel" and message_lower.strip().isdigit()):
+    if features.cancel_number is not None or (intent_type == "cancel" and features.is_number):
         # Extract the number from either "cancel X" or just "X" after cancel intent
-        index = int(cancel_number_match.group(1) if cancel_number_match else message_lower)
+        index = features.cancel_number if features.cancel_number is not None else int(message_lower)
         # Get customer appointments
         result = googlecalendar.list_customer_appointments(customer_number)
         if "error" in result:
@@ -1080,10 +956,9 @@ def handle_message(customer_number, message):
                                          time=selected_appointment["time"])
 
     # Check for combined "reschedule X" pattern
-    reschedule_number_match = re.search(r"reschedule\s+(\d+)", message_lower)
-    if reschedule_number_match or (intent_type == "reschedule" and message_lower.strip().isdigit()):
+    if features.reschedule_number is not None or (intent_type == "reschedule" and features.is_number):
         # Extract the number from either "reschedule X" or just "X" after reschedule intent
-        index = int(reschedule_number_match.group(1) if reschedule_number_match else message_lower)
+        index = features.reschedule_number if features.reschedule_number is not None else int(message_lower)
         # Get customer appointments
         result = googlecalendar.list_customer_appointments(customer_number)
         if "error" in result:
@@ -1111,36 +986,43 @@ def handle_message(customer_number, message):
         
         # Handle different conversation stages
         if stage == "waiting_for_treatment_after_date":
-            return handle_treatment_input_after_date(customer_number, message.strip())
+            return handle_treatment_input_after_date(customer_number, features)
         elif stage == "waiting_for_time_after_date":
-            return handle_time_input_after_date(customer_number, message.strip())
+            return handle_time_input_after_date(customer_number, features)
         # Handle different conversation stages
         if stage == "selecting_appointment_to_cancel":
-            return handle_cancel_selection(customer_number, message.strip())
+            return handle_cancel_selection(customer_number, features)
         elif stage == "awaiting_booking_confirmation":
-            return handle_booking_confirmation(customer_number, message_lower)
+            return handle_booking_confirmation(customer_number, features.lower)
         elif stage == "waiting_for_date":
-            return handle_date_input(customer_number, message.strip())
+            return handle_date_input(customer_number, features)
         elif stage == "waiting_for_time":
-            return handle_time_input(customer_number, message.strip())
+            return handle_time_input(customer_number, features)
         elif stage == "waiting_for_name":
-            return handle_name_input(customer_number, message.strip())
+            return handle_name_input(customer_number, features)
         elif stage == "waiting_for_treatment":
-            return handle_treatment_input_for_time(customer_number, message.strip())
+            return handle_treatment_input_for_time(customer_number, features)
         elif stage == "waiting_for_treatment_with_name":
-            return handle_treatment_input_for_name(customer_number, message.strip())
+            return handle_treatment_input_for_name(customer_number, features)
         elif stage == "waiting_for_date_with_time":
-            return handle_date_input_for_time(customer_number, message.strip())
+            return handle_date_input_for_time(customer_number, features)
         elif stage == "waiting_for_date_with_name":
-            return handle_date_input_for_name(customer_number, message.strip())
+            return handle_date_input_for_name(customer_number, features)
         elif stage == "waiting_for_time_with_name":
-            return handle_time_input_for_name(customer_number, message.strip())
+            return handle_time_input_for_name(customer_number, features)
         elif stage == "selecting_appointment_to_reschedule":
-            return handle_reschedule_selection(customer_number, message.strip())
+            return handle_reschedule_selection(customer_number, features)
         elif stage == "waiting_for_reschedule_date":
-            return handle_reschedule_date(customer_number, message.strip())
+            return handle_reschedule_date(customer_number, features)
         elif stage == "waiting_for_reschedule_time":
-            return handle_reschedule_time(customer_number, message.strip())
+            return handle_reschedule_time(customer_number, features)
+
+    # Plain price, opening hours and location questions are answered from the service catalogue
+    if intent_type in (None, "info") and "date" not in appointment_info and "time" not in appointment_info:
+        catalogue_answer = service_catalogue.answer_inquiry(message_lower, features.phrase_matches)
+        if catalogue_answer:
+            logger.info(f"Answered {customer_number} from the service catalogue")
+            return catalogue_answer
 
     # Handle new appointment requests based on what information was provided
     # Case 1: Treatment type provided (like "botox"), but ONLY if not asking for info
@@ -1205,10 +1087,10 @@ def handle_message(customer_number, message):
 
 # New handler functions for flexible input order
 
-def handle_treatment_input_for_time(customer_number, message):
+def handle_treatment_input_for_time(customer_number, features):
     """Handler for when user has provided time first, then treatment"""
     # Extract treatment type from message
-    _, treatment_code = intent_triggers.extract_intent(message)
+    treatment_code = features.treatment_code
     
     if not treatment_code:
         return "I didn't recognize that treatment type. Please choose from: consultation, medical_facial, laser_treatment, botox, filler, or follow_up."
@@ -1220,10 +1102,10 @@ def handle_treatment_input_for_time(customer_number, message):
     
     return message_templates.get_message("ask_for_date", treatment=treatment_code)
 
-def handle_treatment_input_for_name(customer_number, message):
+def handle_treatment_input_for_name(customer_number, features):
     """Handler for when user has provided name first, then treatment"""
     # Extract treatment type from message
-    _, treatment_code = intent_triggers.extract_intent(message)
+    treatment_code = features.treatment_code
     
     if not treatment_code:
         return "I didn't recognize that treatment type. Please choose from: consultation, medical_facial, laser_treatment, botox, filler, or follow_up."
@@ -1235,12 +1117,12 @@ def handle_treatment_input_for_name(customer_number, message):
     
     return message_templates.get_message("ask_for_date", treatment=treatment_code)
 
-def handle_date_input_for_time(customer_number, date_str):
+def handle_date_input_for_time(customer_number, features):
     """Handler for when user has provided time and treatment, now adding date"""
     current_state = user_states[customer_number]
     
     # Try to parse natural language date or formatted date
-    date_obj = time_utils.parse_natural_language_date(date_str)
+    date_obj = features.date
     if date_obj:
         # Format as YYYY-MM-DD for internal use
         formatted_date = date_obj.strftime("%Y-%m-%d")
@@ -1259,12 +1141,12 @@ def handle_date_input_for_time(customer_number, date_str):
     else:
         return message_templates.get_message("date_format_error")
 
-def handle_date_input_for_name(customer_number, date_str):
+def handle_date_input_for_name(customer_number, features):
     """Handler for when user has provided name and treatment, now adding date"""
     current_state = user_states[customer_number]
     
     # Try to parse natural language date or formatted date
-    date_obj = time_utils.parse_natural_language_date(date_str)
+    date_obj = features.date
     if date_obj:
         # Format as YYYY-MM-DD for internal use
         formatted_date = date_obj.strftime("%Y-%m-%d")
@@ -1299,20 +1181,14 @@ def handle_date_input_for_name(customer_number, date_str):
     else:
         return message_templates.get_message("date_format_error")
 
-def handle_time_input_for_name(customer_number, time_str):
+def handle_time_input_for_name(customer_number, features):
     """Handler for when user has provided name, treatment, and date, now adding time"""
     current_state = user_states[customer_number]
     
-    normalized_time = time_utils.normalize_time_format(time_str)
-    if not normalized_time:
+    time_display = features.time_display
+    if not time_display:
         return message_templates.get_message("time_format_error")
     
-    # Convert to 12-hour format for display
-    hour, minute = map(int, normalized_time.split(':'))
-    am_pm = 'AM' if hour < 12 else 'PM'
-    hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
-    time_display = f"{hour}:{minute:02d} {am_pm}"
-    
     # Check if this time is actually available
     appointment_info = current_state["appointment_info"]
     date_str = appointment_info["date"]
@@ -1357,34 +1233,55 @@ def handle_time_input_for_name(customer_number, time_str):
 
 
 # --- Gemini API interaction ---
-def get_gemini_response(customer_number, message):
+def _post_gemini(url, headers, data, **kwargs):
+    """POST a generateContent request, retrying once without the context cache if it was rejected"""
+    response = http_client.post(url, headers=headers, json=data, **kwargs)
+    if response.status_code in (400, 403, 404) and "cachedContent" in data:
+        # The cache may have been deleted or expired server-side, retry with the inline instruction
+        logger.warning(f"Gemini request with cached context failed with status {response.status_code}, retrying without cache")
+        response.close()
+        gemini_context_cache.invalidate()
+        data.pop("cachedContent")
+        data["systemInstruction"] = gemini_context_cache.system_instruction()
+        response = http_client.post(url, headers=headers, json=data, **kwargs)
+    return response
+
+def get_gemini_response(customer_number, message, on_paragraph=None):
+    """
+    Ask Gemini for a reply based on the conversation history.
+    
+    With GEMINI_STREAMING enabled and an on_paragraph callback, the answer is
+    streamed and on_paragraph(text) is called as each paragraph completes; the
+    result then carries "streamed": True and the text has already been delivered.
+    """
     try:
         headers = {
             "Content-Type": "application/json",
             "x-goog-api-key": GEMINI_API_KEY
         }
         
-        add_message_to_conversation(customer_number, "user", message)
+        # The caller has already recorded the customer's message in the history
         conversation_history = get_conversation_history(customer_number)
         
-        data = {
-            "contents": [
-                {
-                    "role": "user",
-                    "parts": [{"text": MEOWKIES_CONTEXT + "\n\nPlease respond as Meowkies based on the following conversation:"}]
-                }
-            ]
-        }
-        
+        contents = []
         for entry in conversation_history:
             role = "user" if entry["role"] == "user" else "model"
-            data["contents"].append({
+            # The conversation sent to Gemini has to open with a user turn
+            if not contents and role == "model":
+                continue
+            contents.append({
                 "role": role,
                 "parts": [{"text": entry["content"]}]
             })
         
+        data = {"contents": contents}
+        data.update(gemini_context_cache.request_fields(GEMINI_API_KEY))
+        
+        if gemini_context.GEMINI_STREAMING and on_paragraph:
+            return _stream_gemini_response(customer_number, headers, data, on_paragraph)
+        
         logger.debug(f"Sending request to Gemini API with conversation history. Customer message: {message[:50]}...")
-        response = requests.post(GEMINI_API_URL, headers=headers, json=data, timeout=30)
+        response = _post_gemini(GEMINI_API_URL, headers, data)
         
         if response.status_code != 200:
             logger.error(f"Gemini API error: Status {response.status_code}, Response: {response.text}")
@@ -1392,6 +1289,7 @@ def get_gemini_response(customer_number, message):
         
         response_data = response.json()
         logger.debug(f"Gemini API response received: {str(response_data)[:100]}...")
+        gemini_context.log_token_usage(customer_number, response_data, estimate_tokens(gemini_context_cache.system_text))
         
         if "candidates" in response_data and response_data["candidates"]:
             candidate = response_data["candidates"][0]
@@ -1413,9 +1311,62 @@ def get_gemini_response(customer_number, message):
         logger.error(f"Unexpected error in get_gemini_response: {str(e)}")
         return {"error": f"Unexpected error: {str(e)}"}
 
+def _stream_gemini_response(customer_number, headers, data, on_paragraph):
+    """Stream a Gemini answer over SSE, handing each completed paragraph to on_paragraph"""
+    started = time.monotonic()
+    chunker = gemini_context.ParagraphChunker()
+    delivered = []
+    full_text = ""
+    partial = False
+    last_event = {}
+    
+    def deliver(paragraphs):
+        for paragraph in paragraphs:
+            if not delivered:
+                logger.info(f"First Gemini paragraph for {customer_number} ready after {(time.monotonic() - started) * 1000:.0f} ms")
+            on_paragraph(paragraph)
+            delivered.append(paragraph)
+    
+    try:
+        logger.debug(f"Streaming Gemini response for {customer_number}")
+        response = _post_gemini(GEMINI_STREAM_URL, headers, data, stream=True)
+        if response.status_code != 200:
+            logger.error(f"Gemini API error: Status {response.status_code}, Response: {response.text}")
+            return {"error": f"Gemini API returned status code {response.status_code}"}
+        
+        with response:
+            for event in gemini_context.iter_sse_events(response):
+                last_event = event
+                text = gemini_context.event_text(event)
+                if text:
+                    full_text += text
+                    deliver(chunker.feed(text))
+        deliver(chunker.flush())
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        logger.error(f"Gemini stream failed after {len(delivered)} paragraphs: {str(e)}")
+        if not delivered:
+            return {"error": f"Request to Gemini API failed: {str(e)}"}
+        # Keep what the customer has already received in the history
+        full_text = "\n\n".join(delivered)
+        partial = True
+    
+    if not full_text.strip():
+        error_msg = "Failed to extract response from Gemini API"
+        logger.error(error_msg)
+        return {"error": error_msg}
+    
+    gemini_context.log_token_usage(customer_number, last_event, estimate_tokens(gemini_context_cache.system_text))
+    logger.info(f"Streamed Gemini response to {customer_number} in {len(delivered)} messages over {(time.monotonic() - started) * 1000:.0f} ms")
+    add_message_to_conversation(customer_number, "assistant", full_text)
+    return {"text": full_text, "streamed": True, "partial": partial}
+
 # --- WhatsApp API interaction ---
 def send_whatsapp_message(recipient_number, message):
     try:
+        # Respect WhatsApp's throughput and per-customer pair limits
+        if not rate_limiter.acquire_whatsapp_send(recipient_number):
+            return {"error": "WhatsApp send rate limit reached, message not sent"}
+        
         headers = {
             "Authorization": f"Bearer {WHATSAPP_API_TOKEN}",
             "Content-Type": "application/json",
@@ -1427,7 +1378,7 @@ def send_whatsapp_message(recipient_number, message):
         }
         
         logger.debug(f"Sending WhatsApp message to {recipient_number}: {message[:50]}...")
-        response = requests.post(WHATSAPP_API_URL, headers=headers, json=data, timeout=30)
+        response = http_client.post(WHATSAPP_API_URL, headers=headers, json=data)
         
         if response.status_code != 200:
             logger.error(f"WhatsApp API error: Status {response.status_code}, Response: {response.text}")
@@ -1447,43 +1398,146 @@ def send_whatsapp_message(recipient_number, message):
         return {"error": f"Unexpected error: {str(e)}"}
 
 # --- Extract message data safely ---
-def extract_message_data(data):
+# Shared answers for FAQ-style questions that fell through to Gemini
+faq_response_cache = response_cache.ResponseCache()
+
+# --- Background message processing ---
+def process_incoming_messages(customer_number, customer_messages):
+    """Process a customer's batch of messages while holding their state for an atomic read-modify-write"""
+    started = False
     try:
-        if not data or not isinstance(data, dict):
-            logger.warning("Webhook data is empty or not a dictionary")
-            return None, None
-        
-        if "object" in data and data.get("object") == "whatsapp_business_account":
-            if "entry" not in data or not data["entry"]:
-                logger.warning("No entries in webhook data")
-                return None, None
-            
-            entry = data["entry"][0]
-            if "changes" not in entry or not entry["changes"]:
-                logger.warning("No changes in webhook entry")
-                return None, None
-            
-            change = entry["changes"][0]
-            if "value" not in change or "messages" not in change["value"] or not change["value"]["messages"]:
-                logger.warning("No messages in webhook change value")
-                return None, None
-            
-            message = change["value"]["messages"][0]
-            if "text" not in message or "from" not in message:
-                logger.warning("Message is missing required fields (text or from)")
-                return None, None
-            
-            customer_message = message["text"].get("body", "")
-            customer_number = message.get("from", "")
-            
-            if not customer_message or not customer_number:
-                logger.warning(f"Invalid message data: message={bool(customer_message)}, number={bool(customer_number)}")
-                return None, None
-            
-            return customer_number, customer_message
-    except Exception as e:
-        logger.error(f"Error extracting message data: {str(e)}")
-        return None, None
+        with conversation_store.transaction(customer_number, conversations, user_states, rate_limits):
+            started = True
+            _process_incoming_messages(customer_number, customer_messages)
+    except state_store.StateLockTimeout as e:
+        if started:
+            raise
+        # Another worker is still busy with this customer, nothing was done yet so try again later
+        raise RetryLater(str(e)) from e
+
+def _process_incoming_messages(customer_number, customer_messages):
+    """
+    Run intent handling for each message in order, then answer the ones that fell
+    through with Gemini.
+
+    Consecutive messages that no rule handles are sent to Gemini as a single turn,
+    so a question typed in several fragments costs one LLM call. Pending fragments
+    are answered before the next rule-based reply to keep replies in order.
+    """
+    gemini_batch = []
+    warned = False
+    for customer_message in customer_messages:
+        logger.info(f"Processing message from {customer_number}: {customer_message}")
+        
+        # Check rate limiting
+        allowed, retry_after = check_rate_limit(customer_number)
+        if not allowed:
+            logger.warning(f"Rate limit exceeded for {customer_number}, retry after {retry_after:.1f}s.")
+            if not warned:
+                warning_message = message_templates.get_message("rate_limit_exceeded",
+                                                                retry_after=time_utils.format_wait_time(retry_after))
+                send_whatsapp_message(customer_number, warning_message)
+                warned = True
+            continue
+        
+        # Call handle_message for all incoming messages
+        features = MessageFeatures(customer_message)
+        response = handle_message(customer_number, customer_message, features)
+        if not response:
+            gemini_batch.append(customer_message)
+            continue
+        
+        if gemini_batch:
+            _answer_with_gemini(customer_number, "\n".join(gemini_batch))
+            gemini_batch = []
+        
+        logger.info(f"Message handled successfully by handle_message for {customer_number}")
+        # Add the message and the response to conversation history
+        add_message_to_conversation(customer_number, "user", customer_message)
+        add_message_to_conversation(customer_number, "assistant", response)
+        
+        # Send the response via WhatsApp
+        whatsapp_result = send_whatsapp_message(customer_number, response)
+        if "error" in whatsapp_result:
+            logger.error(f"Error sending WhatsApp message: {whatsapp_result['error']}")
+            continue
+        
+        logger.info(f"Successfully processed message and sent response to {customer_number}")
+    
+    if gemini_batch:
+        _answer_with_gemini(customer_number, "\n".join(gemini_batch))
+
+def _answer_with_gemini(customer_number, customer_message):
+    """Answer a message (or coalesced fragments) that no rule handled, via the cache or Gemini"""
+    logger.info(f"No response from handle_message for {customer_number}, falling back to Gemini")
+    
+    # A reply can only be shared if Gemini saw nothing but this message, not this customer's earlier turns
+    first_turn = not get_conversation_history(customer_number)
+    
+    # Add message to conversation history
+    add_message_to_conversation(customer_number, "user", customer_message)
+    
+    # Answer repeated FAQ-style questions without a Gemini round trip
+    cacheable = response_cache.RESPONSE_CACHE_ENABLED and response_cache.is_cacheable(
+        customer_message, customer_number in user_states
+    )
+    if cacheable:
+        cached_response = faq_response_cache.lookup(customer_message)
+        if cached_response:
+            logger.info(f"Answering {customer_number} from the response cache")
+            add_message_to_conversation(customer_number, "assistant", cached_response)
+            whatsapp_result = send_whatsapp_message(customer_number, cached_response)
+            if "error" in whatsapp_result:
+                logger.error(f"Error sending WhatsApp message: {whatsapp_result['error']}")
+            return
+    
+    # Get response from Gemini with conversation history, streamed paragraphs go out as they complete
+    def send_paragraph(paragraph):
+        result = send_whatsapp_message(customer_number, paragraph)
+        if "error" in result:
+            logger.error(f"Error sending streamed paragraph: {result['error']}")
+    
+    gemini_started = time.monotonic()
+    gemini_response = get_gemini_response(customer_number, customer_message, on_paragraph=send_paragraph)
+    
+    if "error" in gemini_response:
+        logger.error(f"Error getting Gemini response: {gemini_response['error']}")
+        fallback_message = message_templates.get_message("api_error_fallback")
+        send_whatsapp_message(customer_number, fallback_message)
+        add_message_to_conversation(customer_number, "assistant", fallback_message)
+        return
+    
+    gemini_text_response = gemini_response.get("text", "")
+    if not gemini_text_response:
+        logger.error("Empty response text from Gemini")
+        fallback_message = message_templates.get_message("api_error_fallback")
+        send_whatsapp_message(customer_number, fallback_message)
+        add_message_to_conversation(customer_number, "assistant", fallback_message)
+        return
+    
+    if cacheable and first_turn and not gemini_response.get("partial"):
+        faq_response_cache.store(customer_message, gemini_text_response, time.monotonic() - gemini_started)
+    
+    if gemini_response.get("streamed"):
+        logger.info(f"Successfully processed message and streamed response to {customer_number}")
+        return
+    
+    whatsapp_result = send_whatsapp_message(customer_number, gemini_text_response)
+    if "error" in whatsapp_result:
+        logger.error(f"Error sending WhatsApp message: {whatsapp_result['error']}")
+        return
+    
+    logger.info(f"Successfully processed message and sent response to {customer_number}")
+
+# Bounded worker pool so the webhook can acknowledge Meta immediately
+reply_pipeline = ReplyPipeline(process_incoming_messages)
+# Drain accepted messages when the process exits outside gunicorn (worker_exit covers gunicorn)
+atexit.register(reply_pipeline.stop)
+webhook_stats = webhook_events.WebhookStats()
+# Seen-set of inbound message ids so webhook redeliveries are dropped, shared through durable stores
+message_deduplicator = message_dedup.MessageDeduplicator(
+    store=conversation_store if message_dedup.MESSAGE_DEDUP_PERSIST and not isinstance(conversation_store, state_store.InMemoryStateStore) else None
+)
 
 # --- Webhook handling ---
 @app.route("/webhook", methods=["POST", "GET"])
@@ -1492,8 +1546,8 @@ def webhook():
         try:
             logger.debug(f"Received webhook POST: {request.data.decode('utf-8')[:200]}...")
             
-            # Periodically clean up expired conversations
-            cleanup_expired_conversations()
+            # Restarts the sweeper in forked worker processes, otherwise a no-op
+            expiry_sweeper.start()
             
             # Parse JSON data
             try:
@@ -1502,73 +1556,45 @@ def webhook():
                 logger.error(f"Failed to parse webhook data: {str(e)}")
                 return jsonify({"status": "error", "message": "Invalid JSON"}), 400
             
-            # Extract message data
-            customer_number, customer_message = extract_message_data(data)
-            if not customer_number or not customer_message:
+            # Walk every entry, change, message and status in the delivery
+            if not isinstance(data, dict) or data.get("object") != "whatsapp_business_account":
                 logger.warning("Could not extract valid message data from webhook")
                 return jsonify({"status": "error", "message": "Invalid message format"}), 200
+            events = list(webhook_events.iter_webhook_events(data))
+            webhook_stats.record(events)
             
-            logger.info(f"Processing message from {customer_number}: {customer_message}")
-            
-            # Check rate limiting
-            if not check_rate_limit(customer_number):
-                warning_message = message_templates.get_message("rate_limit_exceeded")
-                logger.warning(f"Rate limit exceeded for {customer_number}. Sending warning message.")
-                send_whatsapp_message(customer_number, warning_message)
-                return jsonify({"status": "error", "message": "Rate limit exceeded"}), 200
-            
-            # Add message to conversation history
-            add_message_to_conversation(customer_number, "user", customer_message)
-            
-            # Call handle_message for all incoming messages
-            response = handle_message(customer_number, customer_message)
-            
-            # If handle_message returned a response, use it
-            if response:
-                logger.info(f"Message handled successfully by handle_message for {customer_number}")
-                # Add the response to conversation history
-                add_message_to_conversation(customer_number, "assistant", response)
-                
-                # Send the response via WhatsApp
-                whatsapp_result = send_whatsapp_message(customer_number, response)
-                if "error" in whatsapp_result:
-                    error_message = whatsapp_result["error"]
-                    logger.error(f"Error sending WhatsApp message: {error_message}")
-                    return jsonify({"status": "error", "message": error_message}), 200
-                
-                logger.info(f"Successfully processed message and sent response to {customer_number}")
-                return jsonify({"status": "success"}), 200
-            
-            # If handle_message didn't return a response, fall back to Gemini
-            logger.info(f"No response from handle_message for {customer_number}, falling back to Gemini")
-            
-            # Get response from Gemini with conversation history
-            gemini_response = get_gemini_response(customer_number, customer_message)
-            
-            if "error" in gemini_response:
-                error_message = gemini_response["error"]
-                logger.error(f"Error getting Gemini response: {error_message}")
-                fallback_message = message_templates.get_message("api_error_fallback")
-                send_whatsapp_message(customer_number, fallback_message)
-                add_message_to_conversation(customer_number, "assistant", fallback_message)
-                return jsonify({"status": "error", "message": error_message}), 200
+            # Drop redelivered messages before doing any work for them
+            events = [
+                event for event in events
+                if event["type"] != "message" or message_deduplicator.claim(event["id"])
+            ]
+            messages_by_customer = webhook_events.group_messages_by_customer(events)
+            if not messages_by_customer:
+                return jsonify({"status": "accepted", "messages": 0}), 200
             
-            gemini_text_response = gemini_response.get("text", "")
-            if not gemini_text_response:
-                logger.error("Empty response text from Gemini")
-                fallback_message = message_templates.get_message("api_error_fallback")
-                send_whatsapp_message(customer_number, fallback_message)
-                add_message_to_conversation(customer_number, "assistant", fallback_message)
-                return jsonify({"status": "error", "message": "Empty response from Gemini"}), 200
+            # Shed load before queueing when inbound traffic exceeds the global limit
+            message_count = sum(len(messages) for messages in messages_by_customer.values())
+            allowed, retry_after = inbound_rate_limiter.check(cost=message_count)
+            if not allowed:
+                logger.warning(f"Global inbound rate limit reached, deferring {message_count} messages")
+                for messages in messages_by_customer.values():
+                    for event in messages:
+                        message_deduplicator.release(event["id"])
+                return jsonify({"status": "error", "message": "Too many requests"}), 503, {"Retry-After": str(math.ceil(retry_after))}
             
-            whatsapp_result = send_whatsapp_message(customer_number, gemini_text_response)
-            if "error" in whatsapp_result:
-                error_message = whatsapp_result["error"]
-                logger.error(f"Error sending WhatsApp message: {error_message}")
-                return jsonify({"status": "error", "message": error_message}), 200
+            # Hand each message to its customer's mailbox and acknowledge right away
+            unqueued = [event for messages in messages_by_customer.values() for event in messages]
+            for customer_number, messages in messages_by_customer.items():
+                for event in messages:
+                    if not reply_pipeline.submit(customer_number, event["text"]):
+                        # Let Meta redeliver later instead of dropping the message
+                        for pending in unqueued:
+                            message_deduplicator.release(pending["id"])
+                        return jsonify({"status": "error", "message": "Server busy"}), 503
+                    unqueued.remove(event)
+                logger.info(f"Queued {len(messages)} message(s) from {customer_number} for processing")
             
-            logger.info(f"Successfully processed message and sent response to {customer_number}")
-            return jsonify({"status": "success"}), 200
+            return jsonify({"status": "accepted", "messages": message_count}), 200
             
         except Exception as e:
             logger.error(f"Unexpected error processing webhook: {str(e)}")
@@ -1604,7 +1630,13 @@ def health_check():
         "whatsapp_configured": bool(WHATSAPP_PHONE_NUMBER_ID and WHATSAPP_API_TOKEN),
         "gemini_configured": bool(GEMINI_API_KEY),
         "bot_identity": "Meowkies - Meow Aesthetic Clinic Customer Support",
-        "active_conversations": len(conversations)
+        "active_conversations": len(conversations),
+        "reply_pipeline": reply_pipeline.stats(),
+        "webhook": webhook_stats.stats(),
+        "message_dedup": message_deduplicator.stats(),
+        "background_jobs": scheduler_jobs.scheduler_status(),
+        "state_expiry": expiry_sweeper.stats(),
+        "response_cache": faq_response_cache.stats()
     })
 
 @app.route("/conversations", methods=["GET"])
@@ -1614,7 +1646,7 @@ def conversation_stats():
         "conversations": {}
     }
     
-    for number, data in conversations.items():
+    for number, data in list(conversations.items()):
         stats["conversations"][number] = {
             "message_count": len(data["history"]),
             "last_updated": data["last_updated"].isoformat(),
@@ -1658,23 +1690,28 @@ def run_promotions():
     weekly_promotions.run_promotion_scheduler()
     return jsonify({"status": "success", "message": "Promotions checked and sent"})
 
+@app.route("/promotion-jobs", methods=["GET"])
+def promotion_jobs():
+    jobs = weekly_promotions.list_promotion_jobs(
+        status=request.args.get("status"),
+        limit=request.args.get("limit", 50, type=int)
+    )
+    return jsonify({"jobs": jobs})
+
+@app.route("/promotion-jobs/<job_id>", methods=["GET"])
+def promotion_job(job_id):
+    job = weekly_promotions.get_promotion_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Promotion job not found"}), 404
+    return jsonify(job)
+
 
 if __name__ == "__main__":
-    # Existing code
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
     logger.info("Starting Meowkies WhatsApp Customer Support Chatbot")
     
-    # Add scheduler for promotions
-    from apscheduler.schedulers.background import BackgroundScheduler
-    from apscheduler.triggers.interval import IntervalTrigger
-    
-    promotion_scheduler = BackgroundScheduler()
-    promotion_scheduler.add_job(
-        func=weekly_promotions.run_promotion_scheduler,
-        trigger=IntervalTrigger(minutes=1),
-        id='promotion_scheduler',
-        name='Check and send scheduled promotions every minute'
-    )
-    promotion_scheduler.start()
+    # Reminders, cleanup and promotions run in one process per host
+    scheduler_jobs.start_background_jobs()
     
     # Run the Flask app
     app.run(debug=False, host="0.0.0.0", port=int(os.getenv("PORT", 8080)))
@@ -1,11 +1,15 @@
 import os
+import time
+import heapq
 import logging
-import json
-import requests
+import threading
 from datetime import datetime, timedelta
 import pytz
 from dotenv import load_dotenv
 import message_templates
+import http_client
+import rate_limiter
+import database
 
 # Configure logging
 logging.basicConfig(
@@ -23,33 +27,10 @@ WHATSAPP_API_TOKEN = os.getenv("WHATSAPP_API_TOKEN")
 WHATSAPP_API_URL = f"https://graph.facebook.com/v22.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
 CLINIC_TIMEZONE = pytz.timezone("Asia/Singapore")  # Set timezone for the clinic
 
-# File to store scheduled reminders
-REMINDERS_FILE = "appointment_reminders.json"
-
-def load_reminders():
-    """Load the scheduled reminders from file"""
-    try:
-        if os.path.exists(REMINDERS_FILE):
-            with open(REMINDERS_FILE, 'r') as file:
-                return json.load(file)
-        else:
-            reminders = {"reminders": []}
-            with open(REMINDERS_FILE, 'w') as file:
-                json.dump(reminders, file, indent=4)
-            return reminders
-    except Exception as e:
-        logger.error(f"Error loading reminders: {str(e)}")
-        return {"reminders": []}
-
-def save_reminders(reminders):
-    """Save reminders to file"""
-    try:
-        with open(REMINDERS_FILE, 'w') as file:
-            json.dump(reminders, file, indent=4)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving reminders: {str(e)}")
-        return False
+# The scheduler reloads pending reminders when another connection has written to
+# the database, checking at most this often, to pick up reminders booked by other workers
+REMINDER_RESYNC_SECONDS = float(os.getenv("REMINDER_RESYNC_SECONDS", "60"))
+REMINDER_RETRY_SECONDS = float(os.getenv("REMINDER_RETRY_SECONDS", "60"))  # delay before retrying a failed send
 
 def schedule_appointment_reminder(appointment_id, customer_name, customer_number, 
                                  treatment_type, appointment_time):
@@ -75,10 +56,15 @@ def schedule_appointment_reminder(appointment_id, customer_name, customer_number
         "created_at": datetime.now(CLINIC_TIMEZONE).isoformat()
     }
     
-    # Add to reminders file
-    reminders = load_reminders()
-    reminders["reminders"].append(reminder)
-    save_reminders(reminders)
+    # Store the reminder as a single row
+    reminder_id = database.insert_reminder(reminder)
+    if reminder_id is None:
+        logger.info(f"Reminder for appointment {appointment_id} at {send_time} is already scheduled")
+        return reminder
+    reminder["id"] = reminder_id
+    
+    # Wake the scheduler if it runs in this process and the new reminder is due first
+    reminder_scheduler.add(reminder)
     
     logger.info(f"Scheduled appointment reminder for {customer_name} at {send_time}")
     return reminder
@@ -110,12 +96,15 @@ def send_appointment_reminder(reminder):
             }
         }
         
+        # Stay within WhatsApp's send caps, the reminder is retried on the next check otherwise
+        if not rate_limiter.acquire_whatsapp_send(reminder["customer_number"]):
+            return False
+        
         # Send the request
-        response = requests.post(
+        response = http_client.post(
             WHATSAPP_API_URL,
             headers=headers,
-            json=message_data,
-            timeout=30
+            json=message_data
         )
         
         if response.status_code != 200:
@@ -130,41 +119,173 @@ def send_appointment_reminder(reminder):
         return False
 
 def check_and_send_reminders():
-    """Check for reminders that need to be sent and send them"""
-    reminders = load_reminders()
+    """Check for reminders that need to be sent and send them (full pass, for manual runs)"""
     current_time = datetime.now(CLINIC_TIMEZONE)
     
-    for reminder in reminders["reminders"]:
-        if reminder["sent"]:
-            continue
-            
-        send_time = datetime.fromisoformat(reminder["send_time"])
-        # Send if it's time (within the last minute)
-        if send_time <= current_time:
-            logger.info(f"Sending reminder for appointment {reminder['appointment_id']}")
-            success = send_appointment_reminder(reminder)
-            
-            if success:
-                # Mark as sent
-                reminder["sent"] = True
-                reminder["sent_at"] = current_time.isoformat()
+    sent_ids = []
+    for reminder in database.pending_reminders(due_before=current_time.timestamp()):
+        logger.info(f"Sending reminder for appointment {reminder['appointment_id']}")
+        if send_appointment_reminder(reminder):
+            sent_ids.append(reminder["id"])
     
-    # Save updated reminders
-    save_reminders(reminders)
+    database.mark_reminders_sent(sent_ids, current_time)
+    reminder_scheduler.discard(sent_ids)
 
 def cleanup_old_reminders():
     """Remove reminders for appointments that have passed (older than 7 days)"""
-    reminders = load_reminders()
-    current_time = datetime.now(CLINIC_TIMEZONE)
-    cutoff_time = current_time - timedelta(days=7)
-    
-    new_reminders = []
-    for reminder in reminders["reminders"]:
-        appointment_time = datetime.fromisoformat(reminder["appointment_time"])
-        if appointment_time > cutoff_time:
-            new_reminders.append(reminder)
-    
-    if len(new_reminders) < len(reminders["reminders"]):
-        reminders["reminders"] = new_reminders
-        save_reminders(reminders)
-        logger.info(f"Cleaned up {len(reminders['reminders']) - len(new_reminders)} old reminders")
+    cutoff_time = datetime.now(CLINIC_TIMEZONE) - timedelta(days=7)
+    removed = database.delete_reminders_before(cutoff_time)
+    if removed:
+        logger.info(f"Cleaned up {removed} old reminders")
+
+
+class ReminderScheduler:
+    """
+    Sends appointment reminders from a min-heap ordered by send time.
+
+    A single thread sleeps until the earliest reminder is due, or until add()
+    schedules an earlier one. Unsent reminders are loaded from the database at
+    start and reloaded only when PRAGMA data_version shows another connection
+    has written (checked every REMINDER_RESYNC_SECONDS), so idle ticks read nothing.
+    """
+
+    def __init__(self, resync_interval=REMINDER_RESYNC_SECONDS, retry_delay=REMINDER_RETRY_SECONDS):
+        self.resync_interval = resync_interval
+        self.retry_delay = retry_delay
+        self._heap = []  # (send_at epoch, key)
+        self._pending = {}  # Structure: { reminder id: reminder }, unsent reminders in the heap
+        self._condition = threading.Condition()
+        self._data_version = None
+        self._thread = None
+        self._started_pid = None
+
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.resyncs = 0
+
+    def start(self):
+        """Load unsent reminders and start the scheduler thread (once per process)"""
+        with self._condition:
+            if self._started_pid == os.getpid():
+                return
+            self._heap = []
+            self._pending = {}
+            # data_version is per connection, so every load happens on the scheduler thread
+            self._data_version = None
+            self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+            self._thread.start()
+            self._started_pid = os.getpid()
+        logger.info("Started reminder scheduler")
+
+    @property
+    def running(self):
+        return self._started_pid == os.getpid()
+
+    def add(self, reminder):
+        """Schedule a reminder, waking the thread if it is now the earliest one"""
+        if not self.running or reminder.get("sent"):
+            return
+        with self._condition:
+            if self._push(reminder):
+                self._condition.notify()
+
+    def discard(self, keys):
+        """Forget reminders that were sent elsewhere"""
+        with self._condition:
+            for key in keys:
+                self._pending.pop(key, None)
+
+    def _push(self, reminder, send_at=None):
+        key = reminder["id"]
+        if key in self._pending and send_at is None:
+            return False
+        if send_at is None:
+            send_at = datetime.fromisoformat(reminder["send_time"]).timestamp()
+        self._pending[key] = reminder
+        heapq.heappush(self._heap, (send_at, key))
+        return True
+
+    def _resync(self):
+        """Reload unsent reminders if another connection wrote to the database since the last load"""
+        version = database.data_version()
+        if version == self._data_version:
+            return
+        reminders = database.pending_reminders()
+        self._data_version = version
+        self.resyncs += 1
+        stored_ids = set()
+        for reminder in reminders:
+            stored_ids.add(reminder["id"])
+            self._push(reminder)
+        # Reminders that were deleted or marked sent elsewhere are dropped
+        for key in list(self._pending):
+            if key not in stored_ids:
+                del self._pending[key]
+
+    def _next_due(self):
+        """Pop the next due reminder, or return the seconds until one is due"""
+        while self._heap:
+            send_at, key = self._heap[0]
+            if key not in self._pending:
+                heapq.heappop(self._heap)
+                continue
+            wait = send_at - time.time()
+            if wait > 0:
+                return None, wait
+            heapq.heappop(self._heap)
+            return self._pending.pop(key), 0
+        return None, None
+
+    def _run(self):
+        next_resync = time.monotonic()
+        while True:
+            with self._condition:
+                while True:
+                    if time.monotonic() >= next_resync:
+                        self._resync()
+                        next_resync = time.monotonic() + self.resync_interval
+                    reminder, wait = self._next_due()
+                    if reminder is not None:
+                        break
+                    until_resync = max(0.0, next_resync - time.monotonic())
+                    self._condition.wait(until_resync if wait is None else min(wait, until_resync))
+            self._deliver(reminder)
+
+    def _deliver(self, reminder):
+        logger.info(f"Sending reminder for appointment {reminder['appointment_id']}")
+        try:
+            success = send_appointment_reminder(reminder)
+        except Exception as e:
+            logger.error(f"Error sending reminder: {str(e)}")
+            success = False
+        if success:
+            self.sent += 1
+            try:
+                database.mark_reminders_sent([reminder["id"]], datetime.now(CLINIC_TIMEZONE))
+            except Exception as e:
+                logger.error(f"Could not record sent reminder: {str(e)}")
+            return
+        self.failed += 1
+        with self._condition:
+            self._push(reminder, send_at=time.time() + self.retry_delay)
+
+    def stats(self):
+        """Return queue size and counters for the health endpoint"""
+        with self._condition:
+            next_send = None
+            for send_at, key in self._heap:
+                if key in self._pending and (next_send is None or send_at < next_send):
+                    next_send = send_at
+            return {
+                "running": self.running,
+                "pending": len(self._pending),
+                "next_send_in_s": round(next_send - time.time(), 1) if next_send else None,
+                "sent": self.sent,
+                "failed": self.failed,
+                "resyncs": self.resyncs,
+            }
+
+
+# Started by scheduler_jobs in the one process per host that runs background jobs
+reminder_scheduler = ReminderScheduler()
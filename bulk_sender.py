@@ -0,0 +1,99 @@
+import os
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import rate_limiter
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Bulk send settings ---
+BULK_SEND_CONCURRENCY = int(os.getenv("BULK_SEND_CONCURRENCY", "16"))
+BULK_SEND_MAX_RETRIES = int(os.getenv("BULK_SEND_MAX_RETRIES", "4"))
+BULK_SEND_BACKOFF_BASE = float(os.getenv("BULK_SEND_BACKOFF_BASE", "1.0"))  # seconds
+BULK_SEND_BACKOFF_MAX = float(os.getenv("BULK_SEND_BACKOFF_MAX", "30"))  # seconds
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class BulkSender:
+    """
+    Sends one message per recipient through a bounded thread pool.
+
+    Every send waits on the process-wide WhatsApp limiters, so a blast shares the
+    throughput tier with live replies, and 429/5xx responses (or network errors) are retried with
+    exponential backoff and full jitter.
+
+    send_func(recipient) must return a dict with "success", "status_code",
+    "error" and optionally "retry_after" (seconds) and "retryable" (to override
+    the status-code based decision).
+
+    on_outcome(recipient, outcome), if given, is called from the worker thread as
+    soon as each recipient's final outcome is known, so callers can checkpoint
+    progress before the whole blast finishes.
+    """
+
+    def __init__(self, send_func, concurrency=BULK_SEND_CONCURRENCY, max_retries=BULK_SEND_MAX_RETRIES, on_outcome=None):
+        self.send_func = send_func
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.on_outcome = on_outcome
+
+    def send_all(self, recipients):
+        """
+        Send to every recipient and return one outcome dict per recipient, in order:
+        {"phone_number", "success", "status_code", "attempts", "error"}
+        """
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bulk-send") as executor:
+            outcomes = list(executor.map(self._send_and_report, recipients))
+        succeeded = sum(1 for outcome in outcomes if outcome["success"])
+        logger.info(f"Bulk send finished: {succeeded}/{len(outcomes)} delivered in {time.monotonic() - started:.1f}s")
+        return outcomes
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than a server-supplied Retry-After"""
+        delay = random.uniform(0, min(BULK_SEND_BACKOFF_MAX, BULK_SEND_BACKOFF_BASE * (2 ** attempt)))
+        return max(delay, retry_after or 0.0)
+
+    def _send_and_report(self, recipient):
+        outcome = self._send_with_retry(recipient)
+        if self.on_outcome is not None:
+            try:
+                self.on_outcome(recipient, outcome)
+            except Exception as e:
+                logger.error(f"Error recording outcome for {recipient.get('phone_number')}: {str(e)}")
+        return outcome
+
+    def _send_with_retry(self, recipient):
+        attempt = 0
+        while True:
+            if not rate_limiter.acquire_whatsapp_send(recipient.get("phone_number")):
+                result = {"success": False, "status_code": 429, "error": "Local send rate limit wait exceeded"}
+            else:
+                try:
+                    result = self.send_func(recipient)
+                except Exception as e:
+                    result = {"success": False, "status_code": None, "error": str(e)}
+            attempt += 1
+
+            status_code = result.get("status_code")
+            retryable = result.get("retryable", status_code is None or status_code in RETRYABLE_STATUS_CODES)
+            if result.get("success") or not retryable or attempt > self.max_retries:
+                return {
+                    "phone_number": recipient.get("phone_number"),
+                    "success": bool(result.get("success")),
+                    "status_code": status_code,
+                    "attempts": attempt,
+                    "error": result.get("error")
+                }
+
+            delay = self._backoff(attempt - 1, result.get("retry_after"))
+            logger.warning(f"Retrying {recipient.get('phone_number')} in {delay:.1f}s after status {status_code} (attempt {attempt})")
+            time.sleep(delay)
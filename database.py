@@ -0,0 +1,726 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytz
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Database settings ---
+DATABASE_PATH = os.getenv("DATABASE_PATH", "meowkies.db")  # SQLite file for reminders and promotions
+DATABASE_TIMEOUT = float(os.getenv("DATABASE_TIMEOUT", "30"))  # seconds to wait for a write lock
+SENT_PROMOTIONS_RETENTION_DAYS = int(os.getenv("SENT_PROMOTIONS_RETENTION_DAYS", "180"))
+PROMOTION_JOB_RETENTION_DAYS = int(os.getenv("PROMOTION_JOB_RETENTION_DAYS", "30"))  # finished blasts and their per-recipient rows
+CLINIC_TIMEZONE = pytz.timezone("Asia/Singapore")  # Set timezone for the clinic
+
+# JSON files used before the database, imported once by migrate_json_files()
+REMINDERS_JSON = "appointment_reminders.json"
+RECIPIENTS_JSON = "promotion_recipients.json"
+SCHEDULE_JSON = "promotion_schedule.json"
+SENT_LOG_JSON = "sent_promotions.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    appointment_id TEXT NOT NULL,
+    customer_name TEXT,
+    customer_number TEXT NOT NULL,
+    treatment_type TEXT,
+    appointment_time TEXT NOT NULL,
+    appointment_at REAL NOT NULL,
+    send_time TEXT NOT NULL,
+    send_at REAL NOT NULL,
+    sent INTEGER NOT NULL DEFAULT 0,
+    sent_at TEXT,
+    created_at TEXT NOT NULL,
+    UNIQUE (appointment_id, send_time)
+);
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (sent, send_at);
+CREATE INDEX IF NOT EXISTS idx_reminders_appointment_at ON reminders (appointment_at);
+
+CREATE TABLE IF NOT EXISTS promotion_recipients (
+    phone_number TEXT PRIMARY KEY,
+    name TEXT,
+    preferences TEXT NOT NULL,
+    opt_in INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipients_opt_in ON promotion_recipients (opt_in);
+
+CREATE TABLE IF NOT EXISTS weekly_promotions (
+    id TEXT PRIMARY KEY,
+    day_of_week INTEGER NOT NULL,
+    time TEXT NOT NULL,
+    template_name TEXT NOT NULL,
+    template_parameters TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL,
+    last_fired_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_promotions_slot ON weekly_promotions (active, day_of_week, time);
+
+CREATE TABLE IF NOT EXISTS sent_promotions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    promotion_id TEXT NOT NULL,
+    template_name TEXT,
+    sent_at TEXT NOT NULL,
+    sent_at_ts REAL NOT NULL,
+    recipient_count INTEGER NOT NULL DEFAULT 0,
+    success_count INTEGER NOT NULL DEFAULT 0,
+    failure_count INTEGER NOT NULL DEFAULT 0,
+    failures TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS idx_sent_promotions_promotion ON sent_promotions (promotion_id, sent_at_ts);
+CREATE INDEX IF NOT EXISTS idx_sent_promotions_sent_at ON sent_promotions (sent_at_ts);
+
+CREATE TABLE IF NOT EXISTS promotion_jobs (
+    id TEXT PRIMARY KEY,
+    promotion_id TEXT NOT NULL,
+    template_name TEXT,
+    fire_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    cursor INTEGER NOT NULL DEFAULT 0,
+    recipient_count INTEGER NOT NULL DEFAULT 0,
+    success_count INTEGER NOT NULL DEFAULT 0,
+    failure_count INTEGER NOT NULL DEFAULT 0,
+    unknown_count INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    heartbeat_at REAL,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_promotion_jobs_status ON promotion_jobs (status, heartbeat_at);
+CREATE INDEX IF NOT EXISTS idx_promotion_jobs_fire_at ON promotion_jobs (fire_at);
+
+CREATE TABLE IF NOT EXISTS promotion_job_recipients (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    phone_number TEXT NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status_code INTEGER,
+    error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (job_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_job_recipients_status ON promotion_job_recipients (job_id, status);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()  # database paths whose schema exists in this process
+
+
+def get_connection():
+    """
+    One connection per thread and process, in autocommit mode.
+
+    The schema is created (and the JSON files migrated) the first time a process
+    opens the database.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == DATABASE_PATH:
+        return conn
+    conn = sqlite3.connect(DATABASE_PATH, timeout=DATABASE_TIMEOUT, isolation_level=None)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if DATABASE_PATH not in _initialized:
+                conn.executescript(SCHEMA)
+                _add_missing_columns(conn)
+                migrate_json_files(conn)
+                _initialized.add(DATABASE_PATH)
+    except Exception:
+        # Not cached, so the next call retries the schema/migration on a fresh connection
+        conn.close()
+        raise
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.path = DATABASE_PATH
+    return conn
+
+
+# Columns added after a table was first released: { table: [(column, definition), ...] }
+ADDED_COLUMNS = {
+    "weekly_promotions": [("last_fired_at", "REAL")],
+}
+
+
+def _add_missing_columns(conn):
+    """Bring tables created by an older release up to SCHEMA"""
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                logger.info(f"Added column {table}.{column}")
+
+
+@contextmanager
+def transaction():
+    """Run a block as one write transaction, yielding the connection"""
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def data_version():
+    """
+    Counter that changes whenever another connection commits to the database.
+
+    Lets pollers skip reloading when nothing was written since they last looked.
+    """
+    return get_connection().execute("PRAGMA data_version").fetchone()[0]
+
+
+def get_meta(key):
+    row = get_connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def set_meta(key, value):
+    get_connection().execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+
+
+def get_version(name):
+    """Change counter for a group of tables, bumped by every write to them"""
+    row = get_connection().execute("SELECT value FROM meta WHERE key = ?", (f"version:{name}",)).fetchone()
+    return int(row["value"]) if row else 0
+
+
+def bump_version(name, conn):
+    """Increment a change counter inside the caller's write transaction, returning the new value"""
+    conn.execute(
+        """
+        INSERT INTO meta (key, value) VALUES (?, '1')
+        ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """,
+        (f"version:{name}",)
+    )
+    return int(conn.execute("SELECT value FROM meta WHERE key = ?", (f"version:{name}",)).fetchone()["value"])
+
+
+def _timestamp(iso_string):
+    """Epoch seconds for an ISO-8601 time; naive times are taken as clinic time"""
+    value = datetime.fromisoformat(iso_string)
+    if value.tzinfo is None:
+        value = CLINIC_TIMEZONE.localize(value)
+    return value.timestamp()
+
+
+# --- Reminders ---
+def _reminder_from_row(row):
+    reminder = dict(row)
+    reminder["sent"] = bool(reminder["sent"])
+    if reminder["sent_at"] is None:
+        del reminder["sent_at"]
+    del reminder["appointment_at"]
+    del reminder["send_at"]
+    return reminder
+
+
+def insert_reminder(reminder, conn=None):
+    """Store a reminder and return its row id, or None if it was already stored"""
+    conn = conn or get_connection()
+    cursor = conn.execute(
+        """
+        INSERT OR IGNORE INTO reminders (
+            appointment_id, customer_name, customer_number, treatment_type,
+            appointment_time, appointment_at, send_time, send_at, sent, sent_at, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            reminder["appointment_id"], reminder.get("customer_name"), reminder["customer_number"],
+            reminder.get("treatment_type"), reminder["appointment_time"], _timestamp(reminder["appointment_time"]),
+            reminder["send_time"], _timestamp(reminder["send_time"]), int(bool(reminder.get("sent"))),
+            reminder.get("sent_at"), reminder.get("created_at") or datetime.now(CLINIC_TIMEZONE).isoformat()
+        )
+    )
+    return cursor.lastrowid if cursor.rowcount == 1 else None
+
+
+def pending_reminders(due_before=None):
+    """Unsent reminders ordered by send time, optionally only those due by an epoch time"""
+    if due_before is None:
+        rows = get_connection().execute(
+            "SELECT * FROM reminders WHERE sent = 0 ORDER BY send_at"
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            "SELECT * FROM reminders WHERE sent = 0 AND send_at <= ? ORDER BY send_at", (due_before,)
+        ).fetchall()
+    return [_reminder_from_row(row) for row in rows]
+
+
+def mark_reminders_sent(reminder_ids, sent_at):
+    """Flag reminders as sent, returning how many rows changed"""
+    reminder_ids = list(reminder_ids)
+    if not reminder_ids:
+        return 0
+    placeholders = ",".join("?" for _ in reminder_ids)
+    cursor = get_connection().execute(
+        f"UPDATE reminders SET sent = 1, sent_at = ? WHERE sent = 0 AND id IN ({placeholders})",
+        [sent_at.isoformat()] + reminder_ids
+    )
+    return cursor.rowcount
+
+
+def delete_reminders_before(cutoff):
+    """Delete reminders for appointments before a datetime, returning how many were removed"""
+    cursor = get_connection().execute(
+        "DELETE FROM reminders WHERE appointment_at < ?", (cutoff.timestamp(),)
+    )
+    return cursor.rowcount
+
+
+# --- Promotion recipients ---
+def _recipient_from_row(row):
+    recipient = dict(row)
+    recipient["preferences"] = json.loads(recipient["preferences"])
+    del recipient["opt_in"]
+    return recipient
+
+
+def upsert_recipient(recipient, conn=None):
+    """Insert a recipient or update the name and preferences of an existing one"""
+    conn = conn or get_connection()
+    preferences = recipient.get("preferences") or {}
+    now = datetime.now(CLINIC_TIMEZONE).isoformat()
+    conn.execute(
+        """
+        INSERT INTO promotion_recipients (phone_number, name, preferences, opt_in, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (phone_number) DO UPDATE SET
+            name = excluded.name,
+            preferences = excluded.preferences,
+            opt_in = excluded.opt_in,
+            updated_at = excluded.updated_at
+        """,
+        (
+            recipient["phone_number"], recipient.get("name"), json.dumps(preferences),
+            int(bool(preferences.get("opt_in", True))),
+            recipient.get("created_at") or now, recipient.get("updated_at") or now
+        )
+    )
+
+
+def get_recipient(phone_number):
+    row = get_connection().execute(
+        "SELECT * FROM promotion_recipients WHERE phone_number = ?", (phone_number,)
+    ).fetchone()
+    return _recipient_from_row(row) if row else None
+
+
+def all_recipients():
+    rows = get_connection().execute("SELECT * FROM promotion_recipients ORDER BY created_at").fetchall()
+    return [_recipient_from_row(row) for row in rows]
+
+
+def opted_in_recipients():
+    rows = get_connection().execute(
+        "SELECT * FROM promotion_recipients WHERE opt_in = 1 ORDER BY created_at"
+    ).fetchall()
+    return [_recipient_from_row(row) for row in rows]
+
+
+# --- Weekly promotions ---
+def _promotion_from_row(row):
+    promotion = dict(row)
+    promotion["template_parameters"] = json.loads(promotion["template_parameters"])
+    promotion["active"] = bool(promotion["active"])
+    return promotion
+
+
+def insert_promotion(promotion, conn=None):
+    conn = conn or get_connection()
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO weekly_promotions
+            (id, day_of_week, time, template_name, template_parameters, active, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            promotion["id"], promotion["day_of_week"], promotion["time"], promotion["template_name"],
+            json.dumps(promotion.get("template_parameters") or {}), int(bool(promotion.get("active", True))),
+            promotion.get("created_at") or datetime.now(CLINIC_TIMEZONE).isoformat()
+        )
+    )
+
+
+def get_promotion(promotion_id):
+    row = get_connection().execute("SELECT * FROM weekly_promotions WHERE id = ?", (promotion_id,)).fetchone()
+    return _promotion_from_row(row) if row else None
+
+
+def active_promotions(day_of_week=None):
+    """Active weekly promotions, optionally only those on one weekday"""
+    if day_of_week is None:
+        rows = get_connection().execute(
+            "SELECT * FROM weekly_promotions WHERE active = 1 ORDER BY day_of_week, time"
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            "SELECT * FROM weekly_promotions WHERE active = 1 AND day_of_week = ? ORDER BY time", (day_of_week,)
+        ).fetchall()
+    return [_promotion_from_row(row) for row in rows]
+
+
+def claim_promotion_firing(promotion_id, fire_at, conn=None):
+    """
+    Record that a promotion's occurrence at fire_at (epoch seconds) is being handled.
+
+    The watermark only moves forward, so of several processes racing for the same
+    occurrence exactly one gets True.
+    """
+    conn = conn or get_connection()
+    cursor = conn.execute(
+        """
+        UPDATE weekly_promotions SET last_fired_at = ?
+        WHERE id = ? AND active = 1 AND (last_fired_at IS NULL OR last_fired_at < ?)
+        """,
+        (fire_at, promotion_id, fire_at)
+    )
+    return cursor.rowcount == 1
+
+
+# --- Sent promotion log ---
+def insert_sent_promotion(entry, conn=None):
+    conn = conn or get_connection()
+    conn.execute(
+        """
+        INSERT INTO sent_promotions (
+            promotion_id, template_name, sent_at, sent_at_ts,
+            recipient_count, success_count, failure_count, failures
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            entry["promotion_id"], entry.get("template_name"), entry["sent_at"], _timestamp(entry["sent_at"]),
+            entry.get("recipient_count", 0), entry.get("success_count", 0), entry.get("failure_count", 0),
+            json.dumps(entry.get("failures", []))
+        )
+    )
+
+
+def sent_promotions(promotion_id, limit=50):
+    """Most recent send log entries for a promotion"""
+    rows = get_connection().execute(
+        "SELECT * FROM sent_promotions WHERE promotion_id = ? ORDER BY sent_at_ts DESC LIMIT ?",
+        (promotion_id, limit)
+    ).fetchall()
+    result = []
+    for row in rows:
+        entry = dict(row)
+        entry["failures"] = json.loads(entry["failures"])
+        del entry["sent_at_ts"]
+        result.append(entry)
+    return result
+
+
+def prune_sent_promotions(retention_days=SENT_PROMOTIONS_RETENTION_DAYS):
+    """Drop send log entries older than the retention period, returning how many were removed"""
+    cutoff = datetime.now(CLINIC_TIMEZONE) - timedelta(days=retention_days)
+    cursor = get_connection().execute(
+        "DELETE FROM sent_promotions WHERE sent_at_ts < ?", (cutoff.timestamp(),)
+    )
+    return cursor.rowcount
+
+
+# --- Promotion blast jobs ---
+# A job is one occurrence of a promotion sent to a snapshot of the recipients.
+# Job status: running -> completed. Recipient status: pending -> sending -> sent | failed,
+# or unknown when the process died while the send was in flight.
+def insert_promotion_job(job, recipients, conn=None):
+    """Create a job and its recipient rows, in recipient order"""
+    conn = conn or get_connection()
+    conn.execute(
+        """
+        INSERT INTO promotion_jobs (
+            id, promotion_id, template_name, fire_at, recipient_count, owner, heartbeat_at, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            job["id"], job["promotion_id"], job.get("template_name"), job["fire_at"], len(recipients),
+            job.get("owner"), job.get("heartbeat_at"), job.get("created_at") or datetime.now(CLINIC_TIMEZONE).isoformat()
+        )
+    )
+    conn.executemany(
+        "INSERT INTO promotion_job_recipients (job_id, position, phone_number, name) VALUES (?, ?, ?, ?)",
+        [
+            (job["id"], position, recipient["phone_number"], recipient.get("name"))
+            for position, recipient in enumerate(recipients)
+        ]
+    )
+
+
+def get_promotion_job(job_id):
+    row = get_connection().execute("SELECT * FROM promotion_jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def promotion_jobs(status=None, limit=50):
+    """Most recent jobs first, optionally only those with one status"""
+    if status is None:
+        rows = get_connection().execute(
+            "SELECT * FROM promotion_jobs ORDER BY fire_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            "SELECT * FROM promotion_jobs WHERE status = ? ORDER BY fire_at DESC LIMIT ?", (status, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def claim_promotion_job(job_id, owner, stale_before):
+    """
+    Take over a running job whose owner stopped sending heartbeats.
+
+    When the owner changes, sends that were in flight for the previous owner are
+    marked unknown rather than repeated. Returns True if this caller now owns the job.
+    """
+    with transaction() as conn:
+        cursor = conn.execute(
+            """
+            UPDATE promotion_jobs SET owner = ?, heartbeat_at = ?
+            WHERE id = ? AND status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+            """,
+            (owner, datetime.now(CLINIC_TIMEZONE).timestamp(), job_id, stale_before)
+        )
+        if cursor.rowcount != 1:
+            return False
+        unknown = conn.execute(
+            "UPDATE promotion_job_recipients SET status = 'unknown' WHERE job_id = ? AND status = 'sending'",
+            (job_id,)
+        ).rowcount
+        if unknown:
+            conn.execute(
+                "UPDATE promotion_jobs SET unknown_count = unknown_count + ? WHERE id = ?", (unknown, job_id)
+            )
+    return True
+
+
+def stale_promotion_jobs(stale_before):
+    """Ids of running jobs whose owner has not sent a heartbeat since stale_before"""
+    rows = get_connection().execute(
+        """
+        SELECT id FROM promotion_jobs
+        WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+        ORDER BY fire_at
+        """,
+        (stale_before,)
+    ).fetchall()
+    return [row["id"] for row in rows]
+
+
+def pending_job_recipients(job_id, cursor, limit):
+    """The next batch of unsent recipients at or after the cursor position"""
+    rows = get_connection().execute(
+        """
+        SELECT * FROM promotion_job_recipients
+        WHERE job_id = ? AND position >= ? AND status = 'pending'
+        ORDER BY position LIMIT ?
+        """,
+        (job_id, cursor, limit)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def touch_promotion_job(job_id, owner):
+    """Refresh the job heartbeat; False if another process has taken the job over"""
+    cursor = get_connection().execute(
+        "UPDATE promotion_jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+        (datetime.now(CLINIC_TIMEZONE).timestamp(), job_id, owner)
+    )
+    return cursor.rowcount == 1
+
+
+def mark_job_recipient_sending(job_id, position):
+    """Flag a recipient as in flight just before the WhatsApp call"""
+    get_connection().execute(
+        "UPDATE promotion_job_recipients SET status = 'sending', updated_at = ? WHERE job_id = ? AND position = ?",
+        (datetime.now(CLINIC_TIMEZONE).timestamp(), job_id, position)
+    )
+
+
+def record_job_recipient(job_id, position, outcome):
+    """Checkpoint one recipient's final outcome and bump the job counters and heartbeat"""
+    now = datetime.now(CLINIC_TIMEZONE).timestamp()
+    succeeded = bool(outcome["success"])
+    with transaction() as conn:
+        conn.execute(
+            """
+            UPDATE promotion_job_recipients
+            SET status = ?, attempts = ?, status_code = ?, error = ?, updated_at = ?
+            WHERE job_id = ? AND position = ?
+            """,
+            (
+                "sent" if succeeded else "failed", outcome.get("attempts", 0), outcome.get("status_code"),
+                outcome.get("error"), now, job_id, position
+            )
+        )
+        conn.execute(
+            """
+            UPDATE promotion_jobs
+            SET success_count = success_count + ?, failure_count = failure_count + ?, heartbeat_at = ?
+            WHERE id = ?
+            """,
+            (int(succeeded), int(not succeeded), now, job_id)
+        )
+
+
+def advance_job_cursor(job_id, cursor):
+    get_connection().execute(
+        "UPDATE promotion_jobs SET cursor = MAX(cursor, ?) WHERE id = ?", (cursor, job_id)
+    )
+
+
+def finish_promotion_job(job_id, owner):
+    """Mark a job completed; False if another process had taken it over"""
+    cursor = get_connection().execute(
+        """
+        UPDATE promotion_jobs SET status = 'completed', finished_at = ?
+        WHERE id = ? AND owner = ? AND status = 'running'
+        """,
+        (datetime.now(CLINIC_TIMEZONE).isoformat(), job_id, owner)
+    )
+    return cursor.rowcount == 1
+
+
+def job_recipient_counts(job_id):
+    """Structure: { status: count } for one job"""
+    rows = get_connection().execute(
+        "SELECT status, COUNT(*) AS count FROM promotion_job_recipients WHERE job_id = ? GROUP BY status",
+        (job_id,)
+    ).fetchall()
+    return {row["status"]: row["count"] for row in rows}
+
+
+def job_recipients(job_id, status=None, limit=None):
+    """Recipient rows of a job in send order, optionally only those with one status"""
+    query = "SELECT * FROM promotion_job_recipients WHERE job_id = ?"
+    params = [job_id]
+    if status is not None:
+        query += " AND status = ?"
+        params.append(status)
+    query += " ORDER BY position"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return [dict(row) for row in get_connection().execute(query, params).fetchall()]
+
+
+def prune_promotion_jobs(retention_days=PROMOTION_JOB_RETENTION_DAYS):
+    """Drop finished jobs older than the retention period with their recipient rows"""
+    cutoff = datetime.now(CLINIC_TIMEZONE) - timedelta(days=retention_days)
+    with transaction() as conn:
+        conn.execute(
+            """
+            DELETE FROM promotion_job_recipients WHERE job_id IN (
+                SELECT id FROM promotion_jobs WHERE status = 'completed' AND fire_at < ?
+            )
+            """,
+            (cutoff.timestamp(),)
+        )
+        cursor = conn.execute(
+            "DELETE FROM promotion_jobs WHERE status = 'completed' AND fire_at < ?", (cutoff.timestamp(),)
+        )
+    return cursor.rowcount
+
+
+# --- One-shot migration from the JSON files ---
+def _read_json(filename, key):
+    if not os.path.exists(filename):
+        return []
+    try:
+        with open(filename, 'r') as file:
+            return json.load(file).get(key, [])
+    except Exception as e:
+        logger.error(f"Could not read {filename} for migration: {str(e)}")
+        raise
+
+
+def migrate_json_files(conn):
+    """
+    Import the legacy JSON files into the database once.
+
+    Runs in a single transaction and records completion in the meta table, so a
+    failed import is retried on the next start and a finished one never repeats.
+    The JSON files are left in place but no longer read or written.
+    """
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            conn.execute("ROLLBACK")
+            return
+        counts = {}
+        reminders = _read_json(REMINDERS_JSON, "reminders")
+        for reminder in reminders:
+            insert_reminder(reminder, conn)
+        counts["reminders"] = len(reminders)
+
+        recipients = _read_json(RECIPIENTS_JSON, "recipients")
+        for recipient in recipients:
+            upsert_recipient(recipient, conn)
+        counts["recipients"] = len(recipients)
+
+        promotions = _read_json(SCHEDULE_JSON, "weekly_promotions")
+        for promotion in promotions:
+            insert_promotion(promotion, conn)
+        counts["promotions"] = len(promotions)
+
+        sent_log = _read_json(SENT_LOG_JSON, "sent_promotions")
+        for entry in sent_log:
+            insert_sent_promotion(entry, conn)
+        counts["sent_promotions"] = len(sent_log)
+        # Promotions already sent by the JSON version do not fire again for the same week
+        conn.execute(
+            """
+            UPDATE weekly_promotions SET last_fired_at = (
+                SELECT MAX(sent_at_ts) FROM sent_promotions WHERE promotion_id = weekly_promotions.id
+            )
+            """
+        )
+
+        bump_version("promotions", conn)
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+            (datetime.now(CLINIC_TIMEZONE).isoformat(),)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    logger.info(f"Migrated JSON files into {DATABASE_PATH}: {counts}")
+
+
+if __name__ == "__main__":
+    # Create the database and import the JSON files: python database.py
+    get_connection()
+    print(f"Database ready at {DATABASE_PATH}")
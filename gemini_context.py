@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import logging
+import threading
+
+import http_client
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Gemini API settings ---
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Cache the system context server-side with the cachedContents API when the model supports it
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+# Smallest context the API accepts for cachedContents (model dependent); smaller contexts are sent inline
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))  # seconds
+GEMINI_CONTEXT_CACHE_REFRESH_MARGIN = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))  # seconds before expiry
+GEMINI_CONTEXT_CACHE_RETRY = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY", "600"))  # seconds to wait after a failed create
+# Stream answers with streamGenerateContent and deliver them paragraph by paragraph
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "false").lower() == "true"
+GEMINI_STREAM_MIN_CHARS = int(os.getenv("GEMINI_STREAM_MIN_CHARS", "300"))  # batch later paragraphs up to this size
+# Log prompt and cached token counts from usageMetadata for every response
+GEMINI_LOG_TOKEN_USAGE = os.getenv("GEMINI_LOG_TOKEN_USAGE", "false").lower() == "true"
+
+
+class GeminiContextCache:
+    """
+    Supplies the system context for generateContent requests.
+
+    Uses a cachedContents handle when one exists and sends the text as
+    systemInstruction otherwise. Creating and extending the handle happens on a
+    background thread, so a request never waits on the cachedContents API; a
+    failed attempt is retried after GEMINI_CONTEXT_CACHE_RETRY. Contexts below
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS are never cached, since the API rejects them.
+    """
+
+    def __init__(self, system_text, model=GEMINI_MODEL, api_base=GEMINI_API_BASE, enabled=GEMINI_CONTEXT_CACHE,
+                 min_tokens=GEMINI_CONTEXT_CACHE_MIN_TOKENS):
+        self.system_text = system_text
+        self.model = model
+        self.api_base = api_base
+        # Same rough estimate as app.estimate_tokens
+        context_tokens = len(system_text) // 4 + 1
+        if enabled and context_tokens < min_tokens:
+            logger.info(f"Gemini context (~{context_tokens} tokens) is below the {min_tokens} token caching minimum, sending it inline")
+            enabled = False
+        self.enabled = enabled
+        self.name = None
+        self.expires_at = 0.0
+        self.retry_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def system_instruction(self):
+        return {"parts": [{"text": self.system_text}]}
+
+    def request_fields(self, api_key):
+        """Fields to merge into a generateContent body to supply the context"""
+        name = self._get_handle(api_key) if self.enabled else None
+        if name:
+            return {"cachedContent": name}
+        return {"systemInstruction": self.system_instruction()}
+
+    def invalidate(self):
+        """Forget the cache handle, e.g. after the API reports it missing"""
+        with self._lock:
+            if self.name:
+                logger.warning(f"Dropping Gemini context cache {self.name}")
+            self.name = None
+            self.expires_at = 0.0
+
+    def _get_handle(self, api_key):
+        """The current handle, or None; starts a background refresh when it is missing or about to expire"""
+        now = time.time()
+        with self._lock:
+            name, expires_at = self.name, self.expires_at
+            if name and now < expires_at - GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+                return name
+            if not self._refreshing and now >= self.retry_at:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, args=(api_key,), name="gemini-context-cache", daemon=True).start()
+        # An old handle stays usable until it actually expires
+        return name if name and now < expires_at else None
+
+    def _refresh(self, api_key):
+        """Extend the handle if it is still alive, otherwise create a new one"""
+        try:
+            if self.name and time.time() < self.expires_at and self._extend(api_key):
+                return
+            if not self._create(api_key):
+                with self._lock:
+                    self.retry_at = time.time() + GEMINI_CONTEXT_CACHE_RETRY
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _create(self, api_key):
+        body = {
+            "model": f"models/{self.model}",
+            "systemInstruction": self.system_instruction(),
+            "ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s"
+        }
+        try:
+            response = http_client.post(
+                f"{self.api_base}/cachedContents",
+                headers={"Content-Type": "application/json", "x-goog-api-key": api_key},
+                json=body
+            )
+            if response.status_code != 200:
+                logger.info(f"Gemini context caching unavailable (status {response.status_code}), using systemInstruction")
+                return False
+            name = response.json()["name"]
+            with self._lock:
+                self.name = name
+                self.expires_at = time.time() + GEMINI_CONTEXT_CACHE_TTL
+            logger.info(f"Created Gemini context cache {self.name}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not create Gemini context cache: {str(e)}")
+            return False
+
+    def _extend(self, api_key):
+        try:
+            response = http_client.patch(
+                f"{self.api_base}/{self.name}",
+                params={"updateMask": "ttl"},
+                headers={"Content-Type": "application/json", "x-goog-api-key": api_key},
+                json={"ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s"}
+            )
+            if response.status_code != 200:
+                logger.info(f"Could not extend Gemini context cache {self.name} (status {response.status_code})")
+                return False
+            with self._lock:
+                self.expires_at = time.time() + GEMINI_CONTEXT_CACHE_TTL
+            logger.debug(f"Extended Gemini context cache {self.name}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not extend Gemini context cache: {str(e)}")
+            return False
+
+
+def log_token_usage(customer_number, response_data, context_tokens):
+    """
+    Log the prompt token breakdown of a generateContent response.
+
+    context_tokens is the estimated size of the system context, for comparison
+    with the cached token count.
+    """
+    if not GEMINI_LOG_TOKEN_USAGE:
+        return
+    usage = response_data.get("usageMetadata", {})
+    prompt_tokens = usage.get("promptTokenCount", 0)
+    cached_tokens = usage.get("cachedContentTokenCount", 0)
+    logger.info(
+        f"Gemini usage for {customer_number}: prompt={prompt_tokens} cached={cached_tokens} "
+        f"uncached={prompt_tokens - cached_tokens} output={usage.get('candidatesTokenCount', 0)} "
+        f"context~{context_tokens}"
+    )
+
+
+def iter_sse_events(response):
+    """Yield the JSON payload of each `data:` line of a server-sent events response"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload:
+            yield json.loads(payload)
+
+
+def event_text(event):
+    """Concatenate the text parts of one generateContent response chunk"""
+    candidates = event.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+class ParagraphChunker:
+    """
+    Cuts streamed text into WhatsApp-sized messages at paragraph boundaries.
+
+    The first paragraph is released as soon as it is complete so the customer sees
+    a reply quickly; later paragraphs are grouped up to min_chars to avoid a burst
+    of tiny messages. Blank lines inside ``` blocks are never treated as boundaries.
+    """
+
+    def __init__(self, min_chars=GEMINI_STREAM_MIN_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+        self.pending = ""
+        self.released = 0
+
+    def feed(self, text):
+        """Add streamed text and return any messages that are ready to send"""
+        self.buffer += text
+        ready = []
+        while True:
+            cut = self._find_boundary()
+            if cut is None:
+                break
+            paragraph, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:].lstrip("\n")
+            if not paragraph:
+                continue
+            self.pending = f"{self.pending}\n\n{paragraph}" if self.pending else paragraph
+            if self.released == 0 or len(self.pending) >= self.min_chars:
+                ready.append(self.pending)
+                self.pending = ""
+                self.released += 1
+        return ready
+
+    def flush(self):
+        """Return whatever is left once the stream has ended"""
+        rest = self.buffer.strip()
+        text = f"{self.pending}\n\n{rest}" if self.pending and rest else (self.pending or rest)
+        self.buffer = ""
+        self.pending = ""
+        return [text] if text else []
+
+    def _find_boundary(self):
+        start = 0
+        while True:
+            index = self.buffer.find("\n\n", start)
+            if index == -1:
+                return None
+            # An odd number of fences before the break means we are inside a code block
+            if self.buffer.count("```", 0, index) % 2 == 0:
+                return index
+            start = index + 2
@@ -5,12 +5,19 @@ from dotenv import load_dotenv
 import pytz
 import re
 import json
+import time
+import threading
+import httplib2
+import google_auth_httplib2
+from google.auth.exceptions import RefreshError
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import time_utils
+import database
 import googlecalendar
 import message_templates
+from service_catalogue import BUSINESS_HOURS
 
 # Add this to the top section of googlecalendar.py after your imports
 PUBLIC_HOLIDAYS_2025 = [
@@ -60,15 +67,8 @@ CLINIC_TIMEZONE = pytz.timezone("Asia/Singapore")  # Set timezone for the clinic
 # After (Aware)
 now = datetime.now(CLINIC_TIMEZONE)
 
-BUSINESS_HOURS = {
-    0: {"start": "11:00 AM", "end": "8:00 PM"},  # Monday
-    1: {"start": "11:00 AM", "end": "8:00 PM"},  # Tuesday
-    2: {"start": "11:00 AM", "end": "8:00 PM"},  # Wednesday
-    3: {"start": "11:00 AM", "end": "8:00 PM"},  # Thursday
-    4: {"start": "11:00 AM", "end": "8:00 PM"},  # Friday
-    5: {"start": "11:00 AM", "end": "10:00 PM"},  # Saturday
-    6: None,  # Sunday (closed)
-}
+# Private extended property used to tag events with the customer's phone number
+CUSTOMER_PHONE_PROPERTY = "customer_phone"
 
 
 # Treatment duration configuration (in minutes)
@@ -83,37 +83,50 @@ TREATMENT_DURATIONS = {
 }
 
 
+# --- Cached Google Calendar service ---
+# Credentials are shared process-wide; each thread gets its own service object
+# because the underlying httplib2.Http connection is not thread-safe.
+_credentials = None
+_credentials_lock = threading.Lock()
+_service_generation = 0
+_thread_local = threading.local()
+
+
+def _get_credentials():
+    """Return the shared service account credentials, refreshing the token if needed"""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            cred_info = json.loads(GOOGLE_CALENDAR_CREDENTIALS)
+            logger.info(f"Using service account: {cred_info.get('client_email', 'Not found')}")
+            logger.info(f"Calendar ID being used: {CALENDAR_ID}")
+            _credentials = service_account.Credentials.from_service_account_info(
+                cred_info,
+                scopes=['https://www.googleapis.com/auth/calendar']
+            )
+        if not _credentials.valid:
+            _credentials.refresh(google_auth_httplib2.Request(httplib2.Http()))
+        return _credentials
+
+
 def get_google_calendar_service():
-    """Create and return a Google Calendar API service object"""
+    """Return this thread's Google Calendar API service object, building it on first use"""
     try:
-        logger.info("Attempting to create Google Calendar service")
-        
         if not GOOGLE_CALENDAR_CREDENTIALS:
             logger.error("Google Calendar credentials not configured")
             return None
         
-        # Log credential info (safely)
-        cred_info = json.loads(GOOGLE_CALENDAR_CREDENTIALS)
-        logger.info(f"Using service account: {cred_info.get('client_email', 'Not found')}")
-        logger.info(f"Calendar ID being used: {CALENDAR_ID}")
+        credentials = _get_credentials()
         
-        # Create credentials
-        credentials = service_account.Credentials.from_service_account_info(
-            cred_info,
-            scopes=['https://www.googleapis.com/auth/calendar']
-        )
-        
-        # Build the service
-        service = build('calendar', 'v3', credentials=credentials)
+        service = getattr(_thread_local, "service", None)
+        if service is not None and _thread_local.generation == _service_generation:
+            return service
         
-        # Test the connection with a simple API call
-        try:
-            calendar_info = service.calendars().get(calendarId=CALENDAR_ID).execute()
-            logger.info(f"Successfully connected to calendar: {calendar_info.get('summary', 'Unknown')}")
-        except HttpError as e:
-            logger.error(f"Failed to access calendar with ID {CALENDAR_ID}: {str(e)}")
-            return None
-            
+        logger.info("Building Google Calendar service for this thread")
+        authorized_http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        service = build('calendar', 'v3', http=authorized_http, cache_discovery=False)
+        _thread_local.service = service
+        _thread_local.generation = _service_generation
         return service
         
     except json.JSONDecodeError:
@@ -121,8 +134,26 @@ def get_google_calendar_service():
         return None
     except Exception as e:
         logger.error(f"Error creating Google Calendar service: {str(e)}")
+        reset_google_calendar_service()
         return None
 
+
+def reset_google_calendar_service():
+    """Drop the cached credentials and services so they are rebuilt on next use"""
+    global _credentials, _service_generation
+    with _credentials_lock:
+        _credentials = None
+        _service_generation += 1
+    logger.info("Google Calendar service cache cleared")
+
+
+def _reset_if_auth_error(error):
+    """Rebuild the cached service after an authentication failure"""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if isinstance(error, RefreshError) or status == 401:
+        logger.warning(f"Google Calendar authentication failed, rebuilding service: {str(error)}")
+        reset_google_calendar_service()
+
 def convert_12h_to_24h(time_str):
     """Convert 12-hour time format to 24-hour format for internal use"""
     if not time_str:
@@ -145,6 +176,180 @@ def convert_24h_to_12h(time_str):
         logger.error(f"Invalid 24-hour time format: {time_str}. Expected format: 'HH:MM'")
         return None
 
+# --- Per-day busy interval cache ---
+# Keyed by clinic date. Entries are dropped when any worker writes an event (see
+# _calendar_written); the TTL picks up edits made by staff in the Calendar UI.
+BUSY_CACHE_TTL = int(os.getenv("BUSY_CACHE_TTL", "60"))  # seconds
+_busy_cache = {}  # Structure: { date: {"intervals": [(start, end, event_id), ...], "fetched_at": float, "version": int} }
+_busy_cache_lock = threading.Lock()
+
+
+def _calendar_version(customer_number=None):
+    """
+    Counter in the shared database bumped whenever a worker on this host writes an event.
+
+    The calendar-wide counter guards cached days; each customer also has their own
+    counter guarding their indexed appointments, so a booking only makes the
+    booking customer's entry stale. Cached data loaded under an older version is
+    not used. Returns None (nothing is served from cache) if the database cannot be read.
+    """
+    name = f"calendar:{customer_number}" if customer_number else "calendar"
+    try:
+        return database.get_version(name)
+    except Exception as e:
+        logger.warning(f"Could not read calendar version: {str(e)}")
+        return None
+
+
+def _calendar_written(date_obj=None, event_id=None, customer_numbers=None):
+    """
+    Forget cached calendar data after we changed an event, in this and the other worker processes.
+
+    customer_numbers are the owners of the changed events; None means unknown, which
+    drops the whole customer index.
+    """
+    invalidate_busy_intervals(date_obj=date_obj, event_id=event_id)
+    with _customer_index_lock:
+        if customer_numbers is None:
+            _customer_index.clear()
+        else:
+            for customer_number in customer_numbers:
+                _customer_index.pop(customer_number, None)
+    try:
+        with database.transaction() as conn:
+            database.bump_version("calendar", conn)
+            for customer_number in customer_numbers or ():
+                database.bump_version(f"calendar:{customer_number}", conn)
+    except Exception as e:
+        logger.warning(f"Could not record calendar change for other workers: {str(e)}")
+
+
+def _event_customer(event):
+    """Phone number an event was booked for, from its private extended property"""
+    return event.get('extendedProperties', {}).get('private', {}).get(CUSTOMER_PHONE_PROPERTY)
+
+
+def _appointment_owner(service, appointment_id):
+    """Customer an appointment belongs to: the local index if it has it, else the event itself"""
+    with _customer_index_lock:
+        for customer_number, entry in _customer_index.items():
+            if any(appointment["id"] == appointment_id for _, appointment in entry["appointments"]):
+                return customer_number
+    try:
+        return _event_customer(service.events().get(calendarId=CALENDAR_ID, eventId=appointment_id).execute())
+    except Exception as e:
+        logger.warning(f"Could not look up the owner of appointment {appointment_id}: {str(e)}")
+        return None
+
+
+def _parse_event_interval(event):
+    """Convert a Calendar event into a timezone-aware (start, end, event_id) tuple"""
+    event_start_str = event['start'].get('dateTime', event['start'].get('date'))
+    event_end_str = event['end'].get('dateTime', event['end'].get('date'))
+
+    # Check if it's a date-only event
+    if 'date' in event['start']:
+        event_start = CLINIC_TIMEZONE.localize(datetime.strptime(event_start_str, "%Y-%m-%d")).replace(hour=0, minute=0, second=0)
+        event_end = CLINIC_TIMEZONE.localize(datetime.strptime(event_end_str, "%Y-%m-%d")).replace(hour=23, minute=59, second=59)
+    else:
+        event_start = datetime.fromisoformat(event_start_str).astimezone(CLINIC_TIMEZONE)
+        event_end = datetime.fromisoformat(event_end_str).astimezone(CLINIC_TIMEZONE)
+
+    return event_start, event_end, event.get('id')
+
+
+def get_busy_intervals(date_obj, start_time, end_time):
+    """
+    Return the busy intervals between start_time and end_time on date_obj.
+
+    Served from the per-day cache while it is fresh, otherwise fetched from the
+    Calendar API. Returns None if the calendar service is unavailable.
+    """
+    now_ts = time.monotonic()
+    version = _calendar_version()
+    with _busy_cache_lock:
+        entry = _busy_cache.get(date_obj)
+        if entry and now_ts - entry["fetched_at"] < BUSY_CACHE_TTL and version is not None and entry["version"] == version:
+            return list(entry["intervals"])
+
+    service = get_google_calendar_service()
+    if not service:
+        return None
+
+    time_min = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, start_time)).isoformat()
+    time_max = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, end_time)).isoformat()
+
+    events_result = service.events().list(
+        calendarId=CALENDAR_ID,
+        timeMin=time_min,
+        timeMax=time_max,
+        singleEvents=True,
+        orderBy='startTime'
+    ).execute()
+
+    intervals = [_parse_event_interval(event) for event in events_result.get('items', [])]
+    with _busy_cache_lock:
+        _busy_cache[date_obj] = {"intervals": intervals, "fetched_at": now_ts, "version": version}
+    logger.debug(f"Cached {len(intervals)} busy intervals for {date_obj}")
+    return list(intervals)
+
+
+def _slot_is_free(service, start, end, ignore_event_id=None):
+    """Ask the Calendar API, bypassing the cache, whether any event overlaps start-end"""
+    events_result = service.events().list(
+        calendarId=CALENDAR_ID,
+        timeMin=start.isoformat(),
+        timeMax=end.isoformat(),
+        singleEvents=True
+    ).execute()
+    return not any(event.get('id') != ignore_event_id for event in events_result.get('items', []))
+
+
+def invalidate_busy_intervals(date_obj=None, event_id=None):
+    """Drop cached days by date and/or by any day that contains event_id"""
+    with _busy_cache_lock:
+        if date_obj is not None:
+            _busy_cache.pop(date_obj, None)
+        if event_id is not None:
+            for cached_date in list(_busy_cache):
+                if any(interval[2] == event_id for interval in _busy_cache[cached_date]["intervals"]):
+                    del _busy_cache[cached_date]
+
+def merge_busy_intervals(intervals):
+    """Sort busy (start, end, ...) intervals and merge the ones that overlap or touch"""
+    merged = []
+    for interval in sorted(intervals, key=lambda interval: interval[0]):
+        start, end = interval[0], interval[1]
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def find_free_slots(day_start, day_end, merged_intervals, duration, step=timedelta(minutes=30)):
+    """
+    Return the slot start times between day_start and day_end that fit duration
+    without overlapping any merged busy interval.
+
+    Candidates advance in `step` increments and the busy list is walked once, so
+    the cost is O(slots + intervals).
+    """
+    free_slots = []
+    index = 0
+    slot = day_start
+    while slot + duration <= day_end:
+        slot_end = slot + duration
+        # Skip busy intervals that finish before this slot starts
+        while index < len(merged_intervals) and merged_intervals[index][1] <= slot:
+            index += 1
+        if index == len(merged_intervals) or slot_end <= merged_intervals[index][0]:
+            free_slots.append(slot)
+        slot += step
+    return free_slots
+
+
 def get_available_slots(date_str, treatment_type, requested_time_str=None):
     try:
         # Existing code for date validation
@@ -193,60 +398,20 @@ def get_available_slots(date_str, treatment_type, requested_time_str=None):
         start_time = datetime.strptime(start_time_24h, "%H:%M").time()
         end_time = datetime.strptime(end_time_24h, "%H:%M").time()
 
-        # Create calendar service
-        service = get_google_calendar_service()
-        if not service:
+        # Busy intervals come from the per-day cache, fetched on the first lookup
+        busy_intervals = get_busy_intervals(date_obj, start_time, end_time)
+        if busy_intervals is None:
             return {"error": "Unable to connect to calendar service."}
 
-        time_min = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, start_time)).isoformat()
-        time_max = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, end_time)).isoformat()
-
-        events_result = service.events().list(
-            calendarId=CALENDAR_ID,
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-
-        # Generate all possible time slots based on treatment duration
-        all_slots = []
-        current_time = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, start_time))
-        end_datetime = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, end_time))
-
-        while current_time + timedelta(minutes=treatment_duration) <= end_datetime:
-            all_slots.append(current_time)
-            current_time += timedelta(minutes=30)  # 30-minute intervals
-
-        # Filter out booked slots
-        available_slots = []
-        for slot in all_slots:
-            slot_end = slot + timedelta(minutes=treatment_duration)
-            is_available = True
-
-            for event in events:
-                # CORRECTED: Ensure event times are timezone-aware
-                event_start_str = event['start'].get('dateTime', event['start'].get('date'))
-                event_end_str = event['end'].get('dateTime', event['end'].get('date'))
-
-                # Check if it's a date-only event
-                if 'date' in event['start']:
-                    event_start = CLINIC_TIMEZONE.localize(datetime.strptime(event_start_str, "%Y-%m-%d")).replace(hour=0, minute=0, second=0)
-                    event_end = CLINIC_TIMEZONE.localize(datetime.strptime(event_end_str, "%Y-%m-%d")).replace(hour=23, minute=59, second=59)
-                else:
-                    event_start = datetime.fromisoformat(event_start_str).astimezone(CLINIC_TIMEZONE)
-                    event_end = datetime.fromisoformat(event_end_str).astimezone(CLINIC_TIMEZONE)
-
-                # CORRECTED: Compare timezone-aware datetimes directly
-                if not (slot_end <= event_start or slot >= event_end):
-                    is_available = False
-                    break
-
-            if is_available:
-                # Append the datetime object, not a string
-                available_slots.append(slot)
+        # Sweep the merged busy intervals once to find the free slots
+        day_start = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, start_time))
+        day_end = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, end_time))
+        available_slots = find_free_slots(
+            day_start,
+            day_end,
+            merge_busy_intervals(busy_intervals),
+            timedelta(minutes=treatment_duration)
+        )
 
         available_slots_12h = [slot.strftime("%I:%M %p").lstrip("0") for slot in available_slots]
 
@@ -271,9 +436,11 @@ def get_available_slots(date_str, treatment_type, requested_time_str=None):
         return {"available_slots": available_slots_12h}
 
     except HttpError as e:
+        _reset_if_auth_error(e)
         logger.error(f"Google Calendar API error: {str(e)}")
         return {"error": "Error accessing calendar. Please try again later."}
     except Exception as e:
+        _reset_if_auth_error(e)
         logger.error(f"Error getting available slots: {str(e)}")
         return {"error": f"Unexpected error: {str(e)}"}
 
@@ -364,6 +531,9 @@ def book_appointment(customer_name, customer_number, date_str, time_str, treatme
         event = {
             'summary': f"Appointment: {treatment_type.title()} - {customer_name}",
             'description': f"Treatment: {treatment_type}\nCustomer: {customer_name}\nPhone: {customer_number}\nAdditional Notes: {additional_notes}",
+            'extendedProperties': {
+                'private': {CUSTOMER_PHONE_PROPERTY: customer_number},
+            },
             'start': {
                 'dateTime': appointment_datetime.isoformat(),
                 'timeZone': 'Asia/Singapore',
@@ -382,10 +552,17 @@ def book_appointment(customer_name, customer_number, date_str, time_str, treatme
         }
         logger.info(f"BOOKING: Event object created: {json.dumps(event)}")
 
+        # The availability above may come from another worker's stale cache, so look at this slot live
+        if not _slot_is_free(service, appointment_datetime, end_datetime):
+            logger.warning(f"BOOKING: Time slot {time_str} was taken since availability was cached")
+            invalidate_busy_intervals(date_obj=date_obj)
+            return {"error": "This time slot is no longer available. Please choose another time."}
+
         logger.info("BOOKING: Submitting event to Google Calendar API")
         try:
             event_result = service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
             logger.info(f"BOOKING: Event created successfully with ID: {event_result.get('id')}")
+            _calendar_written(date_obj=date_obj, customer_numbers=[customer_number])
             # Inside book_appointment function in googlecalendar.py
             # After this line: event_result = service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
 
@@ -406,6 +583,7 @@ def book_appointment(customer_name, customer_number, date_str, time_str, treatme
                 # Continue with booking confirmation (don't fail if reminder scheduling fails)
 
         except HttpError as e:
+            _reset_if_auth_error(e)
             error_reason = e.reason if hasattr(e, 'reason') else str(e)
             error_code = e.status_code if hasattr(e, 'status_code') else 'unknown'
             logger.error(f"BOOKING: Google Calendar API error ({error_code}): {error_reason}")
@@ -417,6 +595,7 @@ def book_appointment(customer_name, customer_number, date_str, time_str, treatme
                     logger.error(f"BOOKING: Raw error content: {e.content}")
             return {"error": f"Error booking appointment: {error_reason}. Please try again later."}
         except Exception as e:
+            _reset_if_auth_error(e)
             logger.error(f"BOOKING: Failed to create event: {str(e)}")
             return {"error": f"Failed to create calendar event: {str(e)}"}
 
@@ -438,11 +617,13 @@ def book_appointment(customer_name, customer_number, date_str, time_str, treatme
         return confirmation
 
     except HttpError as e:
+        _reset_if_auth_error(e)
         error_reason = e.reason if hasattr(e, 'reason') else str(e)
         error_code = e.status_code if hasattr(e, 'status_code') else 'unknown'
         logger.error(f"BOOKING: Google Calendar API error ({error_code}): {error_reason}")
         return {"error": "Error booking appointment. Please try again later."}
     except Exception as e:
+        _reset_if_auth_error(e)
         logger.error(f"BOOKING: Error booking appointment: {str(e)}", exc_info=True)
         return {"error": f"Unexpected error: {str(e)}"}
 
@@ -463,7 +644,9 @@ def cancel_appointment(appointment_id):
             return {"error": "Unable to connect to calendar service."}
 
         # Delete the event
+        customer_number = _appointment_owner(service, appointment_id)
         service.events().delete(calendarId=CALENDAR_ID, eventId=appointment_id).execute()
+        _calendar_written(event_id=appointment_id, customer_numbers=[customer_number] if customer_number else None)
 
         logger.info(f"Appointment {appointment_id} cancelled successfully")
 
@@ -473,12 +656,85 @@ def cancel_appointment(appointment_id):
         }
 
     except HttpError as e:
+        _reset_if_auth_error(e)
         logger.error(f"Google Calendar API error: {str(e)}")
         return {"error": "Error cancelling appointment. Please try again later."}
     except Exception as e:
+        _reset_if_auth_error(e)
         logger.error(f"Error cancelling appointment: {str(e)}")
         return {"error": f"Unexpected error: {str(e)}"}
 
+def _event_to_appointment(event):
+    """Convert a Calendar event into (start_time, appointment dict)"""
+    # Handle date-only and datetime events
+    start_time_str = event['start'].get('dateTime', event['start'].get('date'))
+    if 'date' in event['start']:
+        start_time = CLINIC_TIMEZONE.localize(datetime.strptime(start_time_str, "%Y-%m-%d")).replace(hour=0, minute=0, second=0)
+    else:
+        start_time = datetime.fromisoformat(start_time_str).astimezone(CLINIC_TIMEZONE)
+
+    # Extract treatment type from event summary
+    summary = event.get('summary', '')
+    treatment_type = "Unknown"
+    if ":" in summary:
+        treatment_type = summary.split(":")[1].split("-")[0].strip()
+
+    appointment = {
+        "id": event.get('id'),
+        "treatment": treatment_type,
+        "date": time_utils.format_date_for_display(start_time.strftime("%Y-%m-%d")),
+        "time": start_time.strftime("%I:%M %p").lstrip("0"),
+        "link": event.get('htmlLink')
+    }
+    return start_time, appointment
+
+
+# --- Local phone -> appointments index ---
+# Filled from privateExtendedProperty queries. Writing an event drops the owning
+# customer's entry (see _calendar_written). The TTL picks up edits made by staff.
+CUSTOMER_INDEX_TTL = int(os.getenv("CUSTOMER_INDEX_TTL", "300"))  # seconds
+_customer_index = {}  # Structure: { "customer_number": {"appointments": [(start, appointment), ...], "loaded_at": float, "version": int} }
+_customer_index_lock = threading.Lock()
+
+
+def _index_load_customer(customer_number, events, version):
+    """Replace the indexed appointments of a customer with freshly fetched events"""
+    appointments = [_event_to_appointment(event) for event in events]
+    with _customer_index_lock:
+        _customer_index[customer_number] = {"appointments": appointments, "loaded_at": time.monotonic(), "version": version}
+
+
+def _index_get_customer(customer_number):
+    """Return the indexed (start, appointment) pairs for a customer, or None if not fresh"""
+    version = _calendar_version(customer_number)
+    with _customer_index_lock:
+        entry = _customer_index.get(customer_number)
+        if not entry or time.monotonic() - entry["loaded_at"] >= CUSTOMER_INDEX_TTL:
+            return None
+        if version is None or entry["version"] != version:
+            return None
+        return list(entry["appointments"])
+
+
+def _list_customer_events(service, customer_number, time_min):
+    """Fetch every event tagged with the customer's phone number, following all pages"""
+    events = []
+    page_token = None
+    while True:
+        events_result = service.events().list(
+            calendarId=CALENDAR_ID,
+            timeMin=time_min,
+            singleEvents=True,
+            orderBy='startTime',
+            privateExtendedProperty=f"{CUSTOMER_PHONE_PROPERTY}={customer_number}",
+            pageToken=page_token
+        ).execute()
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return events
+
+
 def list_customer_appointments(customer_number, future_only=True):
     """
     List all appointments for a specific customer
@@ -491,6 +747,19 @@ def list_customer_appointments(customer_number, future_only=True):
         dict: List of customer's appointments
     """
     try:
+        # Serve future appointments from the local index while it is fresh
+        if future_only:
+            indexed = _index_get_customer(customer_number)
+            if indexed is not None:
+                now_datetime = datetime.now(CLINIC_TIMEZONE)
+                upcoming = sorted(
+                    (entry for entry in indexed if entry[0] >= now_datetime),
+                    key=lambda entry: entry[0]
+                )
+                return {
+                    "appointments": [dict(appointment) for _, appointment in upcoming]
+                }
+
         # Create calendar service
         service = get_google_calendar_service()
         if not service:
@@ -498,57 +767,80 @@ def list_customer_appointments(customer_number, future_only=True):
 
         # Set time range
         time_min = CLINIC_TIMEZONE.localize(datetime.now()).isoformat() if future_only else None
+        # Read before fetching, so a write that lands during the fetch makes the entry stale
+        version = _calendar_version(customer_number)
 
-        # Get all events
-        events_result = service.events().list(
-            calendarId=CALENDAR_ID,
-            timeMin=time_min,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-
-        # Filter events for this customer
-        customer_appointments = []
-        for event in events:
-            description = event.get('description', '')
-            if f"Phone: {customer_number}" in description:
-                # **CORRECTED: Handle date-only and datetime events**
-                start_time_str = event['start'].get('dateTime', event['start'].get('date'))
-                if 'date' in event['start']:
-                    start_time = CLINIC_TIMEZONE.localize(datetime.strptime(start_time_str, "%Y-%m-%d")).replace(hour=0, minute=0, second=0)
-                else:
-                    start_time = datetime.fromisoformat(start_time_str).astimezone(CLINIC_TIMEZONE)
-
-                # Extract treatment type from event summary
-                summary = event.get('summary', '')
-                treatment_type = "Unknown"
-                if ":" in summary:
-                    treatment_type = summary.split(":")[1].split("-")[0].strip()
-
-                appointment = {
-                    "id": event.get('id'),
-                    "treatment": treatment_type,
-                    "date": time_utils.format_date_for_display(start_time.strftime("%Y-%m-%d")),
-                    "time": start_time.strftime("%I:%M %p").lstrip("0"),
-                    "link": event.get('htmlLink')
-                }
+        # Only this customer's events, matched on the private extended property
+        events = _list_customer_events(service, customer_number, time_min)
+        if future_only:
+            _index_load_customer(customer_number, events, version)
 
-
-                customer_appointments.append(appointment)
+        customer_appointments = [_event_to_appointment(event)[1] for event in events]
 
         return {
             "appointments": customer_appointments
         }
         
     except HttpError as e:
+        _reset_if_auth_error(e)
         logger.error(f"Google Calendar API error: {str(e)}")
         return {"error": "Error retrieving appointments. Please try again later."}
     except Exception as e:
+        _reset_if_auth_error(e)
         logger.error(f"Error listing appointments: {str(e)}")
         return {"error": f"Unexpected error: {str(e)}"}
 
+
+def backfill_customer_phone_properties():
+    """
+    Tag events booked before phone numbers were stored as extended properties.
+
+    Scans upcoming events once, reads "Phone: <number>" from the description and
+    patches it into extendedProperties.private so that list_customer_appointments
+    can find them. Already tagged events are skipped, so it is safe to run again.
+    scheduler_jobs runs it once per database; scripts/backfill_calendar_phones.py
+    runs it by hand.
+
+    Returns:
+        int or None: Number of events updated, None if the calendar was unreachable
+    """
+    service = get_google_calendar_service()
+    if not service:
+        logger.error("Backfill aborted: unable to connect to calendar service")
+        return None
+
+    updated = 0
+    updated_customers = set()
+    page_token = None
+    time_min = CLINIC_TIMEZONE.localize(datetime.now()).isoformat()
+    while True:
+        events_result = service.events().list(
+            calendarId=CALENDAR_ID,
+            timeMin=time_min,
+            singleEvents=True,
+            pageToken=page_token
+        ).execute()
+        for event in events_result.get('items', []):
+            private = event.get('extendedProperties', {}).get('private', {})
+            phone_match = re.search(r"Phone: (\S+)", event.get('description', ''))
+            if phone_match and CUSTOMER_PHONE_PROPERTY not in private:
+                service.events().patch(
+                    calendarId=CALENDAR_ID,
+                    eventId=event['id'],
+                    body={'extendedProperties': {'private': {CUSTOMER_PHONE_PROPERTY: phone_match.group(1)}}}
+                ).execute()
+                updated += 1
+                updated_customers.add(phone_match.group(1))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            break
+
+    if updated:
+        _calendar_written(customer_numbers=updated_customers)
+
+    logger.info(f"Backfilled customer phone property on {updated} events")
+    return updated
+
 def reschedule_appointment(appointment_id, new_date_str, new_time_str):
     """
     Reschedule an existing appointment
@@ -603,6 +895,12 @@ def reschedule_appointment(appointment_id, new_date_str, new_time_str):
         if new_time_str not in availability.get("available_slots", []):
             return {"error": "This time slot is not available. Please choose another time."}
 
+        # The availability above may come from a stale cache, so look at the new slot live
+        if not _slot_is_free(service, CLINIC_TIMEZONE.localize(new_start_datetime),
+                             CLINIC_TIMEZONE.localize(new_end_datetime), ignore_event_id=appointment_id):
+            invalidate_busy_intervals(date_obj=new_date_obj)
+            return {"error": "This time slot is not available. Please choose another time."}
+
         # Update the event
         event['start']['dateTime'] = new_start_datetime.isoformat()
         event['end']['dateTime'] = new_end_datetime.isoformat()
@@ -614,6 +912,8 @@ def reschedule_appointment(appointment_id, new_date_str, new_time_str):
         ).execute()
 
         logger.info(f"Appointment rescheduled: {updated_event.get('htmlLink')}")
+        owner = _event_customer(event)
+        _calendar_written(date_obj=new_date_obj, event_id=appointment_id, customer_numbers=[owner] if owner else None)
 
         # Format the confirmation details
         confirmation = {
@@ -628,9 +928,11 @@ def reschedule_appointment(appointment_id, new_date_str, new_time_str):
         return confirmation
 
     except HttpError as e:
+        _reset_if_auth_error(e)
         logger.error(f"Google Calendar API error: {str(e)}")
         return {"error": "Error rescheduling appointment. Please try again later."}
     except Exception as e:
+        _reset_if_auth_error(e)
         logger.error(f"Error rescheduling appointment: {str(e)}")
         return {"error": f"Unexpected error: {str(e)}"}
 
@@ -0,0 +1,46 @@
+# Gunicorn settings for production (Cloud Run / Docker): gunicorn -c gunicorn.conf.py app:app
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# Workers only share conversations and booking state through a durable store, so
+# more than one worker needs STATE_STORE_BACKEND=sqlite (one host) or redis
+if os.getenv("STATE_STORE_BACKEND", "memory") == "memory":
+    _default_workers = 1
+else:
+    _default_workers = min(multiprocessing.cpu_count() * 2 + 1, 8)
+workers = int(os.getenv("WEB_CONCURRENCY", str(_default_workers)))
+
+# Threads per worker; requests mostly wait on WhatsApp, Gemini and Google Calendar
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))  # seconds
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))  # seconds
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))  # seconds
+
+# Recycle workers after this many requests (0 = never); only safe with a durable state store
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+# The app starts its own threads, so load it in each worker rather than in the master
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_worker_init(worker):
+    """Start the reminder and promotion jobs in exactly one worker per host"""
+    import scheduler_jobs
+    scheduler_jobs.start_background_jobs()
+
+
+def worker_exit(server, worker):
+    """Let the reply pipeline finish accepted messages before the worker exits"""
+    import sys
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.reply_pipeline.stop()
@@ -0,0 +1,78 @@
+import os
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Connection pool settings ---
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))  # keep-alive connections per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # seconds
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))  # seconds
+
+# One pooled session per (process, host) so forked workers never share sockets
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url):
+    """Return the shared keep-alive session for the host of url"""
+    key = (os.getpid(), urlsplit(url).netloc)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+            logger.info(f"Created HTTP session for {key[1]} with pool size {HTTP_POOL_SIZE}")
+        return session
+
+
+def _connections_opened(session, url):
+    """Count connections the session has opened to the host of url (for timing logs)"""
+    try:
+        host = urlsplit(url).hostname
+        pools = session.get_adapter(url).poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys() if key.key_host == host)
+    except Exception:
+        return 0
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Send a request through the pooled session for the target host.
+
+    Uses split (connect, read) timeouts unless one is given, and logs the request
+    duration together with whether a new TCP+TLS connection had to be opened.
+    """
+    session = get_session(url)
+    connections_before = _connections_opened(session, url)
+    started = time.monotonic()
+    try:
+        return session.request(method, url, timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), **kwargs)
+    finally:
+        elapsed_ms = (time.monotonic() - started) * 1000
+        new_connection = _connections_opened(session, url) > connections_before
+        parts = urlsplit(url)
+        logger.debug(f"{method} {parts.netloc}{parts.path} took {elapsed_ms:.1f} ms (new_connection={new_connection})")
+
+
+def post(url, timeout=None, **kwargs):
+    """POST through the pooled session for the target host"""
+    return request("POST", url, timeout=timeout, **kwargs)
+
+
+def patch(url, timeout=None, **kwargs):
+    """PATCH through the pooled session for the target host"""
+    return request("PATCH", url, timeout=timeout, **kwargs)
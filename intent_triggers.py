@@ -215,14 +215,142 @@ CANCEL_INTENT_PHRASES = [
 ]
 
 
+# Terms that mark a price question
+PRICE_INQUIRY_TERMS = ["price", "cost", "fee", "how much", "charges", "pricing"]
+
+# Phrases that ask for the whole price list rather than one treatment
+PRICE_LIST_PHRASES = [
+    "price list", "pricelist", "price menu", "service menu", "treatment menu", "your prices", "all prices",
+    "all the prices", "your price", "your rates", "prices for your", "what are the prices", "list of prices",
+    "prices of your", "how much are your", "what do you charge",
+    # Misspellings
+    "prize list", "price lis", "pricelst"
+]
+
+DAY_NAME_WORDS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Phrases that ask when the clinic is open
+HOURS_INQUIRY_PHRASES = [
+    "opening hours", "opening hour", "operating hours", "business hours", "open hours",
+    "opening time", "opening times", "closing time", "what time do you open", "what time do you close",
+    "what time you open", "what time you close", "when do you open", "when do you close",
+    "when are you open", "are you open", "you open on", "open on weekends", "open on weekend",
+    # Misspellings and shortened forms
+    "opening hrs", "operating hrs", "business hrs", "opning hours", "openin hours", "wat time open"
+] + [
+    # "open on monday", "closed on sundays", "open this friday", ...
+    f"{prefix} {day}"
+    for day in DAY_NAME_WORDS
+    for prefix in ("open on", "open", "open this", "open next", "open every", "closed on", "close on", "closing on")
+]
+
+# Phrases that ask where the clinic is
+LOCATION_INQUIRY_PHRASES = [
+    "where is the clinic", "where is your clinic", "where's the clinic", "where is meow",
+    "where are you located", "where are you", "where r u", "your address", "clinic address",
+    "the address", "what is the address", "location of", "your location", "clinic location",
+    "how to get there", "how do i get there", "directions to",
+    # Misspellings
+    "adress", "addres", "locaton", "wher is the clinic"
+]
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over a table of {category: [phrases]}.
+
+    match() walks the text once and returns every category with at least one
+    phrase occurring as a substring, which is the same test as running
+    `phrase in text` over every phrase.
+    """
+
+    def __init__(self, phrase_table):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        for category, phrases in phrase_table.items():
+            for phrase in phrases:
+                self._add(phrase, category)
+        self._build()
+
+    def _add(self, phrase, category):
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(category)
+
+    def _build(self):
+        """Compute failure links breadth-first and fold outputs along them"""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+        self._output = [frozenset(output) for output in self._output]
+
+    def match(self, text):
+        """Return the set of categories whose phrases occur in text"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+# Every phrase list compiled once at import into a single automaton
+INTENT_MATCHER = PhraseMatcher(dict(
+    [(f"treatment:{code}", variations) for code, variations in TREATMENT_TYPES.items()] + [
+        ("price", PRICE_INQUIRY_TERMS),
+        ("price_list", PRICE_LIST_PHRASES),
+        ("hours", HOURS_INQUIRY_PHRASES),
+        ("location", LOCATION_INQUIRY_PHRASES),
+        ("non_booking", NON_BOOKING_PHRASES),
+        ("booking", BOOKING_INTENT_PHRASES),
+        ("expression", INTENT_EXPRESSION_PHRASES),
+        ("reschedule", RESCHEDULE_INTENT_PHRASES),
+        ("view", VIEW_APPOINTMENTS_INTENT_PHRASES),
+        ("cancel", CANCEL_INTENT_PHRASES),
+    ]
+))
+
+
+def match_phrases(text):
+    """Return every phrase category found in text (one pass over the lowercased text)"""
+    return INTENT_MATCHER.match(text.lower())
+
+
+def _treatment_from_matches(matches):
+    """Pick the first matching treatment in TREATMENT_TYPES order"""
+    for treatment_code in TREATMENT_TYPES:
+        if f"treatment:{treatment_code}" in matches:
+            return treatment_code
+    return None
+
+
 def get_treatment_code(text):
     """Returns the standardized treatment code for mentioned treatment."""
-    text_lower = text.lower()
-    for treatment_code, variations in TREATMENT_TYPES.items():
-        for variation in variations:
-            if variation in text_lower:
-                return treatment_code
-    return None
+    return _treatment_from_matches(match_phrases(text))
 
 def has_booking_intent(text):
     """
@@ -231,67 +359,60 @@ def has_booking_intent(text):
     2. An intent expression phrase ("I want to", "Can I", etc.)
     3. NOT containing non-booking phrases (questions, info requests)
     """
-    text_lower = text.lower()
-    
-    # First check if any non-booking phrase is present - exit early if found
-    is_question = any(phrase in text_lower for phrase in NON_BOOKING_PHRASES)
-    if is_question:
+    return _has_booking_intent(match_phrases(text))
+
+
+def _has_booking_intent(matches):
+    # Any non-booking phrase (questions, info requests) rules out booking intent
+    if "non_booking" in matches:
         return False
-        
-    # Check if any booking intent phrase is present
-    has_intent_phrase = any(phrase in text_lower for phrase in BOOKING_INTENT_PHRASES)
-    
-    # Check if any intent expression is present
-    has_expression = any(expr in text_lower for expr in INTENT_EXPRESSION_PHRASES)
-    
-    # Return True only if it has booking intent phrase AND intent expression
-    return has_intent_phrase and has_expression
+    return "booking" in matches and "expression" in matches
 
 
 def is_price_inquiry(text):
     """Determines if text is asking about prices"""
-    text_lower = text.lower()
-    price_terms = ["price", "cost", "fee", "how much", "charges", "pricing"]
-    return any(term in text_lower for term in price_terms)
+    return "price" in match_phrases(text)
 
 
 def has_reschedule_intent(text):
     """Determines if text has a reschedule intent"""
-    text_lower = text.lower()
-    return any(phrase in text_lower for phrase in RESCHEDULE_INTENT_PHRASES)
+    return "reschedule" in match_phrases(text)
 
 def has_view_appointments_intent(text):
     """Determines if text has a view appointments intent"""
-    text_lower = text.lower()
-    return any(phrase in text_lower for phrase in VIEW_APPOINTMENTS_INTENT_PHRASES)
+    return "view" in match_phrases(text)
 
 def has_cancel_intent(text):
     """Determines if text has a cancel intent"""
-    text_lower = text.lower()
-    return any(phrase in text_lower for phrase in CANCEL_INTENT_PHRASES)
+    return "cancel" in match_phrases(text)
 
 def extract_intent(text):
     """
     Extracts the primary intent from the message
     Returns a tuple of (intent_type, treatment_code)
     """
-    text_lower = text.lower()
-    
+    return extract_intent_from_matches(match_phrases(text))
+
+def extract_intent_from_matches(matches):
+    """
+    Applies the intent precedence rules to the categories found by match_phrases
+    Returns a tuple of (intent_type, treatment_code)
+    """
     # Extract treatment code if present
-    treatment_code = get_treatment_code(text_lower)
+    treatment_code = _treatment_from_matches(matches)
     
     # First check if it's a price inquiry
-    if is_price_inquiry(text_lower):
+    if "price" in matches:
         return "info", treatment_code
         
     # Check for various intents
-    if has_booking_intent(text_lower) and treatment_code:
+    if _has_booking_intent(matches) and treatment_code:
         return "booking", treatment_code
-    elif has_reschedule_intent(text_lower):
+    elif "reschedule" in matches:
         return "reschedule", None
-    elif has_view_appointments_intent(text_lower):
+    elif "view" in matches:
         return "view", None
-    elif has_cancel_intent(text_lower):
+    elif "cancel" in matches:
         return "cancel", None
     elif treatment_code:
         # Treatment mentioned but no booking intent
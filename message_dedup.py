@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Inbound message de-duplication settings ---
+MESSAGE_DEDUP_SIZE = int(os.getenv("MESSAGE_DEDUP_SIZE", "10000"))  # message ids remembered per process
+MESSAGE_DEDUP_TTL = int(os.getenv("MESSAGE_DEDUP_TTL", "604800"))  # seconds, Meta redelivers unacknowledged webhooks for up to 7 days
+# Also record ids in the shared state store so redeliveries to another worker are caught
+MESSAGE_DEDUP_PERSIST = os.getenv("MESSAGE_DEDUP_PERSIST", "true").lower() == "true"
+MESSAGE_DEDUP_NAMESPACE = "message_ids"
+
+
+class MessageDeduplicator:
+    """
+    Bounded seen-set of inbound WhatsApp message ids (LRU + TTL).
+
+    claim() is called before a message is queued and returns False for ids that
+    were already claimed, so a redelivered webhook does no work. When a store is
+    given, ids are also claimed there with an atomic add, which makes the check
+    hold across worker processes and restarts; the local set answers repeats
+    without a round trip.
+    """
+
+    def __init__(self, max_size=MESSAGE_DEDUP_SIZE, ttl=MESSAGE_DEDUP_TTL, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self._seen = OrderedDict()  # Structure: { message_id: expires_at }, oldest claim first
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.checked = 0
+        self.duplicates = 0
+        self.store_duplicates = 0
+        self.store_errors = 0
+
+    def claim(self, message_id):
+        """
+        Record a message id as being handled.
+
+        Returns:
+            bool: True if the id is new, False if it is a duplicate delivery
+        """
+        if not message_id:
+            return True
+        now = time.time()
+        with self._lock:
+            self.checked += 1
+            self._evict(now)
+            expires_at = self._seen.pop(message_id, None)
+            if expires_at is not None and expires_at > now:
+                self._seen[message_id] = expires_at
+                self.duplicates += 1
+                return False
+            self._seen[message_id] = now + self.ttl
+
+        if self.store is not None:
+            try:
+                claimed = self.store.add(MESSAGE_DEDUP_NAMESPACE, message_id, now, ttl=self.ttl)
+            except Exception as e:
+                # Failing open risks a duplicate reply, failing closed would drop real messages
+                logger.warning(f"Could not check message id {message_id} in the state store: {str(e)}")
+                with self._lock:
+                    self.store_errors += 1
+                return True
+            if not claimed:
+                with self._lock:
+                    self.duplicates += 1
+                    self.store_duplicates += 1
+                return False
+        return True
+
+    def release(self, message_id):
+        """Forget a claim for a message that could not be queued, so its redelivery is handled"""
+        if not message_id:
+            return
+        with self._lock:
+            self._seen.pop(message_id, None)
+        if self.store is not None:
+            try:
+                self.store.delete(MESSAGE_DEDUP_NAMESPACE, message_id)
+            except Exception as e:
+                logger.warning(f"Could not release message id {message_id} in the state store: {str(e)}")
+
+    def _evict(self, now):
+        """Drop expired ids from the front, then the oldest ones beyond max_size"""
+        while self._seen:
+            message_id, expires_at = next(iter(self._seen.items()))
+            if expires_at > now and len(self._seen) < self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def __len__(self):
+        return len(self._seen)
+
+    def stats(self):
+        """Return duplicate counts for the health endpoint"""
+        with self._lock:
+            return {
+                "persisted": self.store is not None,
+                "size": len(self._seen),
+                "checked": self.checked,
+                "duplicates_dropped": self.duplicates,
+                "store_duplicates": self.store_duplicates,
+                "store_errors": self.store_errors,
+            }
@@ -0,0 +1,157 @@
+# message_features.py
+import re
+from functools import cached_property
+
+import googlecalendar
+import intent_triggers
+import time_utils
+
+# Patterns are compiled once at import and shared by every message
+TIME_PATTERN = re.compile(r"(\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm)|at\s+\d{1,2}(?:[:.]\d{2})?\s*(?:am|pm))")
+NAME_PATTERN = re.compile(r"(?:my name is|for|name[: ]+)([A-Za-z\s]+)(?:\.|,|\s|$)")
+CANCEL_NUMBER_PATTERN = re.compile(r"cancel\s+(\d+)")
+RESCHEDULE_NUMBER_PATTERN = re.compile(r"reschedule\s+(\d+)")
+
+
+def parse_multiline_appointment(lines):
+    """Parse appointment details from a multi-line message format"""
+    if len(lines) < 3: # Need at least time, date, and treatment
+        return None
+
+    appointment_info = {}
+
+    # Try to parse time from first line
+    normalized_time = time_utils.normalize_time_format(lines[0].strip())
+    if normalized_time:
+        appointment_info["time"] = time_utils.format_normalized_time(normalized_time)
+
+    # Try to parse date from second line using enhanced function
+    date_obj = time_utils.parse_natural_language_date(lines[1].strip())
+    if date_obj:
+        # CHECK FOR PUBLIC HOLIDAY IMMEDIATELY
+        if googlecalendar.is_public_holiday(date_obj):
+            return {"error": "public_holiday"}
+            
+        appointment_info["date"] = date_obj.strftime("%Y-%m-%d") # Convert to YYYY-MM-DD format
+
+    # Get treatment from third line
+    treatment = lines[2].strip().lower()
+    if treatment in googlecalendar.TREATMENT_DURATIONS:
+        appointment_info["treatment_type"] = treatment
+
+    # Get name if available (fourth line)
+    if len(lines) >= 4:
+        appointment_info["customer_name"] = lines[3].strip()
+
+    # Return the parsed info if we have the minimum required fields
+    if "time" in appointment_info and "date" in appointment_info and "treatment_type" in appointment_info:
+        return appointment_info
+
+    return None
+
+
+class MessageFeatures:
+    """
+    Everything the handlers need to know about one inbound message.
+
+    Built once per message. The stripped and lowercased copies are computed up
+    front and each feature is parsed lazily at most once, so no handler has to
+    re-tokenise or re-scan the text.
+    """
+
+    def __init__(self, message):
+        self.text = message
+        self.stripped = message.strip()
+        self.lower = self.stripped.lower()
+
+    # --- Intent ---
+    @cached_property
+    def phrase_matches(self):
+        """Every intent_triggers phrase category present in the message"""
+        return intent_triggers.INTENT_MATCHER.match(self.lower)
+
+    @cached_property
+    def intent(self):
+        """(intent_type, treatment_code) using the intent_triggers precedence rules"""
+        return intent_triggers.extract_intent_from_matches(self.phrase_matches)
+
+    @property
+    def intent_type(self):
+        return self.intent[0]
+
+    @property
+    def treatment_code(self):
+        return self.intent[1]
+
+    # --- Values found inside the message ---
+    @cached_property
+    def time_match(self):
+        """Match object for a time mentioned inside the message ("at 3pm")"""
+        return TIME_PATTERN.search(self.lower)
+
+    @cached_property
+    def mentioned_time(self):
+        """The time mentioned inside the message as "h:MM AM/PM", or None"""
+        if not self.time_match:
+            return None
+        normalized_time = time_utils.normalize_time_format(self.time_match.group(1).replace("at ", "").strip())
+        return time_utils.format_normalized_time(normalized_time) if normalized_time else None
+
+    @cached_property
+    def date(self):
+        """The message parsed as a date (datetime.date), or None"""
+        return time_utils.parse_natural_language_date(self.lower)
+
+    @cached_property
+    def mentioned_name(self):
+        """A name introduced with "my name is" / "for" / "name:", or None"""
+        name_match = NAME_PATTERN.search(self.lower)
+        return name_match.group(1).strip() if name_match else None
+
+    @cached_property
+    def multiline_appointment(self):
+        """Appointment details from the time/date/treatment/name line format, or None"""
+        return parse_multiline_appointment(self.stripped.split('\n'))
+
+    @cached_property
+    def cancel_number(self):
+        """N from "cancel N", or None"""
+        match = CANCEL_NUMBER_PATTERN.search(self.lower)
+        return int(match.group(1)) if match else None
+
+    @cached_property
+    def reschedule_number(self):
+        """N from "reschedule N", or None"""
+        match = RESCHEDULE_NUMBER_PATTERN.search(self.lower)
+        return int(match.group(1)) if match else None
+
+    @property
+    def is_number(self):
+        return self.lower.isdigit()
+
+    # --- The whole message as a single value ---
+    @cached_property
+    def normalized_time(self):
+        """The whole message parsed as a time in "HH:MM", or None"""
+        return time_utils.normalize_time_format(self.stripped)
+
+    @cached_property
+    def time_display(self):
+        """The whole message parsed as a time in "h:MM AM/PM", or None"""
+        return time_utils.format_normalized_time(self.normalized_time) if self.normalized_time else None
+
+    @cached_property
+    def appointment_info(self):
+        """All booking details found in the message, multi-line format taking priority"""
+        appointment_info = {}
+        if self.treatment_code:
+            appointment_info["treatment_type"] = self.treatment_code
+        if self.mentioned_time:
+            appointment_info["time"] = self.mentioned_time
+        if self.date:
+            appointment_info["date"] = self.date.strftime("%Y-%m-%d")
+        if self.mentioned_name:
+            appointment_info["customer_name"] = self.mentioned_name
+        if self.multiline_appointment and "error" not in self.multiline_appointment:
+            appointment_info.update(self.multiline_appointment)
+        return appointment_info
@@ -100,9 +100,9 @@ messages = {
     
     # Rate Limiting
     "rate_limit_exceeded": [
-        "Whoa there, fur-get about spamming! You're sending messages too quickly. Please slow down and try again in a minute.",
-        "Hold your paws! That's too many messages at once. Please wait a moment before trying again.",
-        "Meow! You're typing faster than I can keep up! Please slow down and try again shortly."
+        "Whoa there, fur-get about spamming! You're sending messages too quickly. Please slow down and try again in {retry_after}.",
+        "Hold your paws! That's too many messages at once. Please wait {retry_after} before trying again.",
+        "Meow! You're typing faster than I can keep up! Please slow down and try again in {retry_after}."
     ],
     
     # Error Handling
@@ -265,6 +265,25 @@ messages = {
         "Meow there! This is a friendly reminder of your upcoming {treatment} appointment tomorrow at {time} on {date}. Please arrive 10 minutes early. We're purr-pared and ready to see you!"
     ],
 
+    # Service Catalogue Answers
+    "price_list_reply": [
+        "Here are our prices! 🐾\n\n{price_list}\n\nWould you like to book an appointment? Just let me know which treatment you're interested in!",
+        "Meow! Here's our purr-ice list:\n\n{price_list}\n\nIf you'd like to book, just tell me which treatment and I'll help you right away!",
+        "Happy to help! These are our current prices:\n\n{price_list}\n\nReady to book? Let me know which treatment you'd like!"
+    ],
+
+    "business_hours_reply": [
+        "Our opening hours are:\n{hours}\n\nWe look fur-ward to seeing you! 🐾",
+        "Meow! Meow Aesthetic Clinic is open:\n{hours}\n\nDrop by or book an appointment with me anytime!",
+        "Here are our opening hours:\n{hours}\n\nJust let me know if you'd like to book a visit!"
+    ],
+
+    "location_reply": [
+        "You can find us at {address}. For enquiries, call us at {phone}. See you soon! 🐾",
+        "Meow Aesthetic Clinic is located at {address}. You can also reach us at {phone}. We're purr-fectly easy to find!",
+        "We're at {address}! Feel free to call {phone} if you need help finding us."
+    ],
+
 
 
 }
\ No newline at end of file
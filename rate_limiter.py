@@ -0,0 +1,127 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- WhatsApp Cloud API send caps ---
+# Limits are enforced per process, so divide them by the worker count when running several.
+# Throughput per business number: 80 messages/second by default, up to 1000 on higher tiers
+WHATSAPP_SEND_RATE = float(os.getenv("WHATSAPP_SEND_RATE", "80"))  # messages per second
+# Pair rate limit: roughly one message every 6 seconds to the same customer, with short bursts
+WHATSAPP_PAIR_INTERVAL = float(os.getenv("WHATSAPP_PAIR_INTERVAL", "6"))  # seconds
+WHATSAPP_PAIR_BURST = int(os.getenv("WHATSAPP_PAIR_BURST", "10"))
+WHATSAPP_SEND_MAX_WAIT = float(os.getenv("WHATSAPP_SEND_MAX_WAIT", "30"))  # seconds a send may wait for a slot
+
+
+class GCRA:
+    """
+    Generic cell rate algorithm: `rate` events per `period`, bursts of up to `burst`.
+
+    Each key is a single float, its theoretical arrival time (TAT). A key whose TAT
+    has passed behaves exactly like a new key, so idle keys are evicted as calls
+    come in. update() is the pure form for callers that keep the TAT elsewhere.
+    """
+
+    def __init__(self, rate, burst=1, period=1.0):
+        self.emission_interval = period / float(rate)
+        self.burst = max(1, int(burst))
+        self.tolerance = self.emission_interval * (self.burst - 1)
+        self._tats = OrderedDict()  # Structure: { key: tat }, oldest update first
+        self._lock = threading.Lock()
+
+    def update(self, tat, now, cost=1):
+        """
+        Apply `cost` events to a stored TAT.
+
+        A cost larger than the burst is admitted once the bucket is full and charged
+        in full, so it delays later events instead of being refused forever.
+
+        Returns:
+            tuple: (allowed, new_tat, retry_after) where new_tat should be stored only
+                   if allowed, and retry_after is the seconds until the events are allowed
+        """
+        tat = now if tat is None else max(tat, now)
+        allow_at = tat + self.emission_interval * (min(cost, self.burst) - 1) - self.tolerance
+        if now < allow_at:
+            return False, tat, allow_at - now
+        return True, tat + self.emission_interval * cost, 0.0
+
+    def check(self, key="", cost=1):
+        """Non-blocking check for an in-process key, returning (allowed, retry_after)"""
+        with self._lock:
+            now = time.monotonic()
+            allowed, new_tat, retry_after = self.update(self._tats.get(key), now, cost)
+            if allowed:
+                self._tats[key] = new_tat
+                self._tats.move_to_end(key)
+            self._evict_idle(now)
+        return allowed, retry_after
+
+    def peek(self, key="", cost=1):
+        """Seconds until `cost` events would be allowed for key, without using them"""
+        with self._lock:
+            _, _, retry_after = self.update(self._tats.get(key), time.monotonic(), cost)
+        return retry_after
+
+    def acquire(self, key="", max_wait=None):
+        """Block until an event is allowed; False if that would take longer than max_wait"""
+        waited = 0.0
+        while True:
+            allowed, retry_after = self.check(key)
+            if allowed:
+                return True
+            if max_wait is not None and waited + retry_after > max_wait:
+                return False
+            time.sleep(retry_after)
+            waited += retry_after
+
+    def _evict_idle(self, now):
+        """Drop fully recovered keys from the front of the update order"""
+        while self._tats:
+            key, tat = next(iter(self._tats.items()))
+            if tat > now:
+                break
+            self._tats.popitem(last=False)
+
+    def __len__(self):
+        return len(self._tats)
+
+
+# Shared by every outbound WhatsApp send in this process
+whatsapp_send_limiter = GCRA(WHATSAPP_SEND_RATE, burst=WHATSAPP_SEND_RATE)
+whatsapp_pair_limiter = GCRA(1, burst=WHATSAPP_PAIR_BURST, period=WHATSAPP_PAIR_INTERVAL)
+
+
+def acquire_whatsapp_send(recipient, max_wait=WHATSAPP_SEND_MAX_WAIT):
+    """
+    Wait for a send slot under both the per-customer pair limit and the business
+    number's throughput cap.
+
+    The pair limit is checked first without using it, then the throughput slot is
+    taken, then the pair slot; a refused send therefore does not use up the
+    recipient's pair allowance.
+
+    Returns:
+        bool: True if the message may be sent, False if the wait would exceed max_wait
+    """
+    recipient_key = str(recipient)
+    if whatsapp_pair_limiter.peek(recipient_key) > max_wait:
+        logger.warning(f"Pair rate limit for {recipient} would delay the send beyond {max_wait}s")
+        return False
+    started_at = time.monotonic()
+    if not whatsapp_send_limiter.acquire("", max_wait):
+        logger.warning(f"WhatsApp throughput limit would delay the send beyond {max_wait}s")
+        return False
+    remaining = max(0.0, max_wait - (time.monotonic() - started_at))
+    if not whatsapp_pair_limiter.acquire(recipient_key, remaining):
+        logger.warning(f"Pair rate limit for {recipient} would delay the send beyond {max_wait}s")
+        return False
+    return True
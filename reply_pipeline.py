@@ -0,0 +1,297 @@
+import os
+import time
+import zlib
+import heapq
+import logging
+import threading
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Worker pool settings ---
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", "4"))
+REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", "200"))  # total pending messages across all workers
+REPLY_ENQUEUE_TIMEOUT = float(os.getenv("REPLY_ENQUEUE_TIMEOUT", "0.2"))  # seconds
+# Messages from one customer arriving within this window of each other are handled as one batch
+REPLY_COALESCE_WINDOW = float(os.getenv("REPLY_COALESCE_WINDOW", "1.0"))  # seconds, 0 disables
+REPLY_COALESCE_MAX_DELAY = float(os.getenv("REPLY_COALESCE_MAX_DELAY", "4.0"))  # seconds after the first message
+REPLY_COALESCE_MAX_MESSAGES = int(os.getenv("REPLY_COALESCE_MAX_MESSAGES", "10"))
+# A batch whose handler raises RetryLater is put back with a doubling delay, up to this many times
+REPLY_RETRY_LIMIT = int(os.getenv("REPLY_RETRY_LIMIT", "8"))
+REPLY_RETRY_DELAY = float(os.getenv("REPLY_RETRY_DELAY", "2.0"))  # seconds before the first retry
+REPLY_RETRY_MAX_DELAY = float(os.getenv("REPLY_RETRY_MAX_DELAY", "60"))  # seconds
+# On shutdown, queued and coalescing messages get this long to be handled; keep it below
+# gunicorn's graceful_timeout so the worker is not killed mid-drain
+REPLY_DRAIN_TIMEOUT = float(os.getenv("REPLY_DRAIN_TIMEOUT", "20"))  # seconds
+
+
+class RetryLater(Exception):
+    """Raised by a handler that could not start on a batch (e.g. the customer's state is locked elsewhere)"""
+
+
+class _Shard:
+    """One worker's mailboxes and the heap of when each becomes due"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.pending = 0
+        self.mailboxes = {}  # Structure: { customer_number: {"messages", "first_at", "last_at", "due", "attempts"} }
+        self.due_heap = []  # (due, customer_number), entries whose due no longer matches are stale
+        self.condition = threading.Condition()
+
+
+class ReplyPipeline:
+    """
+    Bounded worker pool that handles inbound messages off the webhook request thread.
+
+    Every customer number is pinned to a single worker, so messages from the same
+    customer are always processed in the order they arrived while different
+    customers are served in parallel. Each customer has a mailbox: messages that
+    arrive within the coalesce window of the previous one are delivered together
+    as handler(customer_number, [message, ...]). A handler that raises RetryLater
+    gets the same messages again after a backoff, ahead of any that arrived since.
+    stop() drains what was already accepted before the process exits.
+    """
+
+    def __init__(self, handler, workers=REPLY_WORKERS, queue_size=REPLY_QUEUE_SIZE,
+                 coalesce_window=REPLY_COALESCE_WINDOW, coalesce_max_delay=REPLY_COALESCE_MAX_DELAY,
+                 coalesce_max_messages=REPLY_COALESCE_MAX_MESSAGES):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.coalesce_window = max(0.0, coalesce_window)
+        self.coalesce_max_delay = max(self.coalesce_window, coalesce_max_delay)
+        self.coalesce_max_messages = max(1, coalesce_max_messages)
+        per_worker_size = max(1, queue_size // self.workers)
+        self.shards = [_Shard(per_worker_size) for _ in range(self.workers)]
+        self.threads = []
+        self._start_lock = threading.Lock()
+        self._started_pid = None
+        self._stopping = False
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.rejected = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_processing = 0.0
+        self.max_processing = 0.0
+
+    def start(self):
+        """Start the worker threads (once per process, so it is safe after a fork)"""
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self.threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index,),
+                    name=f"reply-worker-{index}",
+                    daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+            self._started_pid = os.getpid()
+            logger.info(f"Started reply pipeline with {self.workers} workers")
+
+    def _shard(self, customer_number):
+        """Pick the worker for a customer"""
+        return zlib.crc32(str(customer_number).encode("utf-8")) % self.workers
+
+    def submit(self, customer_number, message):
+        """
+        Add a message to the customer's mailbox for background processing.
+
+        Returns:
+            bool: True if the message was queued, False if the pipeline is full
+        """
+        self.start()
+        shard = self.shards[self._shard(customer_number)]
+        with shard.condition:
+            if self._stopping:
+                # Rejected so the webhook answers 503 and Meta redelivers to a live worker
+                with self._stats_lock:
+                    self.rejected += 1
+                logger.warning(f"Reply pipeline is shutting down, could not queue message from {customer_number}")
+                return False
+            if shard.pending >= shard.capacity:
+                shard.condition.wait_for(lambda: shard.pending < shard.capacity, timeout=REPLY_ENQUEUE_TIMEOUT)
+            if shard.pending >= shard.capacity:
+                with self._stats_lock:
+                    self.rejected += 1
+                logger.warning(f"Reply pipeline is full, could not queue message from {customer_number}")
+                return False
+
+            now = time.monotonic()
+            mailbox = shard.mailboxes.get(customer_number)
+            if mailbox is None:
+                mailbox = {"messages": [], "first_at": now, "last_at": now, "due": None, "attempts": 0}
+                shard.mailboxes[customer_number] = mailbox
+            mailbox["messages"].append(message)
+            mailbox["last_at"] = now
+            if len(mailbox["messages"]) >= self.coalesce_max_messages:
+                due = now
+            else:
+                due = min(now + self.coalesce_window, mailbox["first_at"] + self.coalesce_max_delay)
+            if mailbox["attempts"]:
+                # Waiting out a retry backoff, new messages join the batch without bringing it forward
+                due = max(due, mailbox["due"])
+            if due != mailbox["due"]:
+                mailbox["due"] = due
+                heapq.heappush(shard.due_heap, (due, customer_number))
+            shard.pending += 1
+            shard.condition.notify_all()
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def _next_batch(self, shard):
+        """Block until a mailbox is due and take all of its messages; None once stopped and drained"""
+        with shard.condition:
+            while True:
+                if not shard.due_heap:
+                    if self._stopping:
+                        return None
+                    shard.condition.wait()
+                    continue
+                due, customer_number = shard.due_heap[0]
+                mailbox = shard.mailboxes.get(customer_number)
+                if mailbox is None or mailbox["due"] != due:
+                    heapq.heappop(shard.due_heap)
+                    continue
+                now = time.monotonic()
+                if due > now:
+                    shard.condition.wait(due - now)
+                    continue
+                heapq.heappop(shard.due_heap)
+                del shard.mailboxes[customer_number]
+                shard.pending -= len(mailbox["messages"])
+                shard.condition.notify_all()
+                return customer_number, mailbox["messages"], mailbox["first_at"], mailbox["attempts"]
+
+    def _worker(self, index):
+        """Process due mailboxes from one shard until the pipeline is stopped and drained"""
+        shard = self.shards[index]
+        while True:
+            batch = self._next_batch(shard)
+            if batch is None:
+                return
+            customer_number, messages, enqueued_at, attempts = batch
+            started_at = time.monotonic()
+            wait_time = started_at - enqueued_at
+            failed = False
+            if len(messages) > 1:
+                logger.info(f"Coalesced {len(messages)} messages from {customer_number}")
+            try:
+                self.handler(customer_number, messages)
+            except RetryLater as e:
+                if attempts < REPLY_RETRY_LIMIT:
+                    delay = min(REPLY_RETRY_MAX_DELAY, REPLY_RETRY_DELAY * (2 ** attempts))
+                    if self._stopping:
+                        delay = min(delay, REPLY_RETRY_DELAY)
+                    logger.warning(f"Retrying {len(messages)} messages from {customer_number} in {delay:.1f}s: {str(e)}")
+                    self._requeue(shard, customer_number, messages, attempts + 1, delay)
+                    with self._stats_lock:
+                        self.retried += len(messages)
+                    continue
+                failed = True
+                logger.error(f"Giving up on {len(messages)} messages from {customer_number} after {attempts} retries: {str(e)}")
+            except Exception as e:
+                failed = True
+                logger.error(f"Error processing messages from {customer_number}: {str(e)}", exc_info=True)
+            # Only final outcomes are recorded; requeued batches count in `retried`
+            processing_time = time.monotonic() - started_at
+            self._record(len(messages), wait_time, processing_time, failed)
+
+    def stop(self, timeout=REPLY_DRAIN_TIMEOUT):
+        """
+        Stop accepting messages and handle everything already queued, without
+        waiting out coalesce windows, for at most timeout seconds.
+
+        Called from gunicorn's worker_exit hook and at interpreter exit; safe to
+        call more than once.
+
+        Returns:
+            int: Number of messages left unhandled when the timeout ran out
+        """
+        if self._started_pid != os.getpid():
+            return 0
+        now = time.monotonic()
+        for shard in self.shards:
+            with shard.condition:
+                self._stopping = True
+                # Coalescing mailboxes are handled now; retries keep their (short) backoff
+                for customer_number, mailbox in shard.mailboxes.items():
+                    if not mailbox["attempts"] and mailbox["due"] > now:
+                        mailbox["due"] = now
+                        heapq.heappush(shard.due_heap, (now, customer_number))
+                shard.condition.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        left = sum(shard.pending for shard in self.shards)
+        if left:
+            logger.error(f"Reply pipeline stopped with {left} messages unhandled after {timeout:.0f}s")
+        else:
+            logger.info("Reply pipeline drained")
+        return left
+
+    def _requeue(self, shard, customer_number, messages, attempts, delay):
+        """Put a batch back at the front of the customer's mailbox, due after delay"""
+        with shard.condition:
+            now = time.monotonic()
+            mailbox = shard.mailboxes.get(customer_number)
+            if mailbox is None:
+                mailbox = {"messages": [], "first_at": now, "last_at": now, "due": None, "attempts": 0}
+                shard.mailboxes[customer_number] = mailbox
+            mailbox["messages"] = messages + mailbox["messages"]
+            mailbox["attempts"] = attempts
+            mailbox["due"] = now + delay
+            heapq.heappush(shard.due_heap, (mailbox["due"], customer_number))
+            # Already accepted once, so this may briefly go over capacity
+            shard.pending += len(messages)
+            shard.condition.notify_all()
+
+    def _record(self, message_count, wait_time, processing_time, failed):
+        with self._stats_lock:
+            self.batches += 1
+            self.coalesced += message_count - 1
+            self.processed += message_count
+            if failed:
+                self.failed += message_count
+            self.total_wait += wait_time
+            self.max_wait = max(self.max_wait, wait_time)
+            self.total_processing += processing_time
+            self.max_processing = max(self.max_processing, processing_time)
+
+    def stats(self):
+        """Return queue depth and timing metrics for the health endpoint"""
+        with self._stats_lock:
+            batches = self.batches
+            return {
+                "workers": self.workers,
+                "queue_depth": sum(shard.pending for shard in self.shards),
+                "queue_capacity": sum(shard.capacity for shard in self.shards),
+                "coalesce_window_ms": round(self.coalesce_window * 1000),
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "batches": batches,
+                "coalesced": self.coalesced,
+                "failed": self.failed,
+                "retried": self.retried,
+                "avg_wait_ms": round(self.total_wait / batches * 1000, 2) if batches else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "avg_processing_ms": round(self.total_processing / batches * 1000, 2) if batches else 0.0,
+                "max_processing_ms": round(self.max_processing * 1000, 2),
+            }
@@ -0,0 +1,189 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Response cache settings ---
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "500"))  # cached answers per process
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "21600"))  # seconds
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.75"))  # trigram Jaccard threshold
+RESPONSE_CACHE_MAX_LENGTH = 200  # longer messages are too specific to reuse answers for
+
+# Words that only make sense against earlier turns, so the answer depends on the conversation
+CONTEXT_WORDS = {
+    "it", "its", "that", "this", "these", "those", "them", "they", "he", "she", "him", "her",
+    "my", "me", "mine", "again", "earlier", "before", "above", "previous", "same", "instead",
+    "yes", "no", "ok", "okay", "sure", "also", "else", "more", "other", "another"
+}
+
+# Greetings and politeness that do not change the question being asked
+FILLER_WORDS = {"hi", "hello", "hey", "please", "pls", "plz", "thanks", "thank", "you", "meowkies", "dr", "doctor"}
+
+NON_WORD_PATTERN = re.compile(r"[^a-z0-9$ ]+")
+
+# Question and function words that rephrasings swap freely ("what are ur hours" vs
+# "what are your hours"). Every other word (days, numbers, treatments, names, ...)
+# is content, and a near match only counts when both questions have the same set.
+FUNCTION_WORDS = {
+    "a", "an", "the", "is", "are", "am", "was", "be", "do", "does", "did", "can", "could",
+    "will", "would", "should", "may", "i", "we", "u", "ur", "your", "yours", "what", "whats",
+    "when", "where", "which", "who", "how", "hows", "much", "many", "any", "there", "here",
+    "to", "of", "for", "on", "in", "at", "and", "or", "about", "know", "tell", "want", "like",
+    "just", "need", "wondering", "ask", "asking", "s", "m", "r"
+}
+
+
+def normalize_message(text):
+    """Lowercase, strip punctuation and filler words, collapse whitespace"""
+    words = NON_WORD_PATTERN.sub(" ", text.lower()).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def content_tokens(normalized):
+    """Every word of a normalised message except function words"""
+    return frozenset(word for word in normalized.split() if word not in FUNCTION_WORDS)
+
+
+def _trigrams(normalized):
+    padded = f" {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def is_cacheable(message, has_booking_state):
+    """
+    Whether a reply to this message can be shared with other customers.
+
+    Skips customers in the middle of a booking flow and messages that refer back
+    to the conversation ("is it available?", "what about that one").
+    """
+    if has_booking_state:
+        return False
+    if len(message) > RESPONSE_CACHE_MAX_LENGTH:
+        return False
+    words = NON_WORD_PATTERN.sub(" ", message.lower()).split()
+    if any(word in CONTEXT_WORDS for word in words):
+        return False
+    return len(normalize_message(message)) >= 3
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of Gemini answers keyed on the normalised message.
+
+    Lookups try the exact normalised key first, then a character trigram index
+    that finds the most similar cached question (Jaccard similarity), so small
+    rephrasings like "what are ur opening hours" still hit. A similar question
+    only matches if all of its content words (anything but FUNCTION_WORDS) are the same,
+    so an answer that depends on a name, day or treatment is not reused for another.
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, similarity=RESPONSE_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()  # Structure: { normalized: {"response", "trigrams", "content", "created_at", "latency"} }
+        self._index = defaultdict(set)  # Structure: { trigram: {normalized, ...} }
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.lookups = 0
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.latency_saved = 0.0
+
+    def lookup(self, message):
+        """Return the cached answer for a message, or None"""
+        normalized = normalize_message(message)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            key = normalized if normalized in self._entries else None
+            exact = key is not None
+            if key is None:
+                key = self._most_similar(_trigrams(normalized), content_tokens(normalized))
+            if key is None:
+                return None
+
+            entry = self._entries[key]
+            if now - entry["created_at"] > self.ttl:
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            if exact:
+                self.exact_hits += 1
+            else:
+                self.similar_hits += 1
+            self.latency_saved += entry["latency"]
+            logger.debug(f"Response cache {'exact' if exact else 'similar'} hit for '{normalized}' -> '{key}'")
+            return entry["response"]
+
+    def store(self, message, response, latency):
+        """Cache the answer to a message along with how long Gemini took to produce it"""
+        normalized = normalize_message(message)
+        if not normalized or not response:
+            return
+        with self._lock:
+            if normalized in self._entries:
+                self._remove(normalized)
+            trigrams = _trigrams(normalized)
+            self._entries[normalized] = {
+                "response": response,
+                "trigrams": trigrams,
+                "content": content_tokens(normalized),
+                "created_at": time.time(),
+                "latency": latency
+            }
+            for trigram in trigrams:
+                self._index[trigram].add(normalized)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _most_similar(self, trigrams, content):
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for key in self._index.get(trigram, ()):
+                shared[key] += 1
+        best_key, best_score = None, self.similarity
+        for key, count in shared.items():
+            entry = self._entries[key]
+            if entry["content"] != content:
+                continue
+            other = len(entry["trigrams"])
+            score = count / (len(trigrams) + other - count)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for trigram in entry["trigrams"]:
+            keys = self._index.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[trigram]
+
+    def stats(self):
+        """Return hit rate and latency saved for the health endpoint"""
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            return {
+                "enabled": RESPONSE_CACHE_ENABLED,
+                "size": len(self._entries),
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "hit_rate": round(hits / self.lookups, 3) if self.lookups else 0.0,
+                "latency_saved_ms": round(self.latency_saved * 1000, 1),
+            }
@@ -0,0 +1,146 @@
+import os
+import time
+import atexit
+import logging
+import threading
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+
+import database
+import googlecalendar
+import weekly_promotions
+from appointment_reminders import cleanup_old_reminders, reminder_scheduler
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- Background job settings ---
+# Set to false on every instance but one when running several hosts; the lock below is per host
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "/tmp/meowkies-scheduler.lock")
+SCHEDULER_LOCK_RETRY = float(os.getenv("SCHEDULER_LOCK_RETRY", "30"))  # seconds between takeover attempts
+
+CALENDAR_BACKFILL_META_KEY = "calendar_phone_backfill"  # set once legacy events carry the phone property
+
+_scheduler = None
+_lock_file = None
+_start_lock = threading.Lock()
+
+
+def _try_lock():
+    """Take the host-wide scheduler lock without blocking; held until the process exits"""
+    global _lock_file
+    if fcntl is None:
+        return True
+    lock_file = open(SCHEDULER_LOCK_FILE, "a")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _lock_file = lock_file
+    return True
+
+
+def backfill_calendar_phones_once():
+    """
+    Tag calendar events booked before the customer phone property existed, once per database.
+
+    Completion is recorded in the meta table; a failed run (calendar unreachable)
+    is retried the next time the jobs start.
+    """
+    if database.get_meta(CALENDAR_BACKFILL_META_KEY):
+        return
+    try:
+        updated = googlecalendar.backfill_customer_phone_properties()
+    except Exception as e:
+        logger.error(f"Calendar phone backfill failed, will retry on next start: {str(e)}")
+        return
+    if updated is None:
+        return
+    database.set_meta(CALENDAR_BACKFILL_META_KEY, f"{time.strftime('%Y-%m-%dT%H:%M:%S')} updated={updated}")
+
+
+def _start_scheduler():
+    global _scheduler
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(cleanup_old_reminders, 'interval', hours=24, id='cleanup_reminders')
+    scheduler.add_job(database.prune_sent_promotions, 'interval', hours=24, id='prune_sent_promotions')
+    scheduler.add_job(database.prune_promotion_jobs, 'interval', hours=24, id='prune_promotion_jobs')
+    # No trigger: runs once, right away, off the request path
+    scheduler.add_job(backfill_calendar_phones_once, id='calendar_phone_backfill')
+    scheduler.add_job(
+        func=weekly_promotions.run_promotion_scheduler,
+        trigger=IntervalTrigger(minutes=1),
+        id='promotion_scheduler',
+        name='Check and send scheduled promotions every minute'
+    )
+    scheduler.start()
+    atexit.register(lambda: scheduler.shutdown(wait=False))
+    _scheduler = scheduler
+    # Reminders are sent by their own thread, which sleeps until the next one is due
+    reminder_scheduler.start()
+    logger.info(f"Started background jobs in process {os.getpid()}")
+
+
+def _wait_for_lock():
+    """Take over the jobs if the process that owns them exits (e.g. a recycled worker)"""
+    while True:
+        time.sleep(SCHEDULER_LOCK_RETRY)
+        with _start_lock:
+            if _scheduler is None and _try_lock():
+                _start_scheduler()
+                return
+
+
+def start_background_jobs():
+    """
+    Start the reminder scheduler and the cleanup, log pruning and promotion jobs in
+    exactly one process per host. The promotion job also resumes blasts that were
+    interrupted by a crash or deploy.
+
+    Every web worker calls this; the first to take SCHEDULER_LOCK_FILE runs the
+    jobs and the others keep retrying in the background so the jobs move to a
+    surviving worker if the owner exits.
+
+    Returns:
+        bool: True if this process runs the jobs
+    """
+    if not SCHEDULER_ENABLED:
+        logger.info("Background jobs are disabled on this instance")
+        return False
+    with _start_lock:
+        if _scheduler is not None:
+            return True
+        if _try_lock():
+            _start_scheduler()
+            return True
+    logger.info(f"Background jobs already run by another process, process {os.getpid()} will stand by")
+    threading.Thread(target=_wait_for_lock, name="scheduler-standby", daemon=True).start()
+    return False
+
+
+def scheduler_status():
+    """Return which jobs this process runs for the health endpoint"""
+    if _scheduler is None:
+        return {"running": False, "pid": os.getpid()}
+    return {
+        "running": True,
+        "pid": os.getpid(),
+        "jobs": [
+            {"id": job.id, "next_run": job.next_run_time.isoformat() if job.next_run_time else None}
+            for job in _scheduler.get_jobs()
+        ],
+        "reminders": reminder_scheduler.stats(),
+        "promotions": weekly_promotions.get_scheduler().stats()
+    }
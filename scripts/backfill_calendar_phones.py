@@ -0,0 +1,30 @@
+"""
+Tag upcoming Google Calendar events with the customer phone property.
+
+Events booked before phone numbers were stored in extendedProperties.private
+are invisible to "view my appointments", cancel and reschedule until they are
+tagged. The background jobs do this once per database on start; run this to do
+it by hand (for example against a different CALENDAR_ID). Already tagged events
+are skipped, so it is safe to repeat.
+
+Usage:
+    python scripts/backfill_calendar_phones.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import googlecalendar
+
+
+def main():
+    updated = googlecalendar.backfill_customer_phone_properties()
+    if updated is None:
+        print("Could not connect to Google Calendar, check GOOGLE_CALENDAR_CREDENTIALS and CALENDAR_ID")
+        sys.exit(1)
+    print(f"Tagged {updated} events with the customer phone property")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark for intent_triggers.extract_intent.
+
+Compares the previous linear `phrase in text` scans with the compiled
+Aho-Corasick matcher, checks that both return identical (intent, treatment)
+tuples for a corpus of messages, and prints the per-message cost.
+
+Usage:
+    python scripts/benchmark_intents.py [iterations]
+"""
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import intent_triggers
+from intent_triggers import (
+    TREATMENT_TYPES, NON_BOOKING_PHRASES, BOOKING_INTENT_PHRASES, INTENT_EXPRESSION_PHRASES,
+    RESCHEDULE_INTENT_PHRASES, VIEW_APPOINTMENTS_INTENT_PHRASES, CANCEL_INTENT_PHRASES,
+    PRICE_INQUIRY_TERMS
+)
+
+
+def legacy_extract_intent(text):
+    """The linear scan used before the compiled matcher"""
+    text_lower = text.lower()
+
+    treatment_code = None
+    for code, variations in TREATMENT_TYPES.items():
+        if any(variation in text_lower for variation in variations):
+            treatment_code = code
+            break
+
+    if any(term in text_lower for term in PRICE_INQUIRY_TERMS):
+        return "info", treatment_code
+
+    has_booking = (
+        not any(phrase in text_lower for phrase in NON_BOOKING_PHRASES)
+        and any(phrase in text_lower for phrase in BOOKING_INTENT_PHRASES)
+        and any(expr in text_lower for expr in INTENT_EXPRESSION_PHRASES)
+    )
+    if has_booking and treatment_code:
+        return "booking", treatment_code
+    elif any(phrase in text_lower for phrase in RESCHEDULE_INTENT_PHRASES):
+        return "reschedule", None
+    elif any(phrase in text_lower for phrase in VIEW_APPOINTMENTS_INTENT_PHRASES):
+        return "view", None
+    elif any(phrase in text_lower for phrase in CANCEL_INTENT_PHRASES):
+        return "cancel", None
+    elif treatment_code:
+        return "info", treatment_code
+    return None, None
+
+
+SAMPLE_MESSAGES = [
+    "Hi",
+    "I want to book a facial tomorrow at 3pm",
+    "How much is IPL?",
+    "Can I reschedule my appointment?",
+    "cancel 2",
+    "Show my bookings please",
+    "What are your opening hours on Saturday?",
+    "me want make eye long pretty, when can come clinic",
+    "I'd like to schedule lashes touch up next week",
+    "Where is the clinic located?",
+    "Thank you so much, see you!",
+    "hello, i would like to know more about slimming and body contouring, do you have any promotion this month?",
+]
+
+
+def build_corpus(rng, size):
+    """Sample messages plus random mixes of phrases from every list"""
+    phrases = [phrase for variations in TREATMENT_TYPES.values() for phrase in variations]
+    phrases += (NON_BOOKING_PHRASES + BOOKING_INTENT_PHRASES + INTENT_EXPRESSION_PHRASES
+                + RESCHEDULE_INTENT_PHRASES + VIEW_APPOINTMENTS_INTENT_PHRASES + CANCEL_INTENT_PHRASES)
+    filler = ["hi", "there", "please", "ok", "thanks", "the", "a", "on", "friday", "at", "3pm"]
+    corpus = list(SAMPLE_MESSAGES)
+    while len(corpus) < size:
+        words = rng.sample(filler, rng.randint(0, 4)) + rng.sample(phrases, rng.randint(0, 3))
+        rng.shuffle(words)
+        text = " ".join(words)
+        corpus.append(text.upper() if rng.random() < 0.1 else text)
+    return corpus
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rng = random.Random(42)
+    corpus = build_corpus(rng, 2000)
+
+    for text in corpus:
+        expected = legacy_extract_intent(text)
+        actual = intent_triggers.extract_intent(text)
+        assert expected == actual, f"Mismatch for {text!r}: {expected} != {actual}"
+    print(f"Identical results for {len(corpus)} messages")
+
+    phrase_count = sum(len(variations) for variations in TREATMENT_TYPES.values()) + sum(
+        len(phrases) for phrases in (PRICE_INQUIRY_TERMS, NON_BOOKING_PHRASES, BOOKING_INTENT_PHRASES,
+                                     INTENT_EXPRESSION_PHRASES, RESCHEDULE_INTENT_PHRASES,
+                                     VIEW_APPOINTMENTS_INTENT_PHRASES, CANCEL_INTENT_PHRASES))
+    runs = iterations * len(corpus)
+    legacy = timeit.timeit(lambda: [legacy_extract_intent(text) for text in corpus], number=iterations)
+    compiled = timeit.timeit(lambda: [intent_triggers.extract_intent(text) for text in corpus], number=iterations)
+    print(f"Phrase table: {phrase_count} phrases")
+    print(f"Linear scan:     {legacy / runs * 1e6:8.2f} us/message")
+    print(f"Compiled matcher: {compiled / runs * 1e6:7.2f} us/message  ({legacy / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
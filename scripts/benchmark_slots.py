@@ -0,0 +1,115 @@
+"""
+Micro-benchmark for get_available_slots' slot computation.
+
+Compares the previous nested slot x event loop (which re-parsed every event for
+every slot) with the merged-interval sweep, checks that both produce identical
+slots for every treatment in TREATMENT_DURATIONS, and prints the timings.
+No Calendar API calls are made.
+
+Usage:
+    python scripts/benchmark_slots.py [events_per_day] [iterations]
+"""
+import os
+import sys
+import random
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import googlecalendar
+from googlecalendar import CLINIC_TIMEZONE, TREATMENT_DURATIONS
+
+
+def legacy_available_slots(date_obj, start_time, end_time, treatment_duration, events):
+    """The nested loop used before the interval sweep"""
+    all_slots = []
+    current_time = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, start_time))
+    end_datetime = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, end_time))
+
+    while current_time + timedelta(minutes=treatment_duration) <= end_datetime:
+        all_slots.append(current_time)
+        current_time += timedelta(minutes=30)
+
+    available_slots = []
+    for slot in all_slots:
+        slot_end = slot + timedelta(minutes=treatment_duration)
+        is_available = True
+
+        for event in events:
+            event_start_str = event['start'].get('dateTime', event['start'].get('date'))
+            event_end_str = event['end'].get('dateTime', event['end'].get('date'))
+
+            if 'date' in event['start']:
+                event_start = CLINIC_TIMEZONE.localize(datetime.strptime(event_start_str, "%Y-%m-%d")).replace(hour=0, minute=0, second=0)
+                event_end = CLINIC_TIMEZONE.localize(datetime.strptime(event_end_str, "%Y-%m-%d")).replace(hour=23, minute=59, second=59)
+            else:
+                event_start = datetime.fromisoformat(event_start_str).astimezone(CLINIC_TIMEZONE)
+                event_end = datetime.fromisoformat(event_end_str).astimezone(CLINIC_TIMEZONE)
+
+            if not (slot_end <= event_start or slot >= event_end):
+                is_available = False
+                break
+
+        if is_available:
+            available_slots.append(slot)
+
+    return available_slots
+
+
+def sweep_available_slots(date_obj, start_time, end_time, treatment_duration, events):
+    """Parse once, merge, then sweep (the current implementation)"""
+    intervals = [googlecalendar._parse_event_interval(event) for event in events]
+    return googlecalendar.find_free_slots(
+        CLINIC_TIMEZONE.localize(datetime.combine(date_obj, start_time)),
+        CLINIC_TIMEZONE.localize(datetime.combine(date_obj, end_time)),
+        googlecalendar.merge_busy_intervals(intervals),
+        timedelta(minutes=treatment_duration)
+    )
+
+
+def random_events(date_obj, count, rng):
+    """Generate a busy Saturday: bookings and staff blocks of 15-180 minutes"""
+    events = []
+    day_start = CLINIC_TIMEZONE.localize(datetime.combine(date_obj, datetime.min.time())) + timedelta(hours=10)
+    for index in range(count):
+        start = day_start + timedelta(minutes=rng.randrange(0, 13 * 60, 15))
+        end = start + timedelta(minutes=rng.choice([0, 15, 30, 45, 60, 90, 120, 180]))
+        events.append({
+            "id": f"event_{index}",
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": end.isoformat()},
+        })
+    return events
+
+
+def main():
+    events_per_day = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(42)
+
+    # Next Saturday, the longest business day
+    today = datetime.now(CLINIC_TIMEZONE).date()
+    date_obj = today + timedelta(days=(5 - today.weekday()) % 7 or 7)
+    start_time = datetime.strptime("11:00", "%H:%M").time()
+    end_time = datetime.strptime("22:00", "%H:%M").time()
+
+    # Correctness: identical output across many random days and every treatment
+    for _ in range(200):
+        events = random_events(date_obj, rng.randint(0, events_per_day), rng)
+        for duration in TREATMENT_DURATIONS.values():
+            expected = legacy_available_slots(date_obj, start_time, end_time, duration, events)
+            actual = sweep_available_slots(date_obj, start_time, end_time, duration, events)
+            assert expected == actual, f"Mismatch for {duration} minutes with {len(events)} events"
+    print("Output identical for all treatments on 200 random days")
+
+    events = random_events(date_obj, events_per_day, rng)
+    for treatment, duration in TREATMENT_DURATIONS.items():
+        legacy = timeit.timeit(lambda: legacy_available_slots(date_obj, start_time, end_time, duration, events), number=iterations)
+        sweep = timeit.timeit(lambda: sweep_available_slots(date_obj, start_time, end_time, duration, events), number=iterations)
+        print(f"{treatment:>15}: legacy {legacy / iterations * 1000:7.3f} ms  "
+              f"sweep {sweep / iterations * 1000:7.3f} ms  ({legacy / sweep:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+HTTP load test for the webhook server.
+
+Sends requests from a pool of threads for a fixed duration and prints
+requests per second and latency percentiles, so the Flask development server
+(`python app.py`) can be compared with gunicorn
+(`gunicorn -c gunicorn.conf.py app:app`).
+
+Modes:
+    status   POST /webhook with a delivery-status payload (parsing only, no replies)
+    message  POST /webhook with a text message with a unique id per request; point
+             the WhatsApp and Gemini URLs at scripts/mock_gemini_server.py or similar
+    health   GET /health
+
+Usage:
+    python scripts/load_test.py [--url http://127.0.0.1:8080] [--mode status]
+                                [--concurrency 32] [--duration 10]
+"""
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+
+import requests
+
+
+def status_payload():
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {"statuses": [
+            {"id": f"wamid.{uuid.uuid4().hex}", "status": "delivered", "recipient_id": "6590000000"}
+        ]}}]}]
+    }
+
+
+def message_payload(worker_index):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {"messages": [{
+            "from": f"6590{worker_index:06d}",
+            "id": f"wamid.{uuid.uuid4().hex}",
+            "timestamp": str(int(time.time())),
+            "type": "text",
+            "text": {"body": "what are your opening hours"}
+        }]}}]}]
+    }
+
+
+def run_worker(index, args, deadline, latencies, statuses, lock):
+    session = requests.Session()
+    local_latencies = []
+    local_statuses = Counter()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if args.mode == "health":
+                response = session.get(f"{args.url}/health", timeout=30)
+            else:
+                payload = status_payload() if args.mode == "status" else message_payload(index)
+                response = session.post(f"{args.url}/webhook", json=payload, timeout=30)
+            local_statuses[response.status_code] += 1
+        except requests.RequestException as e:
+            local_statuses[type(e).__name__] += 1
+            continue
+        local_latencies.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local_latencies)
+        statuses.update(local_statuses)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--mode", choices=["status", "message", "health"], default="status")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=run_worker, args=(index, args, deadline, latencies, statuses, lock))
+        for index in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{args.mode} x{args.concurrency} for {elapsed:.1f}s against {args.url}")
+    print(f"  requests: {len(latencies)}  ({len(latencies) / elapsed:.1f} req/s)")
+    print(f"  latency ms: p50={percentile(latencies, 0.50) * 1000:.1f} "
+          f"p95={percentile(latencies, 0.95) * 1000:.1f} p99={percentile(latencies, 0.99) * 1000:.1f}")
+    print(f"  responses: {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Local stand-in for the Gemini REST API.
+
+Implements cachedContents create/patch, generateContent and
+streamGenerateContent (SSE) with usageMetadata, counting tokens as ~4
+characters each, so prompt-token savings from context caching and the
+time-to-first-message of streamed replies can be measured without calling
+Google. Point the app at it with:
+
+    GEMINI_API_BASE=http://127.0.0.1:8089/v1beta GEMINI_LOG_TOKEN_USAGE=true GEMINI_STREAMING=true
+
+Usage:
+    python scripts/mock_gemini_server.py [--port 8089] [--min-cache-tokens 0] [--stream-delay 0.05]
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Long multi-paragraph answer shaped like the price list reply. Both endpoints take the
+# same time to "generate" it, streamGenerateContent just sends it in pieces as it goes.
+MOCK_REPLY = (
+    "Meow! Here are our most popular treatments and prices 🐱\n\n"
+    "```\nMedical Facial      $150\nLaser Treatment     $280\nIPL                 $200\n"
+    "Botox (per area)    $350\nFiller (per ml)     $650\n```\n\n"
+    "All first-time customers get a complimentary skin consultation with Dr. Meow, "
+    "and packages of 5 sessions come with one extra session on the house.\n\n"
+    "Prices include GST. Results vary from person to person, so Dr. Meow will recommend "
+    "the right plan for your skin during your visit.\n\n"
+    "Would you like me to book an appointment for you? ✨"
+)
+STREAM_DELAY = 0.05
+STREAM_PIECE_CHARS = 24
+
+caches = {}  # Structure: { "cachedContents/N": {"tokens": int, "expires_at": float} }
+caches_lock = threading.Lock()
+totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+MIN_CACHE_TOKENS = 0
+
+
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+def parts_tokens(content):
+    return sum(count_tokens(part.get("text", "")) for part in content.get("parts", []))
+
+
+def reply_pieces():
+    return [MOCK_REPLY[i:i + STREAM_PIECE_CHARS] for i in range(0, len(MOCK_REPLY), STREAM_PIECE_CHARS)]
+
+
+def parse_ttl(ttl):
+    return float(str(ttl).rstrip("s") or 0)
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        body = self._read_json()
+        if path.endswith("/cachedContents"):
+            return self._create_cache(body)
+        if re.search(r"/models/[^/]+:generateContent$", path):
+            return self._generate(body)
+        if re.search(r"/models/[^/]+:streamGenerateContent$", path):
+            return self._stream_generate(body)
+        self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {path}"}})
+
+    def do_PATCH(self):
+        path = self.path.split("?")[0]
+        body = self._read_json()
+        name = path.split("/v1beta/", 1)[-1]
+        with caches_lock:
+            cache = caches.get(name)
+            if not cache or cache["expires_at"] < time.time():
+                return self._send_json(404, {"error": {"code": 404, "message": "CachedContent not found"}})
+            cache["expires_at"] = time.time() + parse_ttl(body.get("ttl", "3600s"))
+        self._send_json(200, {"name": name})
+
+    def _create_cache(self, body):
+        tokens = parts_tokens(body.get("systemInstruction", {}))
+        if tokens < MIN_CACHE_TOKENS:
+            return self._send_json(400, {"error": {"code": 400, "message": f"Cached content is too small: {tokens} < {MIN_CACHE_TOKENS}"}})
+        with caches_lock:
+            name = f"cachedContents/{len(caches) + 1}"
+            caches[name] = {"tokens": tokens, "expires_at": time.time() + parse_ttl(body.get("ttl", "3600s"))}
+        print(f"created {name} ({tokens} tokens)", flush=True)
+        self._send_json(200, {"name": name, "model": body.get("model")})
+
+    def _prompt_tokens(self, body):
+        """Return (prompt_tokens, cached_tokens), or None if the cache handle is unknown"""
+        prompt_tokens = sum(parts_tokens(content) for content in body.get("contents", []))
+        prompt_tokens += parts_tokens(body.get("systemInstruction", {}))
+        cached_tokens = 0
+        if body.get("cachedContent"):
+            with caches_lock:
+                cache = caches.get(body["cachedContent"])
+                if not cache or cache["expires_at"] < time.time():
+                    return None
+                cached_tokens = cache["tokens"]
+            prompt_tokens += cached_tokens
+        return prompt_tokens, cached_tokens
+
+    def _record(self, prompt_tokens, cached_tokens):
+        with caches_lock:
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_tokens"] += cached_tokens
+            summary = dict(totals)
+        print(
+            f"generateContent prompt={prompt_tokens} cached={cached_tokens} uncached={prompt_tokens - cached_tokens} "
+            f"| totals {summary}",
+            flush=True
+        )
+
+    def _generate(self, body):
+        counted = self._prompt_tokens(body)
+        if counted is None:
+            return self._send_json(403, {"error": {"code": 403, "message": "CachedContent not found (or permission denied)"}})
+        prompt_tokens, cached_tokens = counted
+        self._record(prompt_tokens, cached_tokens)
+        time.sleep(STREAM_DELAY * len(reply_pieces()))
+        self._send_json(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": MOCK_REPLY}]}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": count_tokens(MOCK_REPLY),
+                "totalTokenCount": prompt_tokens + count_tokens(MOCK_REPLY)
+            }
+        })
+
+    def _stream_generate(self, body):
+        counted = self._prompt_tokens(body)
+        if counted is None:
+            return self._send_json(403, {"error": {"code": 403, "message": "CachedContent not found (or permission denied)"}})
+        prompt_tokens, cached_tokens = counted
+        self._record(prompt_tokens, cached_tokens)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        pieces = reply_pieces()
+        for index, piece in enumerate(pieces):
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            if index == len(pieces) - 1:
+                event["candidates"][0]["finishReason"] = "STOP"
+                event["usageMetadata"] = {
+                    "promptTokenCount": prompt_tokens,
+                    "cachedContentTokenCount": cached_tokens,
+                    "candidatesTokenCount": count_tokens(MOCK_REPLY),
+                    "totalTokenCount": prompt_tokens + count_tokens(MOCK_REPLY)
+                }
+            self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(STREAM_DELAY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    global MIN_CACHE_TOKENS, STREAM_DELAY
+    parser = argparse.ArgumentParser(description="Mock Gemini API server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--min-cache-tokens", type=int, default=0,
+                        help="reject cachedContents smaller than this, like the real API's minimum")
+    parser.add_argument("--stream-delay", type=float, default=0.05,
+                        help="seconds between streamed chunks")
+    args = parser.parse_args()
+    MIN_CACHE_TOKENS = args.min_cache_tokens
+    STREAM_DELAY = args.stream_delay
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockGeminiHandler)
+    print(f"Mock Gemini server listening on http://127.0.0.1:{args.port}/v1beta", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
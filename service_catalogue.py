@@ -0,0 +1,178 @@
+import re
+import message_templates
+
+# --- Clinic details ---
+CLINIC_NAME = "Meow Aesthetic Clinic"
+CLINIC_ADDRESS = "Woods Square Tower 1, #05-62 S737715"
+CLINIC_PHONE = "87713358"
+
+# Business hours for each day (0 = Monday); None means closed
+BUSINESS_HOURS = {
+    0: {"start": "11:00 AM", "end": "8:00 PM"},  # Monday
+    1: {"start": "11:00 AM", "end": "8:00 PM"},  # Tuesday
+    2: {"start": "11:00 AM", "end": "8:00 PM"},  # Wednesday
+    3: {"start": "11:00 AM", "end": "8:00 PM"},  # Thursday
+    4: {"start": "11:00 AM", "end": "8:00 PM"},  # Friday
+    5: {"start": "11:00 AM", "end": "10:00 PM"},  # Saturday
+    6: None,  # Sunday (closed)
+}
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# --- Price list ---
+# Each section lists (service, price) pairs in the order they are shown to customers
+PRICE_SECTIONS = {
+    "ipl": {
+        "title": "IPL Services",
+        "items": [
+            ("IPL upper/lower lip with whitening mask (Male)", "$78"),
+            ("IPL upper lip with whitening mask (Female)", "$58"),
+            ("IPL for two full hands (Female)", "$188"),
+            ("IPL for two half hands (Female)", "$128"),
+            ("IPL for two full legs (Female)", "$258"),
+            ("IPL for two half legs (Female)", "$158"),
+            ("IPL for two full hands (Male)", "$288"),
+            ("IPL for two half hands (Male)", "$188"),
+            ("IPL for two full legs (Male)", "$288"),
+            ("IPL for two half legs (Male)", "$158"),
+            ("Hand Spa", "$38"),
+            ("Foot Spa", "$58"),
+            ("Hand and foot whitening mask", "$38"),
+        ]
+    },
+    "facial": {
+        "title": "Facial Treatments",
+        "items": [
+            ("Hydrafacial with Serum", "$88"),
+            ("Bojin Meridian facial", "$78"),
+            ("Deep cleansing facial", "$78"),
+            ("Deep Aqua cleansing treatment", "$78"),
+            ("Hydration treatment", "$68"),
+            ("Gua Sha treatment", "$78"),
+            ("Vitamin C whitening treatment", "$78"),
+            ("24k Gold Anti-aging treatment", "$108"),
+            ("Blackhead facial", "$68"),
+            ("Acne treatment", "$78"),
+            ("Eye treatment", "$48"),
+            ("Eye Gua Sha", "$58"),
+            ("IPL first trial", "$30 to $60"),
+        ]
+    },
+    "lashes": {
+        "title": "Lashes & Touchup",
+        "items": [
+            ("Lash lift + Tint/1D Classic", "$38-68"),
+            ("2D Souffle/YY Lashes", "$48-78"),
+            ("3D Lightweight/Wetlook Lashes", "$48-88"),
+            ("Foxy/Mermaid/Fairy Lashes", "$58-98"),
+            ("Sunflower/Thai/Comic Lashes", "$58-108"),
+            ("Wispy Kim K/Wispy YY Lashes", "$58-108"),
+            ("4D-6D Super Volume Lashes", "$58-118"),
+            ("8D-Mega Volume Lashes", "$68-128"),
+            ("Lower Lashes", "$28"),
+            ("Removal only", "$18"),
+        ]
+    },
+}
+
+PRICE_NOTE = "Prices may vary depending on specific requirements. Please visit our clinic for a personalized consultation."
+
+# Treatment codes from intent_triggers.TREATMENT_TYPES that have a price section
+TREATMENT_PRICE_SECTIONS = {
+    "ipl": "ipl",
+    "medical_facial": "facial",
+    "lashes": "lashes",
+    "lashes_touchup": "lashes",
+}
+
+# Questions with these words need judgement (comparisons, deals, references to
+# earlier messages), so they are left to the LLM
+AMBIGUOUS_WORDS = {
+    "it", "that", "this", "those", "them", "which", "why", "cheaper", "cheapest", "compare",
+    "difference", "versus", "vs", "better", "best", "worth", "recommend", "discount", "promo",
+    "promotion", "package", "packages", "offer", "deal", "deals", "holiday", "holidays", "today", "tomorrow"
+}
+MAX_FAST_PATH_LENGTH = 120  # longer messages usually carry more than one question
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def render_price_sections(section_keys=None):
+    """Render price sections as WhatsApp-formatted lists, all of them by default"""
+    keys = section_keys or list(PRICE_SECTIONS)
+    blocks = []
+    for key in keys:
+        section = PRICE_SECTIONS[key]
+        lines = [f"*{section['title']}*"]
+        lines.extend(f"- {name}: {price}" for name, price in section["items"])
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + f"\n\n_Note: {PRICE_NOTE}_"
+
+
+def _short_time(time_str):
+    """'11:00 AM' -> '11am', '8:30 PM' -> '8:30pm'"""
+    clock, period = time_str.split()
+    hour, minute = clock.split(":")
+    return f"{int(hour)}{'' if minute == '00' else ':' + minute}{period.lower()}"
+
+
+def render_business_hours(bullet="-"):
+    """Render BUSINESS_HOURS with consecutive days that share hours grouped together"""
+    lines = []
+    day = 0
+    while day < 7:
+        hours = BUSINESS_HOURS.get(day)
+        last = day
+        while last + 1 < 7 and BUSINESS_HOURS.get(last + 1) == hours:
+            last += 1
+        days = DAY_NAMES[day] if last == day else f"{DAY_NAMES[day]} to {DAY_NAMES[last]}"
+        if hours is None:
+            lines.append(f"{bullet} {days} and Public Holidays: Closed")
+        else:
+            lines.append(f"{bullet} {days}: {_short_time(hours['start'])} - {_short_time(hours['end'])}")
+        day = last + 1
+    return "\n".join(lines)
+
+
+def answer_inquiry(text_lower, matches):
+    """
+    Answer price, opening hours and location questions from the catalogue.
+
+    Args:
+        text_lower (str): The lowercased message
+        matches (set): Categories from intent_triggers.match_phrases
+
+    Returns:
+        str or None: The rendered reply, or None when the question is not a plain
+                     catalogue lookup and should go to the LLM. A price question
+                     must name a catalogue treatment or ask for the price list,
+                     so "how much is botox" is left to the LLM.
+    """
+    topics = [topic for topic in ("price", "hours", "location") if topic in matches]
+    if not topics or len(text_lower) > MAX_FAST_PATH_LENGTH:
+        return None
+    if any(word in AMBIGUOUS_WORDS for word in WORD_PATTERN.findall(text_lower)):
+        return None
+
+    replies = []
+    if "price" in topics:
+        treatments = [key.split(":", 1)[1] for key in matches if key.startswith("treatment:")]
+        if not treatments and "price_list" not in matches:
+            # Probably a treatment we do not list, the full price list would not answer it
+            return None
+        sections = []
+        for treatment in treatments:
+            section = TREATMENT_PRICE_SECTIONS.get(treatment)
+            if section is None:
+                # A treatment we have no price table for
+                return None
+            if section not in sections:
+                sections.append(section)
+        # Keep the catalogue order regardless of the order treatments were mentioned
+        sections = [key for key in PRICE_SECTIONS if key in sections]
+        replies.append(message_templates.get_message("price_list_reply", price_list=render_price_sections(sections)))
+    if "hours" in topics:
+        replies.append(message_templates.get_message("business_hours_reply", hours=render_business_hours()))
+    if "location" in topics:
+        replies.append(message_templates.get_message("location_reply", address=CLINIC_ADDRESS, phone=CLINIC_PHONE))
+    return "\n\n".join(replies)
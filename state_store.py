@@ -0,0 +1,706 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from collections import deque
+from collections.abc import MutableMapping
+from datetime import datetime, date
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- State store settings ---
+STATE_STORE_BACKEND = os.getenv("STATE_STORE_BACKEND", "memory")  # memory, sqlite or redis
+STATE_STORE_PATH = os.getenv("STATE_STORE_PATH", "state_store.db")  # SQLite database file
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "meowkies:")
+STATE_LOCK_TIMEOUT = float(os.getenv("STATE_LOCK_TIMEOUT", "30"))  # seconds a per-customer lock lease lasts
+# Held leases are extended this often so slow Gemini, WhatsApp or Calendar calls cannot outlive them
+STATE_LOCK_RENEW_INTERVAL = float(os.getenv("STATE_LOCK_RENEW_INTERVAL", str(STATE_LOCK_TIMEOUT / 3)))
+STATE_SWEEP_INTERVAL = float(os.getenv("STATE_SWEEP_INTERVAL", "30"))  # max seconds between expiry sweeps
+
+
+class StateLockTimeout(TimeoutError):
+    """Another thread or worker held a customer's state lock for longer than STATE_LOCK_TIMEOUT"""
+
+
+# --- Value encoding ---
+def _encode_default(value):
+    """JSON encoder hook for the non-JSON types kept in conversation state"""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, deque):
+        return {"__deque__": list(value), "maxlen": value.maxlen}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_hook(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    if "__deque__" in obj:
+        return deque(obj["__deque__"], maxlen=obj["maxlen"])
+    return obj
+
+
+def encode_value(value):
+    """Serialize a state value to a JSON string"""
+    return json.dumps(value, default=_encode_default)
+
+
+def decode_value(raw):
+    """Deserialize a state value produced by encode_value"""
+    return json.loads(raw, object_hook=_decode_hook)
+
+
+class StateStore:
+    """
+    Namespaced key/value store for per-customer state.
+
+    Backends implement get/set/delete/keys and optionally the cross-process
+    _acquire_lease/_release_lease pair. lock() always serializes threads in this
+    process; durable backends additionally hold a lease so other workers and
+    instances wait for the same customer. Held leases are renewed by a background
+    thread until released, so they only lapse if the holding process stalls or dies.
+    """
+
+    renews_leases = False  # True for backends whose leases expire
+
+    def __init__(self):
+        self._key_locks = {}  # Structure: { name: [RLock, users] }
+        self._key_locks_guard = threading.Lock()
+        self._held = threading.local()
+        self._leases = {}  # Structure: { name: token }, leases held by this process
+        self._leases_lock = threading.Lock()
+        self._renewer_pid = None
+
+    def get(self, namespace, key, default=None):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set key only if it is absent or expired; True if this call stored it"""
+        with self._local_lock(f"{namespace}:{key}"):
+            if self.get(namespace, key) is not None:
+                return False
+            self.set(namespace, key, value, ttl)
+            return True
+
+    def keys(self, namespace):
+        raise NotImplementedError
+
+    def items(self, namespace):
+        """Return (key, value) pairs for all live keys in a namespace"""
+        result = []
+        for key in self.keys(namespace):
+            value = self.get(namespace, key)
+            if value is not None:
+                result.append((key, value))
+        return result
+
+    def purge_expired(self):
+        """Delete expired keys, returning how many were removed"""
+        return 0
+
+    def next_expiry(self):
+        """Epoch time of the earliest pending expiry, or None if unknown"""
+        return None
+
+    def _acquire_lease(self, name, token, deadline):
+        """Take the cross-process lease for name; in-process stores need none"""
+        return True
+
+    def _release_lease(self, name, token):
+        pass
+
+    def _renew_lease(self, name, token):
+        """Push back the expiry of a lease still owned by token; False if it was lost"""
+        return True
+
+    def _track_lease(self, name, token):
+        if not self.renews_leases:
+            return
+        with self._leases_lock:
+            self._leases[name] = token
+            if self._renewer_pid != os.getpid():
+                self._renewer_pid = os.getpid()
+                threading.Thread(target=self._renew_leases, name="state-lease-renewer", daemon=True).start()
+
+    def _untrack_lease(self, name):
+        if not self.renews_leases:
+            return
+        with self._leases_lock:
+            self._leases.pop(name, None)
+
+    def _renew_leases(self):
+        """Extend every lease this process holds, until the process exits"""
+        while True:
+            time.sleep(STATE_LOCK_RENEW_INTERVAL)
+            with self._leases_lock:
+                leases = list(self._leases.items())
+            for name, token in leases:
+                try:
+                    if not self._renew_lease(name, token):
+                        logger.error(f"State lock lease for {name} was lost while held, its update may conflict")
+                except Exception as e:
+                    logger.warning(f"Could not renew state lock for {name}: {str(e)}")
+
+    @contextmanager
+    def _local_lock(self, name):
+        """Per-key RLock shared by the threads of this process, dropped when unused"""
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(name, [threading.RLock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[name]
+
+    @contextmanager
+    def lock(self, key):
+        """Exclusive per-key lock, re-entrant within a thread"""
+        name = str(key)
+        held = getattr(self._held, "names", None)
+        if held is None:
+            held = self._held.names = set()
+        if name in held:
+            yield
+            return
+
+        with self._local_lock(name):
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + STATE_LOCK_TIMEOUT
+            delay = 0.005
+            while not self._acquire_lease(name, token, deadline):
+                if time.monotonic() >= deadline:
+                    raise StateLockTimeout(f"Timed out waiting for state lock on {name}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.2)
+            held.add(name)
+            self._track_lease(name, token)
+            try:
+                yield
+            finally:
+                held.discard(name)
+                self._untrack_lease(name)
+                self._release_lease(name, token)
+
+    @contextmanager
+    def transaction(self, key, *mappings):
+        """
+        Atomic read-modify-write of one customer's state across several mappings.
+
+        While the block runs, each mapping serves the key from a per-thread working
+        copy so handlers can mutate nested dicts and lists in place; the working
+        copies are written back when the block exits. Like the plain dicts these
+        mappings replace, changes made before an exception are kept.
+        """
+        with self.lock(key):
+            for mapping in mappings:
+                mapping._begin(key)
+            try:
+                yield
+            finally:
+                for mapping in mappings:
+                    mapping._commit(key)
+
+
+class InMemoryStateStore(StateStore):
+    """Process-local store, equivalent to the module-level dicts it replaces"""
+
+    def __init__(self):
+        super().__init__()
+        self._data = {}  # Structure: { namespace: { key: (value, expires_at) } }
+        self._data_lock = threading.Lock()
+        # Min-heap of (expires_at, namespace, key). Rewriting a key pushes a new
+        # entry; the old one is skipped when popped because its time no longer matches.
+        self._expiry_heap = []
+
+    def _bucket(self, namespace):
+        return self._data.setdefault(namespace, {})
+
+    def get(self, namespace, key, default=None):
+        with self._data_lock:
+            entry = self._bucket(namespace).get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[namespace][key]
+                return default
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._data_lock:
+            self._bucket(namespace)[key] = (value, expires_at)
+            if expires_at is not None:
+                heapq.heappush(self._expiry_heap, (expires_at, namespace, key))
+
+    def add(self, namespace, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._data_lock:
+            bucket = self._bucket(namespace)
+            entry = bucket.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                return False
+            bucket[key] = (value, expires_at)
+            if expires_at is not None:
+                heapq.heappush(self._expiry_heap, (expires_at, namespace, key))
+            return True
+
+    def delete(self, namespace, key):
+        with self._data_lock:
+            return self._bucket(namespace).pop(key, None) is not None
+
+    def keys(self, namespace):
+        now = time.time()
+        with self._data_lock:
+            return [
+                key for key, (_, expires_at) in self._bucket(namespace).items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def items(self, namespace):
+        now = time.time()
+        with self._data_lock:
+            return [
+                (key, value) for key, (value, expires_at) in self._bucket(namespace).items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def purge_expired(self):
+        """Pop due heap entries and delete the keys whose expiry still matches"""
+        now = time.time()
+        removed = 0
+        with self._data_lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                expires_at, namespace, key = heapq.heappop(heap)
+                bucket = self._data.get(namespace)
+                entry = bucket.get(key) if bucket else None
+                if entry is not None and entry[1] == expires_at:
+                    del bucket[key]
+                    removed += 1
+
+            # Drop superseded entries once they dominate the heap
+            live = sum(len(bucket) for bucket in self._data.values())
+            if len(heap) > 2 * live + 1024:
+                self._expiry_heap = [
+                    (expires_at, namespace, key)
+                    for namespace, bucket in self._data.items()
+                    for key, (_, expires_at) in bucket.items()
+                    if expires_at is not None
+                ]
+                heapq.heapify(self._expiry_heap)
+        return removed
+
+    def next_expiry(self):
+        with self._data_lock:
+            return self._expiry_heap[0][0] if self._expiry_heap else None
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Durable store in a SQLite database running in WAL mode.
+
+    Survives restarts and is shared by every worker process on the same host.
+    """
+
+    renews_leases = True
+
+    def __init__(self, path=STATE_STORE_PATH):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_state_expires_at ON state (expires_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS state_locks (
+                name TEXT PRIMARY KEY,
+                token TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        logger.info(f"Using SQLite state store at {path}")
+
+    def _conn(self):
+        """One connection per thread and process"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=STATE_LOCK_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return decode_value(row[0]) if row else default
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._conn().execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, encode_value(value), expires_at)
+        )
+
+    def add(self, namespace, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, key, now)
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, encode_value(value), expires_at)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, namespace, key):
+        cursor = self._conn().execute(
+            "DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        return cursor.rowcount > 0
+
+    def keys(self, namespace):
+        rows = self._conn().execute(
+            "SELECT key FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def items(self, namespace):
+        rows = self._conn().execute(
+            "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time())
+        ).fetchall()
+        return [(row[0], decode_value(row[1])) for row in rows]
+
+    def purge_expired(self):
+        """Delete expired rows, returning how many were removed"""
+        cursor = self._conn().execute(
+            "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def next_expiry(self):
+        row = self._conn().execute("SELECT MIN(expires_at) FROM state").fetchone()
+        return row[0] if row else None
+
+    def _acquire_lease(self, name, token, deadline):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM state_locks WHERE name = ? AND expires_at <= ?", (name, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO state_locks (name, token, expires_at) VALUES (?, ?, ?)",
+                (name, token, now + STATE_LOCK_TIMEOUT)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def _release_lease(self, name, token):
+        cursor = self._conn().execute(
+            "DELETE FROM state_locks WHERE name = ? AND token = ?", (name, token)
+        )
+        if cursor.rowcount == 0:
+            logger.warning(f"State lock lease for {name} expired before it was released")
+
+    def _renew_lease(self, name, token):
+        cursor = self._conn().execute(
+            "UPDATE state_locks SET expires_at = ? WHERE name = ? AND token = ?",
+            (time.time() + STATE_LOCK_TIMEOUT, name, token)
+        )
+        return cursor.rowcount == 1
+
+
+class RedisStateStore(StateStore):
+    """
+    Store backed by any Redis-protocol server, shared across hosts.
+
+    Pass `client` to use an existing connection (for example fakeredis in local
+    checks); otherwise the optional `redis` package connects to REDIS_URL.
+    """
+
+    renews_leases = True
+
+    def __init__(self, url=REDIS_URL, client=None, prefix=REDIS_KEY_PREFIX):
+        super().__init__()
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get(self, namespace, key, default=None):
+        raw = self.client.get(self._key(namespace, key))
+        return decode_value(raw) if raw is not None else default
+
+    def set(self, namespace, key, value, ttl=None):
+        px = int(ttl * 1000) if ttl else None
+        self.client.set(self._key(namespace, key), encode_value(value), px=px)
+
+    def add(self, namespace, key, value, ttl=None):
+        px = int(ttl * 1000) if ttl else None
+        return bool(self.client.set(self._key(namespace, key), encode_value(value), px=px, nx=True))
+
+    def delete(self, namespace, key):
+        return self.client.delete(self._key(namespace, key)) > 0
+
+    def keys(self, namespace):
+        pattern_prefix = self._key(namespace, "")
+        keys = []
+        for raw in self.client.scan_iter(match=f"{pattern_prefix}*", count=500):
+            name = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+            keys.append(name[len(pattern_prefix):])
+        return keys
+
+    def items(self, namespace):
+        keys = self.keys(namespace)
+        if not keys:
+            return []
+        values = self.client.mget([self._key(namespace, key) for key in keys])
+        return [(key, decode_value(raw)) for key, raw in zip(keys, values) if raw is not None]
+
+    def _acquire_lease(self, name, token, deadline):
+        return bool(self.client.set(
+            f"{self.prefix}lock:{name}", token, nx=True, px=int(STATE_LOCK_TIMEOUT * 1000)
+        ))
+
+    def _release_lease(self, name, token):
+        lock_key = f"{self.prefix}lock:{name}"
+        # Compare-and-delete so an expired lease taken over by another worker is left alone
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(lock_key)
+                current = pipe.get(lock_key)
+                if isinstance(current, bytes):
+                    current = current.decode("utf-8")
+                if current != token:
+                    pipe.unwatch()
+                    logger.warning(f"State lock lease for {name} expired before it was released")
+                    return
+                pipe.multi()
+                pipe.delete(lock_key)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Could not release state lock for {name}: {str(e)}")
+
+    def _renew_lease(self, name, token):
+        lock_key = f"{self.prefix}lock:{name}"
+        # Compare-and-extend, same as the release
+        with self.client.pipeline() as pipe:
+            pipe.watch(lock_key)
+            current = pipe.get(lock_key)
+            if isinstance(current, bytes):
+                current = current.decode("utf-8")
+            if current != token:
+                pipe.unwatch()
+                return False
+            pipe.multi()
+            pipe.pexpire(lock_key, int(STATE_LOCK_TIMEOUT * 1000))
+            pipe.execute()
+            return True
+
+
+_MISSING = object()
+_DELETED = object()
+
+
+class StoreMapping(MutableMapping):
+    """
+    Dict-like view of one namespace in a StateStore.
+
+    Outside a transaction every access goes straight to the store. Inside
+    StateStore.transaction(key, ...) the key is served from a per-thread working
+    copy, so code written against a plain dict (including in-place edits of the
+    nested values) keeps working and is persisted once at the end.
+    """
+
+    def __init__(self, store, namespace, ttl=None):
+        self.store = store
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _working(self):
+        working = getattr(self._local, "working", None)
+        if working is None:
+            working = self._local.working = {}
+        return working
+
+    def _begin(self, key):
+        self._working()[key] = _MISSING
+
+    def _commit(self, key):
+        value = self._working().pop(key, _MISSING)
+        if value is _DELETED:
+            self.store.delete(self.namespace, key)
+        elif value is not _MISSING:
+            self.store.set(self.namespace, key, value, ttl=self.ttl)
+
+    def _lookup(self, key):
+        working = self._working()
+        if key in working:
+            value = working[key]
+            if value is _MISSING:
+                # First read in this transaction, pin the loaded copy
+                value = self.store.get(self.namespace, key, _DELETED)
+                working[key] = value
+            return value
+        return self.store.get(self.namespace, key, _DELETED)
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _DELETED
+
+    def __setitem__(self, key, value):
+        working = self._working()
+        if key in working:
+            working[key] = value
+        else:
+            self.store.set(self.namespace, key, value, ttl=self.ttl)
+
+    def __delitem__(self, key):
+        if self._lookup(key) is _DELETED:
+            raise KeyError(key)
+        working = self._working()
+        if key in working:
+            working[key] = _DELETED
+        else:
+            self.store.delete(self.namespace, key)
+
+    def __iter__(self):
+        return iter(self.store.keys(self.namespace))
+
+    def __len__(self):
+        return len(self.store.keys(self.namespace))
+
+    def items(self):
+        return self.store.items(self.namespace)
+
+
+class ExpirySweeper:
+    """
+    Background thread that evicts expired state off the request path.
+
+    Sleeps until the store's next expiry (at most STATE_SWEEP_INTERVAL) and then
+    purges everything due. Redis expires keys natively, so there it just idles.
+    """
+
+    def __init__(self, store, interval=STATE_SWEEP_INTERVAL):
+        self.store = store
+        self.interval = max(1.0, interval)
+        self._start_lock = threading.Lock()
+        self._started_pid = None
+        self.sweeps = 0
+        self.evicted = 0
+        self.last_sweep_ms = 0.0
+
+    def start(self):
+        """Start the sweeper thread (once per process, so it is safe after a fork)"""
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            thread = threading.Thread(target=self._run, name="state-expiry-sweeper", daemon=True)
+            thread.start()
+            self._started_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            started_at = time.monotonic()
+            try:
+                removed = self.store.purge_expired()
+                next_expiry = self.store.next_expiry()
+            except Exception as e:
+                logger.error(f"Error purging expired state: {str(e)}")
+                removed, next_expiry = 0, None
+            self.sweeps += 1
+            self.evicted += removed
+            self.last_sweep_ms = round((time.monotonic() - started_at) * 1000, 2)
+            if removed:
+                logger.info(f"Evicted {removed} expired state entries")
+
+            # Wake for the next expiry, but batch evictions at least a second apart
+            wait = self.interval
+            if next_expiry is not None:
+                wait = min(self.interval, max(1.0, next_expiry - time.time()))
+            time.sleep(wait)
+
+    def stats(self):
+        """Return sweep counters for the health endpoint"""
+        return {
+            "sweeps": self.sweeps,
+            "evicted": self.evicted,
+            "last_sweep_ms": self.last_sweep_ms,
+        }
+
+
+def create_state_store(backend=STATE_STORE_BACKEND):
+    """Build the state store selected by STATE_STORE_BACKEND"""
+    backend = (backend or "memory").lower()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "redis":
+        logger.info(f"Using Redis state store at {REDIS_URL.split('@')[-1]}")
+        return RedisStateStore()
+    if backend != "memory":
+        logger.warning(f"Unknown STATE_STORE_BACKEND '{backend}', falling back to in-memory state")
+    return InMemoryStateStore()
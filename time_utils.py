@@ -162,6 +162,21 @@ def format_time_for_display(time_str):
         logger.warning(f"Failed to format time for display: {time_str}, Error: {str(e)}")
     return time_str
 
+def format_normalized_time(normalized_time):
+    """
+    Convert a normalized "HH:MM" time (from normalize_time_format) to "h:MM AM/PM"
+    
+    Args:
+        normalized_time (str): Time in "HH:MM" format
+        
+    Returns:
+        str: Time formatted as "h:MM AM/PM"
+    """
+    hour, minute = map(int, normalized_time.split(':'))
+    am_pm = 'AM' if hour < 12 else 'PM'
+    hour = hour if 1 <= hour <= 12 else hour - 12 if hour > 12 else 12
+    return f"{hour}:{minute:02d} {am_pm}"
+
 def parse_natural_language_date(date_str):
     """
     Parse natural language date expressions into a datetime.date object.
@@ -228,3 +243,19 @@ def format_date_for_display(date_str):
         return date_obj.strftime("%d/%m/%Y")
     except ValueError:
         return date_str  # Return as-is if parsing fails
+
+def format_wait_time(seconds):
+    """
+    Format a retry-after delay for customer-facing messages
+    
+    Args:
+        seconds (float): Seconds to wait
+        
+    Returns:
+        str: e.g. "5 seconds" or "2 minutes", rounded up
+    """
+    seconds = max(1, int(-(-seconds // 1)))
+    if seconds < 60:
+        return f"{seconds} second{'s' if seconds != 1 else ''}"
+    minutes = -(-seconds // 60)
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
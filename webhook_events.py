@@ -0,0 +1,105 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def iter_webhook_events(data):
+    """
+    Yield every message and status update in a WhatsApp webhook payload.
+
+    Meta may batch several entries, changes and messages into one delivery, so
+    all of them are walked instead of just the first. Each event is a dict:
+      {"type": "message", "from", "id", "timestamp", "text"} for text messages
+      {"type": "status", "id", "status", "recipient_id", "errors"} for delivery statuses
+      {"type": "unsupported", "message_type", "from", "id"} for other message types
+    Malformed parts are logged and skipped without dropping the rest of the payload.
+    """
+    if not isinstance(data, dict) or data.get("object") != "whatsapp_business_account":
+        return
+
+    for entry in data.get("entry") or []:
+        for change in (entry or {}).get("changes") or []:
+            value = (change or {}).get("value")
+            if not isinstance(value, dict):
+                continue
+
+            for message in value.get("messages") or []:
+                customer_number = message.get("from", "")
+                message_id = message.get("id", "")
+                if message.get("type", "text") != "text" or "text" not in message:
+                    yield {
+                        "type": "unsupported",
+                        "message_type": message.get("type"),
+                        "from": customer_number,
+                        "id": message_id
+                    }
+                    continue
+                text = (message.get("text") or {}).get("body", "")
+                if not text or not customer_number:
+                    logger.warning(f"Invalid message data: message={bool(text)}, number={bool(customer_number)}")
+                    continue
+                yield {
+                    "type": "message",
+                    "from": customer_number,
+                    "id": message_id,
+                    "timestamp": message.get("timestamp"),
+                    "text": text
+                }
+
+            for status in value.get("statuses") or []:
+                yield {
+                    "type": "status",
+                    "id": status.get("id", ""),
+                    "status": status.get("status", "unknown"),
+                    "recipient_id": status.get("recipient_id", ""),
+                    "errors": status.get("errors") or []
+                }
+
+
+def group_messages_by_customer(events):
+    """Collect message events into {customer_number: [event, ...]} in arrival order"""
+    grouped = OrderedDict()
+    for event in events:
+        if event["type"] == "message":
+            grouped.setdefault(event["from"], []).append(event)
+    return grouped
+
+
+class WebhookStats:
+    """Counts deliveries, messages and status updates seen by the webhook"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._statuses = Counter()
+
+    def record(self, events):
+        """Count one delivery's events and log failed outbound messages"""
+        with self._lock:
+            self._counts["deliveries"] += 1
+            for event in events:
+                self._counts[event["type"]] += 1
+                if event["type"] == "status":
+                    self._statuses[event["status"]] += 1
+        for event in events:
+            if event["type"] == "status" and event["status"] == "failed":
+                logger.warning(f"WhatsApp reported a failed delivery to {event['recipient_id']}: {event['errors']}")
+            elif event["type"] == "unsupported":
+                logger.info(f"Ignoring unsupported {event['message_type']} message from {event['from']}")
+
+    def stats(self):
+        """Return the counters for the health endpoint"""
+        with self._lock:
+            return {
+                "deliveries": self._counts["deliveries"],
+                "messages": self._counts["message"],
+                "unsupported_messages": self._counts["unsupported"],
+                "statuses": dict(self._statuses),
+            }
@@ -1,10 +1,16 @@
 import os
+import time
+import heapq
+import socket
 import logging
-import json
-import requests
+import threading
 from datetime import datetime, timedelta
 import pytz
 import time_utils
+import http_client
+import database
+import state_store
+from bulk_sender import BulkSender
 from dotenv import load_dotenv
 
 # Configure logging
@@ -23,69 +29,177 @@ WHATSAPP_API_TOKEN = os.getenv("WHATSAPP_API_TOKEN")
 WHATSAPP_API_URL = f"https://graph.facebook.com/v22.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
 CLINIC_TIMEZONE = pytz.timezone("Asia/Singapore")  # Set timezone for the clinic
 
+# A promotion found overdue by more than this (late tick, restart, outage) is skipped
+# until next week instead of being sent at an odd hour
+PROMOTION_MISFIRE_GRACE_SECONDS = int(os.getenv("PROMOTION_MISFIRE_GRACE_SECONDS", "3600"))
+PROMOTION_JOB_BATCH_SIZE = int(os.getenv("PROMOTION_JOB_BATCH_SIZE", "200"))  # recipients sent between cursor checkpoints
+# A running blast whose owner has not checkpointed for this long is resumed by another process
+PROMOTION_JOB_STALE_SECONDS = int(os.getenv("PROMOTION_JOB_STALE_SECONDS", "300"))
+# With STATE_STORE_BACKEND=redis each occurrence is also claimed in Redis, so hosts with
+# separate databases send it once; claims outlive the misfire grace window by far
+PROMOTION_CLAIM_NAMESPACE = "promotion_claims"
+PROMOTION_CLAIM_TTL = int(os.getenv("PROMOTION_CLAIM_TTL", str(7 * 24 * 3600)))  # seconds
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _clinic_time(value):
+    """datetime, ISO string or epoch seconds -> aware datetime in clinic time"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, CLINIC_TIMEZONE)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return CLINIC_TIMEZONE.localize(value)
+    return value.astimezone(CLINIC_TIMEZONE)
+
+
+def next_fire_time(promotion, after):
+    """First time strictly after `after` that the weekly promotion is scheduled for"""
+    after = _clinic_time(after)
+    hour, minute = (int(part) for part in promotion["time"].split(":"))
+    days_ahead = (promotion["day_of_week"] - after.weekday()) % 7
+    fire_date = after.date() + timedelta(days=days_ahead)
+    fire_time = CLINIC_TIMEZONE.localize(datetime(fire_date.year, fire_date.month, fire_date.day, hour, minute))
+    if fire_time <= after:
+        fire_date += timedelta(days=7)
+        fire_time = CLINIC_TIMEZONE.localize(datetime(fire_date.year, fire_date.month, fire_date.day, hour, minute))
+    return fire_time
+
+
+def latest_fire_time(promotion, at):
+    """Most recent scheduled time at or before `at`"""
+    return next_fire_time(promotion, _clinic_time(at) - timedelta(days=7))
+
+
+def _job_owner():
+    """Identifies the process running a blast, for takeover after a crash"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _shared_claim_store():
+    """The state store every instance shares for occurrence claims, or None if claims are per host"""
+    if (state_store.STATE_STORE_BACKEND or "").lower() == "redis":
+        return state_store.create_state_store("redis")
+    logger.warning(
+        "Promotion firings are claimed in the local database only, so hosts with separate disks "
+        "would each send them; run the scheduler on one host or set STATE_STORE_BACKEND=redis"
+    )
+    return None
+
+
 class WeeklyPromotionScheduler:
-    def __init__(self):
-        self.recipients_file = "promotion_recipients.json"
-        self.schedule_file = "promotion_schedule.json"
-        self.sent_log_file = "sent_promotions.json"
-        
-        # Load recipient list, schedule, and sent log
-        self.recipients = self._load_json(self.recipients_file, {"recipients": []})
-        self.schedule = self._load_json(self.schedule_file, {"weekly_promotions": []})
-        self.sent_log = self._load_json(self.sent_log_file, {"sent_promotions": []})
+    """
+    Weekly promotion schedule and recipient list, held in memory for the life of the process.
 
-    def _load_json(self, filename, default_data):
-        """Load data from JSON file, creating it if it doesn't exist"""
-        try:
-            if os.path.exists(filename):
-                with open(filename, 'r') as file:
-                    return json.load(file)
-            else:
-                with open(filename, 'w') as file:
-                    json.dump(default_data, file, indent=4)
-                return default_data
-        except Exception as e:
-            logger.error(f"Error loading {filename}: {str(e)}")
-            return default_data
+    Recipients are indexed by phone number and active promotions sit in a min-heap
+    keyed by their next fire time, so a tick only looks at the heap top. Each
+    promotion's next fire time follows its persisted last_fired_at watermark, which
+    lets a late tick catch up (within PROMOTION_MISFIRE_GRACE_SECONDS) and lets
+    exactly one process per database claim each occurrence; a shared claim_store
+    (Redis) extends that to instances with separate databases. The database stays the
+    source of truth: every write bumps a "promotions" version counter, and the
+    in-memory copy reloads only when that counter moved (for example after another
+    worker added a recipient). One RLock is shared by the admin endpoints and the
+    scheduler job.
+    """
 
-    def _save_json(self, filename, data):
-        """Save data to JSON file"""
-        try:
-            with open(filename, 'w') as file:
-                json.dump(data, file, indent=4)
-            return True
-        except Exception as e:
-            logger.error(f"Error saving to {filename}: {str(e)}")
-            return False
+    def __init__(self, claim_store=None):
+        self._lock = threading.RLock()
+        self.claim_store = claim_store
+        self.version = None
+        self.recipients_by_phone = {}  # Structure: { phone_number: recipient }
+        self.promotions_by_id = {}  # Structure: { promotion_id: promotion }
+        self._heap = []  # (next fire epoch, promotion_id)
+        self._next_fire = {}  # Structure: { promotion_id: next fire epoch }, heap entries that disagree are stale
+        self.reloads = 0
+
+        # Metrics
+        self.fired = 0
+        self.misfires = 0
+        self.claimed_elsewhere = 0
+        self.resumed = 0
+
+    def _refresh(self):
+        """Reload from the database if anything changed since the last load"""
+        with self._lock:
+            version = database.get_version("promotions")
+            if version == self.version:
+                return
+            recipients = database.all_recipients()
+            promotions = database.active_promotions()
+            self.recipients_by_phone = {recipient["phone_number"]: recipient for recipient in recipients}
+            self.promotions_by_id = {}
+            self._heap = []
+            self._next_fire = {}
+            for promotion in promotions:
+                self._index_promotion(promotion)
+            self.version = version
+            self.reloads += 1
+            logger.debug(f"Loaded {len(recipients)} recipients and {len(promotions)} promotions (version {version})")
+
+    def _index_promotion(self, promotion):
+        self.promotions_by_id[promotion["id"]] = promotion
+        # The first occurrence after the last one fired, or after creation for a new promotion
+        if promotion.get("last_fired_at"):
+            self._push(promotion, next_fire_time(promotion, promotion["last_fired_at"]))
+        else:
+            self._push(promotion, next_fire_time(promotion, promotion["created_at"]))
+
+    def _push(self, promotion, fire_time):
+        fire_at = fire_time.timestamp()
+        self._next_fire[promotion["id"]] = fire_at
+        heapq.heappush(self._heap, (fire_at, promotion["id"]))
+
+    def _applied(self, new_version):
+        """
+        Record a write made by this instance.
+
+        If nobody else wrote in between, the in-memory change already matches the
+        database and the reload is skipped; otherwise the next access reloads.
+        """
+        if self.version is not None and new_version == self.version + 1:
+            self.version = new_version
+        else:
+            self.version = None
 
     def add_recipient(self, phone_number, name, preferences=None):
         """Add a new recipient to the promotion list"""
         if not preferences:
             preferences = {"opt_in": True, "categories": ["all"]}
         
-        # Check if recipient already exists
-        for recipient in self.recipients["recipients"]:
-            if recipient["phone_number"] == phone_number:
-                logger.info(f"Recipient {phone_number} already exists, updating information")
-                recipient["name"] = name
-                recipient["preferences"] = preferences
-                recipient["updated_at"] = datetime.now(CLINIC_TIMEZONE).isoformat()
-                self._save_json(self.recipients_file, self.recipients)
-                return True
+        with self._lock:
+            self._refresh()
+            existing = self.recipients_by_phone.get(phone_number)
+            now = datetime.now(CLINIC_TIMEZONE).isoformat()
+            recipient = {
+                "phone_number": phone_number,
+                "name": name,
+                "preferences": preferences,
+                "created_at": existing["created_at"] if existing else now,
+                "updated_at": now
+            }
+            # Insert, or update the existing row for this phone number
+            with database.transaction() as conn:
+                database.upsert_recipient(recipient, conn)
+                new_version = database.bump_version("promotions", conn)
+            self.recipients_by_phone[phone_number] = recipient
+            self._applied(new_version)
         
-        # Add new recipient
-        new_recipient = {
-            "phone_number": phone_number,
-            "name": name,
-            "preferences": preferences,
-            "created_at": datetime.now(CLINIC_TIMEZONE).isoformat(),
-            "updated_at": datetime.now(CLINIC_TIMEZONE).isoformat()
-        }
-        self.recipients["recipients"].append(new_recipient)
-        self._save_json(self.recipients_file, self.recipients)
-        logger.info(f"Added new recipient: {phone_number} - {name}")
+        if existing:
+            logger.info(f"Recipient {phone_number} already exists, updated information")
+        else:
+            logger.info(f"Added new recipient: {phone_number} - {name}")
         return True
 
+    def opted_in_recipients(self):
+        with self._lock:
+            self._refresh()
+            return [
+                recipient for recipient in self.recipients_by_phone.values()
+                if recipient.get("preferences", {}).get("opt_in", True)
+            ]
+
     def schedule_weekly_promotion(self, day_of_week, time, template_name, template_parameters):
         """
         Schedule a weekly promotion
@@ -120,48 +234,200 @@ class WeeklyPromotionScheduler:
             "created_at": datetime.now(CLINIC_TIMEZONE).isoformat()
         }
         
-        self.schedule["weekly_promotions"].append(new_promotion)
-        self._save_json(self.schedule_file, self.schedule)
+        with self._lock:
+            self._refresh()
+            with database.transaction() as conn:
+                database.insert_promotion(new_promotion, conn)
+                new_version = database.bump_version("promotions", conn)
+            self._index_promotion(new_promotion)
+            self._applied(new_version)
         
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        logger.info(f"Scheduled weekly promotion for {day_names[day_of_week]} at {normalized_time} using template '{template_name}'")
+        logger.info(f"Scheduled weekly promotion for {DAY_NAMES[day_of_week]} at {normalized_time} using template '{template_name}'")
         return True
     
+    def due_promotions(self, current_time):
+        """
+        Pop the promotions whose next fire time has passed.
+
+        Returns:
+            list: (promotion, fire_time) pairs, fire_time being the most recent
+                  occurrence, so a promotion missed for several weeks is due once
+        """
+        with self._lock:
+            self._refresh()
+            now = current_time.timestamp()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, promotion_id = heapq.heappop(self._heap)
+                if self._next_fire.get(promotion_id) != fire_at:
+                    continue
+                promotion = self.promotions_by_id[promotion_id]
+                fire_time = latest_fire_time(promotion, current_time)
+                self._push(promotion, next_fire_time(promotion, fire_time))
+                due.append((promotion, fire_time))
+            return due
+
+    def next_fire_at(self):
+        """Epoch seconds of the earliest upcoming promotion, or None"""
+        with self._lock:
+            self._refresh()
+            return min(self._next_fire.values(), default=None)
+
+    def _claim(self, promotion, fire_time, current_time):
+        """
+        Move the promotion's watermark to fire_time and, if it is not too late,
+        create the blast job in the same transaction.
+
+        Returns:
+            str: the job id if this process should send the promotion, else None
+        """
+        fire_at = fire_time.timestamp()
+        lateness = (current_time - fire_time).total_seconds()
+        if lateness > PROMOTION_MISFIRE_GRACE_SECONDS:
+            # Still claimed, so other instances skip this occurrence too
+            if database.claim_promotion_firing(promotion["id"], fire_at):
+                promotion["last_fired_at"] = fire_at
+                self.misfires += 1
+                logger.warning(
+                    f"Skipping promotion {promotion['id']} due at {fire_time.strftime('%A %H:%M')}: "
+                    f"{lateness:.0f}s late is past the {PROMOTION_MISFIRE_GRACE_SECONDS}s grace window"
+                )
+            return None
+
+        # Recipients are snapshotted into the job, later sign-ups wait for next week
+        recipients = self.opted_in_recipients()
+        job = {
+            "id": f"{promotion['id']}-{fire_time.strftime('%Y%m%dT%H%M')}",
+            "promotion_id": promotion["id"],
+            "template_name": promotion["template_name"],
+            "fire_at": fire_at,
+            "owner": _job_owner(),
+            "heartbeat_at": time.time()
+        }
+        claim_key = f"{promotion['id']}:{int(fire_at)}"
+        if self.claim_store is not None and not self.claim_store.add(
+                PROMOTION_CLAIM_NAMESPACE, claim_key, job["owner"], ttl=PROMOTION_CLAIM_TTL):
+            # Sent by another instance; move the local watermark so this one moves on
+            database.claim_promotion_firing(promotion["id"], fire_at)
+            promotion["last_fired_at"] = fire_at
+            self.claimed_elsewhere += 1
+            logger.info(f"Promotion {promotion['id']} due at {fire_time.strftime('%A %H:%M')} was claimed by another instance")
+            return None
+        try:
+            with database.transaction() as conn:
+                claimed = database.claim_promotion_firing(promotion["id"], fire_at, conn)
+                if claimed:
+                    database.insert_promotion_job(job, recipients, conn)
+        except Exception:
+            # Give the occurrence back so a retry (here or elsewhere) can still send it
+            if self.claim_store is not None:
+                self.claim_store.delete(PROMOTION_CLAIM_NAMESPACE, claim_key)
+            raise
+        if not claimed:
+            self.claimed_elsewhere += 1
+            logger.info(f"Promotion {promotion['id']} due at {fire_time.strftime('%A %H:%M')} was already fired")
+            return None
+        promotion["last_fired_at"] = fire_at
+        self.fired += 1
+        logger.info(f"Created promotion job {job['id']} for {len(recipients)} recipients")
+        return job["id"]
+    
     def check_and_send_promotions(self):
-        """Check scheduled promotions and send if it's time"""
+        """Send the promotions that are due, then resume blasts abandoned by a dead process"""
         current_time = datetime.now(CLINIC_TIMEZONE)
-        current_day_of_week = current_time.weekday()  # 0-6 (Monday-Sunday)
-        current_hour = current_time.hour
-        current_minute = current_time.minute
-        
         logger.info(f"Checking promotions for {current_time.strftime('%A %H:%M')}")
         
-        for promo in self.schedule["weekly_promotions"]:
-            if not promo.get("active", True):
+        # The lock is only held for the lookups, so admin calls are not blocked by a blast
+        for promo, fire_time in self.due_promotions(current_time):
+            try:
+                job_id = self._claim(promo, fire_time, current_time)
+            except Exception as e:
+                # due_promotions already moved past this occurrence; reloading puts it back
+                # from the unchanged watermark so the next tick tries again
+                logger.error(f"Could not claim promotion {promo['id']} due at {fire_time.strftime('%A %H:%M')}: {str(e)}")
+                with self._lock:
+                    self.version = None
                 continue
-                
-            promo_day = promo["day_of_week"]
-            promo_time_parts = promo["time"].split(":")
-            promo_hour = int(promo_time_parts[0])
-            promo_minute = int(promo_time_parts[1])
-            
-            # Check if it's time to send this promotion
-            if (promo_day == current_day_of_week and 
-                promo_hour == current_hour and 
-                promo_minute == current_minute):
-                
+            if job_id:
                 logger.info(f"It's time to send promotion: {promo['id']}")
-                
-                # Send promotion to all eligible recipients
-                for recipient in self.recipients["recipients"]:
-                    if recipient.get("preferences", {}).get("opt_in", True):
-                        self._send_promotion_to_recipient(promo, recipient)
-                    
-                # Log that we sent this promotion
-                self._log_sent_promotion(promo, len(self.recipients["recipients"]))
+                self.run_job(job_id)
+        
+        self.resume_stale_jobs()
+
+    def resume_stale_jobs(self):
+        """Take over running jobs whose owner stopped checkpointing (crash, deploy) and finish them"""
+        stale_before = time.time() - PROMOTION_JOB_STALE_SECONDS
+        for job_id in database.stale_promotion_jobs(stale_before):
+            if database.claim_promotion_job(job_id, _job_owner(), stale_before):
+                self.resumed += 1
+                logger.info(f"Resuming promotion job {job_id}")
+                self.run_job(job_id)
+
+    def run_job(self, job_id):
+        """
+        Send a job's pending recipients in batches from its cursor.
+
+        Each recipient is flagged as sending right before its WhatsApp call and
+        checkpointed with its outcome right after, and the cursor advances after
+        every batch, so a restarted job neither skips nor repeats finished sends.
+
+        Returns:
+            bool: True if the job was completed by this process
+        """
+        owner = _job_owner()
+        job = database.get_promotion_job(job_id)
+        if not job or job["status"] != "running" or job["owner"] != owner:
+            return False
+        with self._lock:
+            self._refresh()
+            promotion = self.promotions_by_id.get(job["promotion_id"])
+        promotion = promotion or database.get_promotion(job["promotion_id"])
+        if promotion is None:
+            logger.error(f"Promotion {job['promotion_id']} for job {job_id} no longer exists")
+            database.finish_promotion_job(job_id, owner)
+            return False
+
+        def send(recipient):
+            database.mark_job_recipient_sending(job_id, recipient["position"])
+            return self._send_promotion_to_recipient(promotion, recipient)
+
+        sender = BulkSender(
+            send, on_outcome=lambda recipient, outcome: database.record_job_recipient(job_id, recipient["position"], outcome)
+        )
+        cursor = job["cursor"]
+        while True:
+            batch = database.pending_job_recipients(job_id, cursor, PROMOTION_JOB_BATCH_SIZE)
+            if not batch:
+                break
+            if not database.touch_promotion_job(job_id, owner):
+                logger.warning(f"Promotion job {job_id} was taken over by another process, stopping")
+                return False
+            sender.send_all(batch)
+            cursor = batch[-1]["position"] + 1
+            database.advance_job_cursor(job_id, cursor)
+
+        if not database.finish_promotion_job(job_id, owner):
+            return False
+        # Log that we sent this promotion
+        self._log_sent_promotion(promotion, [
+            {
+                "phone_number": row["phone_number"],
+                "success": row["status"] == "sent",
+                "status_code": row["status_code"],
+                "attempts": row["attempts"],
+                "error": row["error"] if row["status"] != "unknown" else "Interrupted mid-send, delivery unknown"
+            }
+            for row in database.job_recipients(job_id)
+        ])
+        return True
     
     def _send_promotion_to_recipient(self, promotion, recipient):
-        """Send a promotion to a specific recipient"""
+        """
+        Send a promotion to a specific recipient
+
+        Returns:
+            dict: {"success", "status_code", "error", "retry_after", "retryable"}
+        """
         try:
             template_name = promotion["template_name"]
             template_parameters = promotion.get("template_parameters", {})
@@ -175,7 +441,7 @@ class WeeklyPromotionScheduler:
                 for param in template_parameters["body_parameters"]:
                     # Replace {{name}} with actual recipient name
                     if param == "{{name}}":
-                        param = recipient.get("name", "Valued Customer")
+                        param = recipient.get("name") or "Valued Customer"
                     
                     body_params.append({
                         "type": "text",
@@ -230,44 +496,92 @@ class WeeklyPromotionScheduler:
             if components:
                 message_data["template"]["components"] = components
             
+        except Exception as e:
+            # A malformed promotion or recipient will fail the same way every time
+            logger.error(f"Error building promotion message: {str(e)}")
+            return {"success": False, "status_code": None, "error": str(e), "retryable": False}
+
+        try:
             # Send the request
-            response = requests.post(
-                WHATSAPP_API_URL, 
-                headers=headers, 
-                json=message_data,
-                timeout=30
+            response = http_client.post(
+                WHATSAPP_API_URL,
+                headers=headers,
+                json=message_data
             )
-            
-            if response.status_code != 200:
-                logger.error(f"WhatsApp API error: Status {response.status_code}, Response: {response.text}")
-                return False
-            
-            logger.info(f"Successfully sent promotion to {recipient['phone_number']}")
-            return True
-            
         except Exception as e:
             logger.error(f"Error sending promotion: {str(e)}")
-            return False
+            return {"success": False, "status_code": None, "error": str(e)}
+
+        if response.status_code != 200:
+            logger.error(f"WhatsApp API error: Status {response.status_code}, Response: {response.text}")
+            retry_after = response.headers.get("Retry-After")
+            return {
+                "success": False,
+                "status_code": response.status_code,
+                "error": response.text[:500],
+                "retry_after": float(retry_after) if retry_after and retry_after.isdigit() else None
+            }
+
+        logger.info(f"Successfully sent promotion to {recipient['phone_number']}")
+        return {"success": True, "status_code": response.status_code, "error": None}
     
-    def _log_sent_promotion(self, promotion, recipient_count):
-        """Log a sent promotion"""
+    def _log_sent_promotion(self, promotion, outcomes):
+        """Log a sent promotion with per-recipient delivery results"""
+        failures = [
+            {
+                "phone_number": outcome["phone_number"],
+                "status_code": outcome["status_code"],
+                "attempts": outcome["attempts"],
+                "error": outcome["error"]
+            }
+            for outcome in outcomes if not outcome["success"]
+        ]
         sent_log_entry = {
             "promotion_id": promotion["id"],
             "template_name": promotion["template_name"],
             "sent_at": datetime.now(CLINIC_TIMEZONE).isoformat(),
-            "recipient_count": recipient_count
+            "recipient_count": len(outcomes),
+            "success_count": len(outcomes) - len(failures),
+            "failure_count": len(failures),
+            "failures": failures
         }
         
-        self.sent_log["sent_promotions"].append(sent_log_entry)
-        self._save_json(self.sent_log_file, self.sent_log)
+        database.insert_sent_promotion(sent_log_entry)
+
+    def stats(self):
+        """Return schedule size and firing counters for the health endpoint"""
+        next_fire = self.next_fire_at()
+        with self._lock:
+            return {
+                "promotions": len(self.promotions_by_id),
+                "recipients": len(self.recipients_by_phone),
+                "next_fire": datetime.fromtimestamp(next_fire, CLINIC_TIMEZONE).isoformat() if next_fire else None,
+                "fired": self.fired,
+                "misfires": self.misfires,
+                "claimed_elsewhere": self.claimed_elsewhere,
+                "shared_claims": self.claim_store is not None,
+                "jobs_resumed": self.resumed,
+                "reloads": self.reloads,
+            }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The process-wide WeeklyPromotionScheduler, shared by the scheduler job and admin endpoints"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = WeeklyPromotionScheduler(claim_store=_shared_claim_store())
+        return _scheduler
 
 def run_promotion_scheduler():
     """
     Run the promotion scheduler to check and send promotions.
     This function should be scheduled to run every minute.
     """
-    scheduler = WeeklyPromotionScheduler()
-    scheduler.check_and_send_promotions()
+    get_scheduler().check_and_send_promotions()
 
 def create_weekly_promotion(day_of_week, time, template_name, template_parameters):
     """
@@ -282,8 +596,7 @@ def create_weekly_promotion(day_of_week, time, template_name, template_parameter
     Returns:
         bool: Success or failure
     """
-    scheduler = WeeklyPromotionScheduler()
-    return scheduler.schedule_weekly_promotion(
+    return get_scheduler().schedule_weekly_promotion(
         day_of_week, time, template_name, template_parameters
     )
 
@@ -299,8 +612,47 @@ def add_promotion_recipient(phone_number, name, preferences=None):
     Returns:
         bool: Success or failure
     """
-    scheduler = WeeklyPromotionScheduler()
-    return scheduler.add_recipient(phone_number, name, preferences)
+    return get_scheduler().add_recipient(phone_number, name, preferences)
+
+def _job_summary(job):
+    """A promotion_jobs row with readable times and overall progress"""
+    summary = dict(job)
+    summary["fire_time"] = datetime.fromtimestamp(job["fire_at"], CLINIC_TIMEZONE).isoformat()
+    summary["heartbeat"] = (
+        datetime.fromtimestamp(job["heartbeat_at"], CLINIC_TIMEZONE).isoformat() if job["heartbeat_at"] else None
+    )
+    del summary["fire_at"]
+    del summary["heartbeat_at"]
+    done = job["success_count"] + job["failure_count"] + job["unknown_count"]
+    summary["progress"] = round(100.0 * done / job["recipient_count"], 1) if job["recipient_count"] else 100.0
+    return summary
+
+def list_promotion_jobs(status=None, limit=50):
+    """Most recent promotion blasts with their progress"""
+    return [_job_summary(job) for job in database.promotion_jobs(status, limit)]
+
+def get_promotion_job(job_id, failures_limit=100):
+    """
+    Progress of one promotion blast
+    
+    Returns:
+        dict: the job with per-status recipient counts and its first failures, or None
+    """
+    job = database.get_promotion_job(job_id)
+    if job is None:
+        return None
+    summary = _job_summary(job)
+    summary["recipients"] = database.job_recipient_counts(job_id)
+    summary["failures"] = [
+        {
+            "phone_number": row["phone_number"],
+            "status_code": row["status_code"],
+            "attempts": row["attempts"],
+            "error": row["error"]
+        }
+        for row in database.job_recipients(job_id, status="failed", limit=failures_limit)
+    ]
+    return summary
 
 # Example of how to use this module
 if __name__ == "__main__":